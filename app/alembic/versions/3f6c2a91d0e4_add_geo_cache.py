@@ -0,0 +1,36 @@
+"""Add geo_cache
+
+Revision ID: 3f6c2a91d0e4
+Revises: b1aebd4d59a9
+Create Date: 2026-10-19 10:12:41.503117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f6c2a91d0e4"
+down_revision: Union[str, None] = "b1aebd4d59a9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "geo_cache",
+        sa.Column("cell_key", sa.String(length=32), nullable=False),
+        sa.Column("location_name", sa.String(length=255), nullable=True),
+        sa.Column("backend", sa.String(length=30), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("cell_key"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("geo_cache")
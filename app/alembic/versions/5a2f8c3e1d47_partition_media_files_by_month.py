@@ -0,0 +1,159 @@
+"""Partition media_files by created_at month, add posted_assets
+
+Revision ID: 5a2f8c3e1d47
+Revises: e7b3d5a0c918
+Create Date: 2026-10-19 17:21:09.338512
+
+Downtime: media_files is renamed and copied into the new partitioned table with one INSERT ... SELECT in the
+migration transaction. The old table stays under ACCESS EXCLUSIVE lock until commit, so every query on media_files
+waits for the whole copy (about a minute per few million rows, plus index builds). Stop the bot before
+`alembic upgrade head` and start it after the migration finishes.
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5a2f8c3e1d47"
+down_revision: Union[str, None] = "e7b3d5a0c918"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    "media_id, media_uuid, user_id, album_id, media_url, media_type, processed, error, "
+    "created_at, deleted_at, file_size, file_format, info"
+)
+
+# name, columns, partial index condition, extra kwargs
+INDEXES = [
+    ("ix_media_files_media_id", ["media_id"], None, {}),
+    ("ix_media_files_media_url_active", ["media_url"], sa.text("deleted_at IS NULL"), {}),
+    (
+        "ix_media_files_unprocessed_by_date",
+        ["user_id", sa.text("(info ->> 'date')"), "media_id"],
+        sa.text("processed IS false AND deleted_at IS NULL"),
+        {},
+    ),
+    (
+        "ix_media_files_info_gin",
+        ["info"],
+        None,
+        {"postgresql_using": "gin", "postgresql_ops": {"info": "jsonb_path_ops"}},
+    ),
+    ("ix_media_files_info_camera", [sa.text("(info ->> 'camera')")], None, {}),
+    (
+        "ix_media_files_user_id_with_location",
+        ["user_id"],
+        sa.text("(info -> 'location' ->> 'latitude') IS NOT NULL AND deleted_at IS NULL"),
+        {},
+    ),
+    ("ix_media_files_user_id", ["user_id"], None, {}),
+    ("ix_media_files_album_id", ["album_id"], None, {}),
+]
+
+
+def _media_files_columns(created_at_nullable: bool) -> list:
+    return [
+        sa.Column(
+            "media_id",
+            sa.Integer(),
+            server_default=sa.text("nextval('media_files_media_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("media_uuid", sa.String(length=36), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("album_id", sa.Integer(), nullable=False),
+        sa.Column("media_url", sa.String(length=255), nullable=False),
+        sa.Column("media_type", sa.String(length=50), nullable=False),
+        sa.Column("processed", sa.Boolean(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=created_at_nullable),
+        sa.Column("deleted_at", sa.TIMESTAMP(), nullable=True),
+        sa.Column("file_size", sa.Integer(), nullable=True),
+        sa.Column("file_format", sa.String(length=30), nullable=True),
+        sa.Column("info", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.ForeignKeyConstraint(["album_id"], ["albums.album_id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.user_id"], ondelete="CASCADE"),
+    ]
+
+
+def _replace_media_files(new_columns: list, partition_by: Union[str, None], pk: list) -> None:
+    """Build new media_files next to the old one, copy rows and drop the old table (indexes are recreated)"""
+    for name, *_ in INDEXES:
+        op.drop_index(name, table_name="media_files", if_exists=True)
+    op.rename_table("media_files", "media_files_old")
+    op.execute("ALTER TABLE media_files_old RENAME CONSTRAINT media_files_pkey TO media_files_old_pkey")
+
+    kwargs = {"postgresql_partition_by": partition_by} if partition_by else {}
+    op.create_table("media_files", *new_columns, sa.PrimaryKeyConstraint(*pk), **kwargs)
+    # Последовательность остается прежней, но теперь принадлежит новой таблице
+    op.execute("ALTER SEQUENCE media_files_media_id_seq OWNED BY media_files.media_id")
+
+    if partition_by:
+        op.execute("CREATE TABLE media_files_default PARTITION OF media_files DEFAULT")
+        # Партиции с месяца самой старой записи и на два месяца вперед (дальше создает MediaPartitionMaintenance)
+        op.execute(
+            """
+            DO $$
+            DECLARE m date;
+            BEGIN
+                FOR m IN
+                    SELECT generate_series(
+                        date_trunc('month', COALESCE((SELECT min(created_at) FROM media_files_old), now())),
+                        date_trunc('month', now()) + interval '2 months',
+                        interval '1 month'
+                    )::date
+                LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF media_files FOR VALUES FROM (%L) TO (%L)',
+                        'media_files_p' || to_char(m, 'YYYYMM'), m, m + interval '1 month'
+                    );
+                END LOOP;
+            END $$
+            """
+        )
+
+    # Одна копия в транзакции миграции: media_files заблокирована до коммита — бот должен быть остановлен
+    op.execute(
+        f"INSERT INTO media_files ({COLUMNS}) "
+        f"SELECT {COLUMNS.replace('created_at', 'COALESCE(created_at, now())')} FROM media_files_old"
+    )
+    op.drop_table("media_files_old")
+
+    for name, columns, where, kwargs in INDEXES:
+        op.create_index(name, "media_files", columns, unique=False, postgresql_where=where, **kwargs)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # На партиционированной таблице индексы строятся без CONCURRENTLY — таблица все равно новая
+    _replace_media_files(
+        _media_files_columns(created_at_nullable=False),
+        partition_by="RANGE (created_at)",
+        pk=["media_id", "created_at"],
+    )
+
+    op.create_table(
+        "posted_assets",
+        sa.Column("media_url", sa.String(length=255), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("media_uuid", sa.String(length=36), nullable=False),
+        sa.Column("archived_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.user_id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("media_url"),
+    )
+    op.create_index(op.f("ix_posted_assets_user_id"), "posted_assets", ["user_id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Записи, уже сжатые в posted_assets, в media_files не возвращаются
+    op.drop_index(op.f("ix_posted_assets_user_id"), table_name="posted_assets")
+    op.drop_table("posted_assets")
+
+    _replace_media_files(_media_files_columns(created_at_nullable=True), partition_by=None, pk=["media_id"])
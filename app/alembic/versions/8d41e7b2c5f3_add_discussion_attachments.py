@@ -0,0 +1,50 @@
+"""Add discussion_attachments
+
+Revision ID: 8d41e7b2c5f3
+Revises: 3f6c2a91d0e4
+Create Date: 2026-10-19 12:40:07.218834
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d41e7b2c5f3"
+down_revision: Union[str, None] = "3f6c2a91d0e4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "discussion_attachments",
+        sa.Column("attachment_id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("telegram_id", sa.BigInteger(), nullable=False),
+        sa.Column("media_uuid", sa.String(length=36), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=False),
+        sa.Column("channel_id", sa.BigInteger(), nullable=False),
+        sa.Column("channel_msg_id", sa.BigInteger(), nullable=False),
+        sa.Column("discussion_chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("discussion_msg_id", sa.BigInteger(), nullable=True),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.Column("updated_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("attachment_id"),
+        sa.UniqueConstraint("channel_id", "channel_msg_id", name="uq_discussion_attachments_channel_msg"),
+    )
+    op.create_index(
+        op.f("ix_discussion_attachments_attachment_id"), "discussion_attachments", ["attachment_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_discussion_attachments_attachment_id"), table_name="discussion_attachments")
+    op.drop_table("discussion_attachments")
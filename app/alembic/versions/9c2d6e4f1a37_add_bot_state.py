@@ -0,0 +1,36 @@
+"""Add bot_state
+
+Revision ID: 9c2d6e4f1a37
+Revises: 5a2f8c3e1d47
+Create Date: 2026-10-19 16:05:12.284519
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c2d6e4f1a37"
+down_revision: Union[str, None] = "5a2f8c3e1d47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "bot_state",
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("value", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("updated_at", sa.TIMESTAMP(), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("key"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("bot_state")
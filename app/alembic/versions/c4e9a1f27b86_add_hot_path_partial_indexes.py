@@ -0,0 +1,68 @@
+"""Add hot path partial indexes
+
+Revision ID: c4e9a1f27b86
+Revises: 8d41e7b2c5f3
+Create Date: 2026-10-19 15:12:44.603127
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e9a1f27b86"
+down_revision: Union[str, None] = "8d41e7b2c5f3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = sa.text("deleted_at IS NULL")
+
+# name, table, columns, partial index condition
+INDEXES = [
+    ("ix_users_telegram_id_active", "users", ["telegram_id"], ACTIVE),
+    ("ix_channels_user_id_active", "channels", ["user_id", "telegram_channel_id"], ACTIVE),
+    ("ix_api_keys_user_id_active", "api_keys", ["user_id", sa.text("created_at DESC")], ACTIVE),
+    ("ix_immich_hosts_user_id_active", "immich_hosts", ["user_id"], ACTIVE),
+    ("ix_albums_user_id_active", "albums", ["user_id"], ACTIVE),
+    ("ix_media_files_media_url_active", "media_files", ["media_url"], ACTIVE),
+    (
+        "ix_media_files_user_id_unprocessed",
+        "media_files",
+        ["user_id"],
+        sa.text("processed IS false AND deleted_at IS NULL"),
+    ),
+    ("ix_media_files_user_id", "media_files", ["user_id"], None),
+    ("ix_media_files_album_id", "media_files", ["album_id"], None),
+    (
+        "ix_discussion_attachments_status_open",
+        "discussion_attachments",
+        ["status"],
+        sa.text("status IN ('pending', 'sending')"),
+    ),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не работает внутри транзакции, зато не блокирует запись в таблицы на время построения
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_where=where,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
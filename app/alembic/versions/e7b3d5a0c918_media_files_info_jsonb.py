@@ -0,0 +1,114 @@
+"""media_files.info to JSONB with EXIF indexes
+
+Revision ID: e7b3d5a0c918
+Revises: c4e9a1f27b86
+Create Date: 2026-10-19 16:03:21.775410
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b3d5a0c918"
+down_revision: Union[str, None] = "c4e9a1f27b86"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNPROCESSED = sa.text("processed IS false AND deleted_at IS NULL")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column(
+        "media_files",
+        "info",
+        existing_type=sa.JSON(),
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        existing_nullable=True,
+        postgresql_using="info::jsonb",
+    )
+
+    with op.get_context().autocommit_block():
+        # Заменяет ix_media_files_user_id_unprocessed: тот же фильтр + порядок по дате съемки
+        op.create_index(
+            "ix_media_files_unprocessed_by_date",
+            "media_files",
+            ["user_id", sa.text("(info ->> 'date')"), "media_id"],
+            unique=False,
+            postgresql_where=UNPROCESSED,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_media_files_user_id_unprocessed",
+            table_name="media_files",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            "ix_media_files_info_gin",
+            "media_files",
+            ["info"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={"info": "jsonb_path_ops"},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_media_files_info_camera",
+            "media_files",
+            [sa.text("(info ->> 'camera')")],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_media_files_user_id_with_location",
+            "media_files",
+            ["user_id"],
+            unique=False,
+            postgresql_where=sa.text("(info -> 'location' ->> 'latitude') IS NOT NULL AND deleted_at IS NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in (
+            "ix_media_files_user_id_with_location",
+            "ix_media_files_info_camera",
+            "ix_media_files_info_gin",
+        ):
+            op.drop_index(name, table_name="media_files", postgresql_concurrently=True, if_exists=True)
+        op.create_index(
+            "ix_media_files_user_id_unprocessed",
+            "media_files",
+            ["user_id"],
+            unique=False,
+            postgresql_where=UNPROCESSED,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_media_files_unprocessed_by_date",
+            table_name="media_files",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+    op.alter_column(
+        "media_files",
+        "info",
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        type_=sa.JSON(),
+        existing_nullable=True,
+        postgresql_using="info::json",
+    )
@@ -0,0 +1,15 @@
+import asyncio
+import os
+
+import pytest
+
+# Бенчмарки не пишут трассы в data/traces.jsonl
+os.environ.setdefault("TRACING_EXPORTER", "none")
+
+
+@pytest.fixture
+def run():
+    """Runs a coroutine to completion on a private loop (pytest-benchmark measures sync callables)"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
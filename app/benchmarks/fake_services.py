@@ -0,0 +1,351 @@
+"""
+Fake Immich and Bot API servers for load tests
+
+Both are Starlette apps and keep only what the bot reads:
+
+- Immich: `/api/users/me`, `/api/albums/{id}` (assets with EXIF), `/api/assets/{id}/original` (payload of
+  configurable size). Every request waits `latency_ms`, a share of requests fails with 500 (`error_rate`).
+- Bot API: `getMe`, `getChat` (channel with linked discussion group), `getChatMember` (bot is admin), `send*`
+  media methods, `getUpdates` long polling. A share of uploads gets 429 with `retry_after` (`retry_after_rate`).
+  After each channel post the automatic forward to the discussion group is delivered through `getUpdates` after
+  `forward_delay_ms`.
+
+Albums are generated from the album id, so the load test only needs to seed the same ids into Postgres. Run
+standalone from app/ to poke at them by hand:
+
+    python -m benchmarks.fake_services --immich-port 18080 --bot-port 18081
+"""
+
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# Каналы и группы обсуждений нагрузочного теста: канал пользователя i и его группа
+CHANNEL_ID_BASE = -1009000000000
+DISCUSSION_ID_BASE = -1008000000000
+# Обязательные поля ChatMemberAdministrator
+ADMIN_RIGHTS = (
+    "can_be_edited",
+    "is_anonymous",
+    "can_manage_chat",
+    "can_delete_messages",
+    "can_manage_video_chats",
+    "can_restrict_members",
+    "can_promote_members",
+    "can_change_info",
+    "can_invite_users",
+    "can_post_stories",
+    "can_edit_stories",
+    "can_delete_stories",
+)
+
+
+def channel_id(user_index: int) -> int:
+    return CHANNEL_ID_BASE - user_index
+
+
+def discussion_id(channel: int) -> int:
+    return DISCUSSION_ID_BASE - (CHANNEL_ID_BASE - channel)
+
+
+@dataclass
+class FakeSettings:
+    assets_per_album: int = 20
+    asset_bytes: int = 512 * 1024
+    video_ratio: float = 0.1
+    immich_latency_ms: float = 20
+    immich_error_rate: float = 0.0
+    upload_latency_ms: float = 50
+    retry_after_rate: float = 0.0
+    retry_after_seconds: int = 1
+    forward_delay_ms: float = 200
+    seed: int = 50
+
+
+def make_album(album_uuid: str, settings: FakeSettings) -> Dict[str, Any]:
+    """
+    Album payload with deterministic assets (same album id — same assets in every run)
+
+    :param album_uuid: album id
+    :param settings: fake settings
+    :return: Immich album JSON
+    """
+    rng = random.Random(f"{settings.seed}:{album_uuid}")
+    assets = []
+    for i in range(settings.assets_per_album):
+        video = rng.random() < settings.video_ratio
+        extension = "mp4" if video else "jpg"
+        exif = {
+            "make": "SONY",
+            "model": "ILCE-7M4",
+            "lensModel": "FE 24-70mm F2.8 GM II",
+            "fNumber": 2.8,
+            "exposureTime": "1/250",
+            "focalLength": 35,
+            "iso": 200,
+            "exifImageWidth": 1920,
+            "exifImageHeight": 1080,
+            "orientation": "1",
+            "fileSizeInByte": settings.asset_bytes,
+            "dateTimeOriginal": f"2024-06-{1 + i % 28:02d}T12:{i % 60:02d}:00+00:00",
+            "latitude": 41.7151,
+            "longitude": 44.8271,
+            "city": "Tbilisi",
+            "state": "Tbilisi",
+            "country": "Georgia",
+        }
+        assets.append(
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "type": "VIDEO" if video else "IMAGE",
+                "originalMimeType": "video/mp4" if video else "image/jpeg",
+                "originalPath": f"/library/{album_uuid}/{i:06d}.{extension}",
+                "exifInfo": exif,
+            }
+        )
+    return {"id": album_uuid, "albumName": f"Load test {album_uuid[:8]}", "assets": assets}
+
+
+def create_fake_immich(settings: FakeSettings) -> Starlette:
+    """
+    Fake Immich API
+
+    :param settings: fake settings
+    :return: ASGI app
+    """
+    payload = b"\xff\xd8\xff\xe0" + bytes(max(settings.asset_bytes - 4, 0))
+    rng = random.Random(settings.seed)
+    stats = {"requests": 0, "errors": 0, "bytes_sent": 0}
+
+    async def delay_or_fail() -> Optional[Response]:
+        stats["requests"] += 1
+        await asyncio.sleep(settings.immich_latency_ms / 1000)
+        if rng.random() < settings.immich_error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"message": "Injected failure"}, 500)
+        return None
+
+    async def users_me(request: Request) -> Response:
+        return await delay_or_fail() or JSONResponse({"id": "load-test", "email": "load@test.local"})
+
+    async def album(request: Request) -> Response:
+        return await delay_or_fail() or JSONResponse(make_album(request.path_params["album_id"], settings))
+
+    async def original(request: Request) -> Response:
+        failure = await delay_or_fail()
+        if failure:
+            return failure
+        stats["bytes_sent"] += len(payload)
+        return Response(payload, media_type="application/octet-stream")
+
+    async def health(request: Request) -> Response:
+        return JSONResponse(stats)
+
+    return Starlette(
+        routes=[
+            Route("/api/users/me", users_me),
+            Route("/api/albums/{album_id}", album),
+            Route("/api/assets/{asset_id}/original", original),
+            Route("/health", health),
+        ]
+    )
+
+
+async def parse_params(request: Request) -> Dict[str, Any]:
+    """
+    Bot API method parameters from JSON, urlencoded or multipart body (file parts become their size)
+
+    :param request: request
+    :return: parameters
+    """
+    content_type = request.headers.get("content-type", "")
+    body = await request.body()
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            data = part.get_payload(decode=True) or b""
+            params[name] = len(data) if part.get_filename() else data.decode()
+        return params
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+def create_fake_bot_api(settings: FakeSettings) -> Starlette:
+    """
+    Fake Telegram Bot API (`/bot{token}/{method}`)
+
+    :param settings: fake settings
+    :return: ASGI app
+    """
+    rng = random.Random(settings.seed + 1)
+    updates: List[Dict[str, Any]] = []
+    new_update = asyncio.Condition()
+    message_ids: Dict[int, int] = {}
+    stats = {"requests": 0, "uploads": 0, "retry_after": 0, "forwards": 0, "bytes_received": 0}
+
+    def ok(result: Any) -> Response:
+        return JSONResponse({"ok": True, "result": result})
+
+    def chat(chat_id: int) -> Dict[str, Any]:
+        if chat_id <= CHANNEL_ID_BASE:
+            return {"id": chat_id, "type": "channel", "title": f"Channel {chat_id}"}
+        return {"id": chat_id, "type": "supergroup", "title": f"Discussion {chat_id}"}
+
+    def next_message_id(chat_id: int) -> int:
+        message_ids[chat_id] = message_ids.get(chat_id, 0) + 1
+        return message_ids[chat_id]
+
+    async def deliver_forward(channel: int, channel_msg_id: int) -> None:
+        await asyncio.sleep(settings.forward_delay_ms / 1000)
+        group = discussion_id(channel)
+        now = int(time.time())
+        async with new_update:
+            updates.append(
+                {
+                    "update_id": len(updates) + 1,
+                    "message": {
+                        "message_id": next_message_id(group),
+                        "date": now,
+                        "chat": chat(group),
+                        "sender_chat": chat(channel),
+                        "is_automatic_forward": True,
+                        "forward_origin": {
+                            "type": "channel",
+                            "chat": chat(channel),
+                            "message_id": channel_msg_id,
+                            "date": now,
+                        },
+                        "caption": "forwarded",
+                    },
+                }
+            )
+            stats["forwards"] += 1
+            new_update.notify_all()
+
+    async def send_media(method: str, params: Dict[str, Any]) -> Response:
+        stats["uploads"] += 1
+        stats["bytes_received"] += sum(v for k, v in params.items() if isinstance(v, int) and k != "chat_id")
+        await asyncio.sleep(settings.upload_latency_ms / 1000)
+        if rng.random() < settings.retry_after_rate:
+            stats["retry_after"] += 1
+            return JSONResponse(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {settings.retry_after_seconds}",
+                    "parameters": {"retry_after": settings.retry_after_seconds},
+                },
+                429,
+            )
+
+        chat_id = int(params["chat_id"])
+        message_id = next_message_id(chat_id)
+        if chat(chat_id)["type"] == "channel":
+            asyncio.create_task(deliver_forward(chat_id, message_id))
+        return ok({"message_id": message_id, "date": int(time.time()), "chat": chat(chat_id)})
+
+    async def get_updates(params: Dict[str, Any]) -> Response:
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+
+        def pending() -> List[Dict[str, Any]]:
+            return [u for u in updates[max(offset - 1, 0) :] if u["update_id"] >= offset]
+
+        async with new_update:
+            if not pending() and timeout:
+                try:
+                    await asyncio.wait_for(new_update.wait_for(lambda: bool(pending())), timeout)
+                except TimeoutError:
+                    pass
+            return ok(pending()[:100])
+
+    async def method(request: Request) -> Response:
+        stats["requests"] += 1
+        name = request.path_params["method"]
+        params = await parse_params(request)
+        if name == "getMe":
+            return ok(
+                {
+                    "id": 1,
+                    "is_bot": True,
+                    "first_name": "Load test",
+                    "username": "load_test_bot",
+                    "can_join_groups": True,
+                }
+            )
+        if name == "getChat":
+            chat_id = int(params["chat_id"])
+            info = {**chat(chat_id), "accent_color_id": 0, "max_reaction_count": 11}
+            if info["type"] == "channel":
+                info["linked_chat_id"] = discussion_id(chat_id)
+            return ok(info)
+        if name == "getChatMember":
+            user = {"id": int(params["user_id"]), "is_bot": True, "first_name": "Load test"}
+            return ok({"status": "administrator", "user": user, **{right: True for right in ADMIN_RIGHTS}})
+        if name in ("sendPhoto", "sendVideo", "sendAnimation", "sendDocument"):
+            return await send_media(name, params)
+        if name == "getUpdates":
+            return await get_updates(params)
+        # deleteWebhook, setMyCommands и прочие управляющие вызовы
+        return ok(True)
+
+    async def health(request: Request) -> Response:
+        return JSONResponse(stats)
+
+    return Starlette(routes=[Route("/bot{token}/{method}", method, methods=["POST"]), Route("/health", health)])
+
+
+async def serve(settings: FakeSettings, host: str, immich_port: int, bot_port: int) -> None:
+    """
+    Run both fake servers until cancelled
+
+    :param settings: fake settings
+    :param host: listen address
+    :param immich_port: port of fake Immich
+    :param bot_port: port of fake Bot API
+    :return: None
+    """
+    servers = [
+        uvicorn.Server(uvicorn.Config(create_fake_immich(settings), host=host, port=immich_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(create_fake_bot_api(settings), host=host, port=bot_port, log_level="warning")),
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def run_in_process(settings: FakeSettings, host: str, immich_port: int, bot_port: int) -> None:
+    """Entry point of the child process started by the load test"""
+    asyncio.run(serve(settings, host, immich_port, bot_port))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--immich-port", type=int, default=18080)
+    parser.add_argument("--bot-port", type=int, default=18081)
+    args = parser.parse_args()
+    run_in_process(FakeSettings(), args.host, args.immich_port, args.bot_port)
+
+
+if __name__ == "__main__":
+    main()
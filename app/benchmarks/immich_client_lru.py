@@ -0,0 +1,104 @@
+"""
+Cost of the Immich client cache hit path with many cached clients
+
+Fills `ImmichService` with --clients stub clients (no HTTP, no DB) and measures `ensure_client` for random users
+already in the cache — the path every `client_handler` call takes. For comparison runs the same lookups against
+the old list-based LRU (`list.remove` + `append` on each hit) and the old full scan of all clients for expiry.
+Prints ns per hit and ms per expiry pass for 1k and 10k clients by default.
+
+Run from app/:
+
+    python -m benchmarks.immich_client_lru --lookups 100000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from immich.immich_client import ImmichService
+
+
+class StubClient:
+    """ImmichClient stand-in: only what the cache looks at"""
+
+    def __init__(self):
+        self.last_used = datetime.now()
+
+    async def is_valid(self, ttl: timedelta) -> bool:
+        return (datetime.now() - self.last_used) < ttl
+
+    async def close(self) -> None:
+        pass
+
+
+def fill(service: ImmichService, clients: int) -> None:
+    for telegram_id in range(clients):
+        client = StubClient()
+        service.active_clients[telegram_id] = client
+        service._schedule_expiry(telegram_id, client)
+
+
+async def lru_hits(clients: int, lookups: int) -> float:
+    service = ImmichService(max_clients=clients + 1)
+    fill(service, clients)
+    ids = [random.randrange(clients) for _ in range(lookups)]
+
+    started = time.perf_counter()
+    for telegram_id in ids:
+        await service.ensure_client(telegram_id)
+    return (time.perf_counter() - started) / lookups * 1e9
+
+
+async def list_hits(clients: int, lookups: int) -> float:
+    # Старая схема: словарь клиентов + список порядка использования
+    active = {telegram_id: StubClient() for telegram_id in range(clients)}
+    order = list(range(clients))
+    ttl = timedelta(hours=2)
+    ids = [random.randrange(clients) for _ in range(lookups)]
+
+    started = time.perf_counter()
+    for telegram_id in ids:
+        if await active[telegram_id].is_valid(ttl):
+            order.remove(telegram_id)
+            order.append(telegram_id)
+    return (time.perf_counter() - started) / lookups * 1e9
+
+
+async def heap_expiry(clients: int) -> float:
+    service = ImmichService(max_clients=clients + 1)
+    fill(service, clients)
+
+    started = time.perf_counter()
+    await service._expire_clients()
+    return (time.perf_counter() - started) * 1000
+
+
+async def scan_expiry(clients: int) -> float:
+    active = {telegram_id: StubClient() for telegram_id in range(clients)}
+    ttl = timedelta(hours=2)
+
+    started = time.perf_counter()
+    expired = [telegram_id for telegram_id, client in active.items() if not await client.is_valid(ttl)]
+    for telegram_id in expired:
+        await active.pop(telegram_id).close()
+    return (time.perf_counter() - started) * 1000
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1000, 10000], help="cached clients")
+    parser.add_argument("--lookups", type=int, default=100000, help="cache hits measured per run")
+    args = parser.parse_args()
+
+    for clients in args.clients:
+        print(
+            f"{clients:>6} clients: hit lru={await lru_hits(clients, args.lookups):.0f}ns "
+            f"list={await list_hits(clients, args.lookups):.0f}ns | "
+            f"expiry pass heap={await heap_expiry(clients):.3f}ms scan={await scan_expiry(clients):.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,281 @@
+"""
+End-to-end throughput of the media job against fake Immich and Bot API servers
+
+Starts `benchmarks.fake_services` in a child process (its memory is not counted), seeds Postgres with --users
+users (Immich host, API key, one album, channel with discussion group each), runs `posting_media_to_channel_job`
+once with a bot pointed at the fake Bot API that also polls automatic forwards, waits for discussion uploads and
+prints:
+
+- posted/failed items and items per second of the whole run
+- p50/p99 per pipeline stage, taken from the spans of every media item (see utils/tracing.py)
+- counters of the fake servers (injected errors and RetryAfter, forwards) and peak RSS of the bot process
+
+Seeded rows are deleted afterwards (--keep-data to inspect them). Posting budgets, MEDIA_JOB_CONCURRENCY and pool
+sizes come from the environment as in production. Needs a migrated Postgres (POSTGRES_* variables), run from app/:
+
+    python -m benchmarks.load_test --users 20 --assets 50 --asset-kb 1024 --retry-after-rate 0.02
+"""
+
+import os
+import tempfile
+
+# До импорта модулей бота: спаны пишутся в отдельный файл, геокодер не ходит в сеть
+TRACES_PATH = os.path.join(tempfile.mkdtemp(prefix="load_test_"), "traces.jsonl")
+os.environ["TRACING_EXPORTER"] = "jsonl"
+os.environ["TRACING_JSONL_PATH"] = TRACES_PATH
+os.environ["TRACING_JSONL_MAX_BYTES"] = str(2**40)
+os.environ["POST_RESULTS_JOURNAL"] = os.path.join(os.path.dirname(TRACES_PATH), "posting_results.journal")
+os.environ.setdefault("GEOCODER_BACKEND", "none")
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import multiprocessing  # noqa: E402
+import resource  # noqa: E402
+import statistics  # noqa: E402
+import time  # noqa: E402
+import uuid  # noqa: E402
+from collections import defaultdict  # noqa: E402
+from types import SimpleNamespace  # noqa: E402
+from typing import Dict, List  # noqa: E402
+
+import httpx  # noqa: E402
+from sqlalchemy import delete, func, select  # noqa: E402
+from telegram.ext import ApplicationBuilder, MessageHandler, filters  # noqa: E402
+
+from benchmarks.fake_services import FakeSettings, channel_id, run_in_process  # noqa: E402
+from bot.handlers.discussion_forward_tracker_handler import discussion_forward_handler  # noqa: E402
+from bot.telegram_requests import telegram_requests  # noqa: E402
+from bot.update_processor import PerUserUpdateProcessor  # noqa: E402
+from cron_jobs.post_media_to_channel_job import posting_media_to_channel_job  # noqa: E402
+from immich.http_pools import host_pools  # noqa: E402
+from immich.immich_client import immich_service  # noqa: E402
+from postgres.database import AsyncSessionLocal  # noqa: E402
+from postgres.models import Album, ApiKey, Channel, DiscussionAttachment, ImmichHost, PostedAsset, User  # noqa: E402
+from utils.config import BOT_CONCURRENT_UPDATES  # noqa: E402
+from utils.metrics import registry  # noqa: E402
+
+TOKEN = "123456:LOADTEST"
+# Пользователи нагрузочного теста, по ним же удаляются данные
+USERNAME_PREFIX = "load_test_"
+TELEGRAM_ID_BASE = 9_100_000_000
+
+STAGES = [
+    "discover",
+    "post_media",
+    "download",
+    "heic_convert",
+    "caption",
+    "send_photo",
+    "send_video",
+    "send_animation",
+    "send_document",
+    "ffmpeg",
+    "forward_tracker.peek",
+    "record_result",
+    "discussion_upload",
+]
+
+
+async def wait_ready(urls: List[str], timeout: float = 15) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        for url in urls:
+            while True:
+                try:
+                    (await client.get(url)).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"Fake server {url} did not start")
+                    await asyncio.sleep(0.1)
+
+
+async def seed(users: int, immich_url: str) -> None:
+    async with AsyncSessionLocal() as db:
+        for i in range(users):
+            user = User(username=f"{USERNAME_PREFIX}{i}", telegram_id=TELEGRAM_ID_BASE + i)
+            db.add(user)
+            await db.flush()
+            channel = channel_id(i)
+            db.add_all(
+                [
+                    ImmichHost(user_id=user.user_id, host_url=immich_url),
+                    ApiKey(user_id=user.user_id, api_key=f"load-test-key-{i}"),
+                    Album(user_id=user.user_id, album_uuid=str(uuid.uuid5(uuid.NAMESPACE_URL, f"load-test/{i}"))),
+                    Channel(
+                        user_id=user.user_id,
+                        telegram_channel_id=channel,
+                        channel_name=f"Load test {i}",
+                        channel_url=f"https://t.me/c/{-channel}",
+                    ),
+                ]
+            )
+        await db.commit()
+
+
+async def cleanup(users: int) -> None:
+    telegram_ids = [TELEGRAM_ID_BASE + i for i in range(users)]
+    async with AsyncSessionLocal() as db:
+        user_ids = select(User.user_id).where(User.username.like(f"{USERNAME_PREFIX}%"))
+        await db.execute(delete(PostedAsset).where(PostedAsset.user_id.in_(user_ids)))
+        await db.execute(delete(DiscussionAttachment).where(DiscussionAttachment.telegram_id.in_(telegram_ids)))
+        # media_files, альбомы, каналы, ключи и хосты удаляются каскадом
+        await db.execute(delete(User).where(User.username.like(f"{USERNAME_PREFIX}%")))
+        await db.commit()
+
+
+async def wait_discussion_uploads(users: int, timeout: float) -> int:
+    """Ждем, пока фоновые загрузки в обсуждения не закончатся, возвращаем оставшиеся"""
+    telegram_ids = [TELEGRAM_ID_BASE + i for i in range(users)]
+    deadline = time.monotonic() + timeout
+    while True:
+        async with AsyncSessionLocal() as db:
+            left = await db.scalar(
+                select(func.count())
+                .select_from(DiscussionAttachment)
+                .where(
+                    DiscussionAttachment.telegram_id.in_(telegram_ids),
+                    DiscussionAttachment.status.in_(["pending", "sending"]),
+                )
+            )
+        if not left or time.monotonic() > deadline:
+            return left or 0
+        await asyncio.sleep(0.5)
+
+
+def stage_durations() -> Dict[str, List[float]]:
+    durations = defaultdict(list)
+    if not os.path.exists(TRACES_PATH):
+        return durations
+    with open(TRACES_PATH, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            if span["duration"] is not None:
+                durations[span["name"]].append(span["duration"] * 1000)
+    return durations
+
+
+def percentile(values: List[float], p: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def posted(result: str) -> float:
+    return registry.get_sample_value("media_items_posted_total", {"result": result}) or 0
+
+
+async def run(args: argparse.Namespace) -> None:
+    settings = FakeSettings(
+        assets_per_album=args.assets,
+        asset_bytes=args.asset_kb * 1024,
+        video_ratio=args.video_ratio,
+        immich_latency_ms=args.immich_latency_ms,
+        immich_error_rate=args.immich_error_rate,
+        upload_latency_ms=args.upload_latency_ms,
+        retry_after_rate=args.retry_after_rate,
+        retry_after_seconds=args.retry_after_seconds,
+        forward_delay_ms=args.forward_delay_ms,
+    )
+    immich_url = f"http://{args.host}:{args.immich_port}"
+    bot_url = f"http://{args.host}:{args.bot_port}"
+    fakes = multiprocessing.get_context("spawn").Process(
+        target=run_in_process, args=(settings, args.host, args.immich_port, args.bot_port), daemon=True
+    )
+    fakes.start()
+
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(f"{bot_url}/bot")
+        .request(telegram_requests.control)
+        .concurrent_updates(PerUserUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        .build()
+    )
+    telegram_requests.attach(TOKEN, base_url=f"{bot_url}/bot")
+    application.add_handler(
+        MessageHandler(
+            (filters.ChatType.GROUPS | filters.ChatType.SUPERGROUP) & filters.IS_AUTOMATIC_FORWARD,
+            discussion_forward_handler,
+        )
+    )
+
+    try:
+        await wait_ready([f"{immich_url}/health", f"{bot_url}/health"])
+        await cleanup(args.users)
+        await seed(args.users, immich_url)
+
+        async with application:
+            await telegram_requests.media_bot.initialize()
+            await immich_service.start()
+            await application.updater.start_polling(poll_interval=0, timeout=1)
+            await application.start()
+
+            started = time.perf_counter()
+            await posting_media_to_channel_job(SimpleNamespace(application=application, bot=application.bot, job=None))
+            posting_seconds = time.perf_counter() - started
+            left = await wait_discussion_uploads(args.users, args.drain_seconds)
+            total_seconds = time.perf_counter() - started
+
+            await application.updater.stop()
+            await application.stop()
+            await immich_service.close_all()
+            await host_pools.close_all()
+            await telegram_requests.media_bot.shutdown()
+
+        async with httpx.AsyncClient() as client:
+            immich_stats = (await client.get(f"{immich_url}/health")).json()
+            bot_stats = (await client.get(f"{bot_url}/health")).json()
+    finally:
+        fakes.terminate()
+        fakes.join()
+        if not args.keep_data:
+            await cleanup(args.users)
+
+    ok, failed = posted("success"), posted("failed")
+    print(f"users={args.users} assets/album={args.assets} asset={args.asset_kb}KiB")
+    print(
+        f"posted={ok:.0f} failed={failed:.0f} in {posting_seconds:.1f}s "
+        f"-> {ok / posting_seconds if posting_seconds else 0:.2f} items/s "
+        f"(with discussion uploads {total_seconds:.1f}s, {left} left unsent)"
+    )
+    print(f"{'stage':<22}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    durations = stage_durations()
+    for stage in STAGES + sorted(set(durations) - set(STAGES)):
+        values = durations.get(stage)
+        if values:
+            print(
+                f"{stage:<22}{len(values):>8}{percentile(values, 50):>10.1f}"
+                f"{percentile(values, 99):>10.1f}{max(values):>10.1f}"
+            )
+    print(f"fake immich: {immich_stats}")
+    print(f"fake bot api: {bot_stats}")
+    # ru_maxrss в Linux — килобайты
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="seeded users, one album and channel each")
+    parser.add_argument("--assets", type=int, default=20, help="assets per album")
+    parser.add_argument("--asset-kb", type=int, default=512, help="size of each original")
+    parser.add_argument("--video-ratio", type=float, default=0.1, help="share of mp4 assets")
+    parser.add_argument("--immich-latency-ms", type=float, default=20)
+    parser.add_argument(
+        "--immich-error-rate", type=float, default=0.0, help="share of Immich requests failing with 500"
+    )
+    parser.add_argument("--upload-latency-ms", type=float, default=50)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="share of uploads answered with 429")
+    parser.add_argument("--retry-after-seconds", type=int, default=1)
+    parser.add_argument("--forward-delay-ms", type=float, default=200, help="delay of automatic forwards")
+    parser.add_argument("--drain-seconds", type=float, default=60, help="max wait for discussion uploads")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--immich-port", type=int, default=18080)
+    parser.add_argument("--bot-port", type=int, default=18081)
+    parser.add_argument("--keep-data", action="store_true", help="do not delete seeded rows")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
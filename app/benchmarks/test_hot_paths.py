@@ -0,0 +1,187 @@
+"""
+Cost of code that runs for every asset on every media job run
+
+pytest-benchmark suite, separate from the correctness tests (pytest only collects tests/ by default). Payloads
+are synthetic and seeded, so runs are comparable. Baselines live in benchmarks/.benchmarks. Run from app/:
+
+    # compare with the committed baseline, fail on median regressions over 25%
+    python -m pytest benchmarks --benchmark-storage=benchmarks/.benchmarks \
+        --benchmark-compare --benchmark-compare-fail=median:25%
+
+    # refresh the baseline after an intended change (commit the new file)
+    python -m pytest benchmarks --benchmark-storage=benchmarks/.benchmarks --benchmark-save=baseline
+"""
+
+import random
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from bot.handlers.discussion_forward_tracker_handler import DiscussionForwardTracker
+from bot.post_to_channel import MediaPoster
+from cron_jobs.post_media_to_channel_job import MediaJobs
+from immich.immich_client import ImmichClient, ImmichService
+
+ALBUM_SIZE = 50_000
+CACHED_CLIENTS = 10_000
+FORWARDS = 10_000
+
+MIME_TYPES = ["image/jpeg", "image/heic", "image/png", "image/gif", "video/mp4", "video/quicktime", ""]
+EXTENSIONS = {"image/jpeg": "jpg", "image/heic": "heic", "image/png": "png", "image/gif": "gif", "video/mp4": "mp4"}
+
+
+def make_asset(rng: random.Random) -> dict:
+    mime_type = rng.choice(MIME_TYPES)
+    extension = EXTENSIONS.get(mime_type, rng.choice(["mov", "webm", "jpeg", "dng"]))
+    exif = {
+        "make": rng.choice(["Apple", "SONY", "Canon", None]),
+        "model": rng.choice(["iPhone 15 Pro", "ILCE-7M4", "EOS R6", None]),
+        "lensModel": rng.choice(["FE 24-70mm F2.8 GM II", None]),
+        "fNumber": rng.choice([1.8, 2.8, 4.0, None]),
+        "exposureTime": rng.choice(["1/125", "1/1000", None]),
+        "focalLength": rng.choice([24, 50, 85, None]),
+        "iso": rng.choice([100, 400, 3200, None]),
+        "exifImageWidth": 4032,
+        "exifImageHeight": 3024,
+        "orientation": rng.choice(["1", "6", "8", None]),
+        "fileSizeInByte": rng.randrange(100_000, 200_000_000),
+        "dateTimeOriginal": "2024-06-01T12:30:00+00:00",
+    }
+    if rng.random() < 0.7:
+        exif["latitude"], exif["longitude"] = rng.uniform(-60, 70), rng.uniform(-180, 180)
+    if rng.random() < 0.5:
+        exif.update(city="Tbilisi", state="Tbilisi", country="Georgia")
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "type": "VIDEO" if mime_type.startswith("video") else "IMAGE",
+        "originalMimeType": mime_type,
+        "originalPath": f"/library/upload/{rng.getrandbits(32):08x}.{extension}",
+        "exifInfo": exif,
+    }
+
+
+@pytest.fixture(scope="module")
+def album_assets():
+    rng = random.Random(48)
+    return [make_asset(rng) for _ in range(ALBUM_SIZE)]
+
+
+@pytest.fixture(scope="module")
+def media_jobs():
+    return MediaJobs()
+
+
+@pytest.fixture(scope="module")
+def media_poster():
+    return MediaPoster(SimpleNamespace(bot=None))
+
+
+@pytest.fixture(scope="module")
+def media_file(media_jobs, album_assets):
+    asset = next(a for a in album_assets if "city" in a["exifInfo"] and "latitude" in a["exifInfo"])
+    return SimpleNamespace(**media_jobs._process_assets([asset])[0])
+
+
+class TestMediaJobsBenchmarks:
+    """Asset payload processing (per album on every run)"""
+
+    def test_process_assets_50k(self, benchmark, media_jobs, album_assets):
+        processed = benchmark.pedantic(media_jobs._process_assets, args=(album_assets,), rounds=5)
+        assert len(processed) == ALBUM_SIZE
+
+    def test_determine_media_type(self, benchmark, media_jobs, album_assets):
+        assets = album_assets[:1000]
+        benchmark(lambda: [media_jobs._determine_media_type(asset) for asset in assets])
+
+    def test_get_location_info(self, benchmark, media_jobs, album_assets):
+        exifs = [asset["exifInfo"] for asset in album_assets[:1000]]
+        benchmark(lambda: [media_jobs._get_location_info(exif) for exif in exifs])
+
+
+class TestMediaPosterBenchmarks:
+    """Caption building (per posted item)"""
+
+    def test_format_exif_info(self, benchmark, media_poster, media_file):
+        assert benchmark(media_poster._format_exif_info, media_file.info)
+
+    def test_generate_caption(self, benchmark, run, media_poster, media_file):
+        assert benchmark(lambda: run(media_poster._generate_caption(media_file)))
+
+
+class TestImmichClientBenchmarks:
+    """Immich client lookups (per API call)"""
+
+    @pytest.mark.parametrize(
+        "url", ["immich.example.com", "http://192.168.1.10:2283/", "https://photos.example.com:8443/api"]
+    )
+    def test_normalize_url(self, benchmark, url):
+        benchmark(ImmichClient.normalize_url, url)
+
+    def test_service_lru_hits(self, benchmark, run):
+        class StubClient:
+            def __init__(self):
+                self.last_used = datetime.now()
+
+            async def is_valid(self, ttl: timedelta) -> bool:
+                return (datetime.now() - self.last_used) < ttl
+
+            async def close(self) -> None:
+                pass
+
+        service = ImmichService(max_clients=CACHED_CLIENTS + 1)
+        for telegram_id in range(CACHED_CLIENTS):
+            client = StubClient()
+            service.active_clients[telegram_id] = client
+            service._schedule_expiry(telegram_id, client)
+        ids = random.Random(49).choices(range(CACHED_CLIENTS), k=1000)
+
+        async def hits():
+            for telegram_id in ids:
+                await service.ensure_client(telegram_id)
+
+        benchmark(lambda: run(hits()))
+
+
+class TestForwardTrackerBenchmarks:
+    """Discussion forward mappings (per automatic forward and per posted item)"""
+
+    def test_store(self, benchmark, run):
+        async def store_all():
+            tracker = DiscussionForwardTracker(max_entries=FORWARDS)
+            await tracker.track_channel(-1001)
+            for msg_id in range(FORWARDS):
+                await tracker.store(-1001, msg_id, msg_id + 1)
+
+        benchmark(lambda: run(store_all()))
+
+    def test_peek(self, benchmark, run):
+        tracker = DiscussionForwardTracker(max_entries=FORWARDS)
+
+        async def fill():
+            await tracker.track_channel(-1001)
+            for msg_id in range(FORWARDS):
+                await tracker.store(-1001, msg_id, msg_id + 1)
+
+        async def peek_all():
+            for msg_id in range(FORWARDS):
+                await tracker.peek(-1001, msg_id)
+
+        run(fill())
+        benchmark(lambda: run(peek_all()))
+
+    def test_cleanup_expired(self, benchmark, run):
+        async def setup():
+            # Нулевой TTL — к моменту cleanup истекли все записи
+            tracker = DiscussionForwardTracker(ttl_seconds=0, max_entries=FORWARDS)
+            await tracker.track_channel(-1001)
+            for msg_id in range(FORWARDS):
+                await tracker.store(-1001, msg_id, msg_id + 1)
+            return (tracker,), {}
+
+        def cleanup(tracker):
+            run(tracker.cleanup_expired())
+            assert not tracker._mapping
+
+        benchmark.pedantic(cleanup, setup=lambda: run(setup()), rounds=20)
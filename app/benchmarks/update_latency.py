@@ -0,0 +1,88 @@
+"""
+Latency of update handling while the media job is running
+
+Simulates the media job issuing DB queries either through the sync `SessionLocal` (old behaviour, blocks the event
+loop) or through `AsyncSessionLocal`, and meanwhile fires "updates" every --interval ms that do a handler-sized
+query through `AsyncSessionLocal`. Prints p50/p95/p99/max latency of the updates for both modes.
+
+Needs a reachable Postgres (POSTGRES_* variables), run from app/:
+
+    python -m benchmarks.update_latency --queries 200 --query-ms 20
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+
+from postgres.database import AsyncSessionLocal, SessionLocal, async_engine
+
+
+async def sync_job(queries: int, query_ms: int) -> None:
+    for _ in range(queries):
+        db = SessionLocal()
+        try:
+            db.execute(text("SELECT pg_sleep(:s)"), {"s": query_ms / 1000})
+        finally:
+            db.close()
+        await asyncio.sleep(0)
+
+
+async def async_job(queries: int, query_ms: int) -> None:
+    for _ in range(queries):
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT pg_sleep(:s)"), {"s": query_ms / 1000})
+
+
+async def handle_update() -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("SELECT 1"))
+
+
+async def measure(job, queries: int, query_ms: int, interval_ms: int) -> list[float]:
+    latencies = []
+    job_task = asyncio.create_task(job(queries, query_ms))
+
+    async def timed_update(scheduled_at: float):
+        await handle_update()
+        latencies.append((time.perf_counter() - scheduled_at) * 1000)
+
+    updates = []
+    while not job_task.done():
+        updates.append(asyncio.create_task(timed_update(time.perf_counter())))
+        await asyncio.sleep(interval_ms / 1000)
+
+    await job_task
+    await asyncio.gather(*updates)
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:>6}: updates={len(latencies)} p50={percentiles[49]:.1f}ms p95={percentiles[94]:.1f}ms "
+        f"p99={percentiles[98]:.1f}ms max={max(latencies):.1f}ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200, help="DB queries issued by the simulated media job")
+    parser.add_argument("--query-ms", type=int, default=20, help="duration of one media job query")
+    parser.add_argument("--interval", type=int, default=10, help="interval between updates, ms")
+    args = parser.parse_args()
+
+    # Прогрев пулов, чтобы не мерить установку соединений
+    await handle_update()
+    await sync_job(1, 0)
+
+    for name, job in (("sync", sync_job), ("async", async_job)):
+        report(name, await measure(job, args.queries, args.query_ms, args.interval))
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
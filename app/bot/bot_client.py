@@ -1,52 +1,56 @@
-from telegram import BotCommand, BotCommandScopeDefault, BotCommandScopeChat
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, Application
+from sqlalchemy import select
+
+from telegram.ext import (
+    ApplicationBuilder,
+    ChatMemberHandler,
+    CommandHandler,
+    MessageHandler,
+    filters,
+    Application,
+)
 
+from bot.command_sync import command_sync
+from bot.discussion_attachments import discussion_attachments
+from bot.telegram_requests import telegram_requests
+from bot.update_processor import PerUserUpdateProcessor
+from bot.handlers.chat_member_handler import my_chat_member_handler
 from bot.handlers.discussion_forward_tracker_handler import discussion_forward_handler, forward_tracker
 from bot.handlers.error_handler import error_handler
 from bot.handlers.setup_handlers.setup_handlers import setup_handlers
 from bot.handlers.delete_all_handler import delete_all_handler
+from bot.handlers.trace_handler import trace_handler
+from cron_jobs.media_partitions_job import media_partitions_job
+from immich.immich_client import immich_service
+from immich.http_pools import host_pools
 from cron_jobs.post_media_to_channel_job import (
     manual_trigger_posting_media_to_channel_job,
     posting_media_to_channel_job,
 )
 
-from utils.config import TELEGRAM_TOKEN, ADMIN_IDS, POST_MEDIA_INTERVAL
-from functools import wraps
-from telegram import Update
-from telegram.ext import ContextTypes
-
-
-def refresh_commands(func):
-    @wraps(func)
-    async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        result = await func(update, context)
-        await update_commands_for_all(context.bot)
-        return result
-
-    return wrapped
+from postgres.database import AsyncSessionLocal
+from postgres.models import Channel
+from utils.config import TELEGRAM_TOKEN, ADMIN_IDS, POST_MEDIA_INTERVAL, BOT_CONCURRENT_UPDATES, COMMAND_SYNC_INTERVAL
+from utils.logger import logger
+from utils.tracing import tracer
 
 
-async def update_commands_for_all(bot: ContextTypes.DEFAULT_TYPE.bot) -> None:
+async def track_active_channels() -> None:
     """
-    Defines commands for all users and admins
+    Register all active channels in forward tracker (forwards from other channels are ignored)
 
-    :param bot: telegram bot
-    :return: None"""
-    common_commands = [
-        BotCommand("start", "Запустить бота"),
-        BotCommand("delete_my_data", "Удалить мои данные"),
-    ]
-
-    admin_commands = common_commands + [
-        BotCommand("process_media", "Обработать медиа (админ)"),
-    ]
-
-    # Устанавливаем команды для всех пользователей
-    await bot.set_my_commands(commands=common_commands, scope=BotCommandScopeDefault())
+    :return: None
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            channel_ids = (
+                await db.scalars(select(Channel.telegram_channel_id).where(Channel.deleted_at.is_(None)))
+            ).all()
+    except Exception as e:
+        logger.error(f"Error loading active channels for forward tracker: {str(e)}")
+        return
 
-    # Устанавливаем расширенные команды для админов
-    for admin_id in ADMIN_IDS:
-        await bot.set_my_commands(commands=admin_commands, scope=BotCommandScopeChat(admin_id))
+    for telegram_channel_id in channel_ids:
+        await forward_tracker.track_channel(telegram_channel_id)
 
 
 def init_bot() -> Application:
@@ -55,7 +59,16 @@ def init_bot() -> Application:
 
     :return: None
     """
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        # Отдельный от загрузки медиа пул для управляющих вызовов
+        .request(telegram_requests.control)
+        # Медленный обработчик одного пользователя не задерживает остальных, диалог настройки — по очереди
+        .concurrent_updates(PerUserUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        .build()
+    )
+    telegram_requests.attach(TELEGRAM_TOKEN)
     setup_handlers(application)
     application.add_handler(
         MessageHandler(
@@ -63,32 +76,52 @@ def init_bot() -> Application:
             discussion_forward_handler,
         )
     )
+    application.add_handler(ChatMemberHandler(my_chat_member_handler, ChatMemberHandler.MY_CHAT_MEMBER))
     application.add_handler(CommandHandler("delete_my_data", delete_all_handler))
 
     application.add_error_handler(error_handler)
 
     application.add_handler(CommandHandler("process_media", manual_trigger_posting_media_to_channel_job))
+    application.add_handler(CommandHandler("trace", trace_handler))
 
     # Планирование периодической задачи (в секундах)
     application.job_queue.run_repeating(posting_media_to_channel_job, interval=POST_MEDIA_INTERVAL, first=10)
 
-    # Декорируем все CommandHandler'ы
-    for handler in application.handlers[0]:
-        if isinstance(handler, CommandHandler):
-            handler.callback = refresh_commands(handler.callback)
+    application.job_queue.run_repeating(lambda ctx: forward_tracker.cleanup_expired(), interval=60)
+
+    # Новые месячные партиции media_files и сжатие старых в posted_assets
+    application.job_queue.run_repeating(media_partitions_job, interval=24 * 3600, first=60)
 
-    # Периодическое обновление команд (на всякий случай)
+    # Повторные попытки и отложенные после рестарта загрузки в обсуждения
     application.job_queue.run_repeating(
-        lambda ctx: update_commands_for_all(ctx.bot),
-        interval=600,  # Каждые 10 минут
+        lambda ctx: discussion_attachments.resume_pending(ctx.application), interval=300, first=300
     )
 
-    application.job_queue.run_repeating(lambda ctx: forward_tracker.cleanup_expired(), interval=60)
+    # Отправка накопленных span в коллектор (для TRACING_EXPORTER=otlp)
+    application.job_queue.run_repeating(lambda ctx: tracer.flush(), interval=10)
+
+    # Повтор синхронизации команд, если при старте не удалось выставить часть областей (без изменений — no-op)
+    application.job_queue.run_repeating(
+        lambda ctx: command_sync.sync(ctx.bot, ADMIN_IDS), interval=COMMAND_SYNC_INTERVAL, first=COMMAND_SYNC_INTERVAL
+    )
 
     # Инициализация команд при старте
     async def post_init(app):
-        await update_commands_for_all(app.bot)
+        await telegram_requests.media_bot.initialize()
+        await immich_service.start()
+        # Команды отправляются в Telegram, только если изменился их набор или список админов
+        await command_sync.sync(app.bot, ADMIN_IDS)
+        await track_active_channels()
+        await discussion_attachments.resume_pending(app)
+
+    # Закрытие клиентов Immich и пулов соединений при остановке
+    async def post_shutdown(app):
+        await immich_service.close_all()
+        await host_pools.close_all()
+        await telegram_requests.media_bot.shutdown()
+        await tracer.flush()
 
     application.post_init = post_init
+    application.post_shutdown = post_shutdown
 
     return application
@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from telegram import Bot, ChatMember
+from telegram.error import TelegramError
+
+from utils.config import CHANNEL_INFO_CACHE_TTL
+from utils.kv_store import create_kv_store
+from utils.logger import logger
+
+
+@dataclass
+class ChannelInfo:
+    channel_id: int
+    title: Optional[str]
+    linked_chat_id: Optional[int]
+    bot_is_admin: Optional[bool]  # None — еще не знаем
+
+
+class ChannelInfoCache:
+    """
+    TTL cache of channel metadata (linked discussion chat, title, bot admin status).
+
+    Saves a `get_chat` round-trip per posted media. Entries are refreshed on `ChatMemberUpdated`
+    for the bot and dropped on posting errors. Every refresh asks Telegram for the bot admin status again,
+    so a missed `ChatMemberUpdated` is fixed by the next refresh at the latest.
+    Storage is pluggable (memory / Redis, see `create_kv_store`).
+    """
+
+    def __init__(self, store, ttl_seconds: int = 3600):
+        self._store = store
+        self._ttl = ttl_seconds
+
+    async def get(self, bot: Bot, channel_id: int) -> ChannelInfo:
+        """
+        Get channel metadata from cache or Telegram
+
+        :param bot: telegram bot
+        :param channel_id: telegram channel id
+        :return: channel info
+        """
+        data = await self._store.get(str(channel_id))
+        if data and not data.get("stale"):
+            return ChannelInfo(channel_id, data["title"], data["linked_chat_id"], data["bot_is_admin"])
+
+        chat = await bot.get_chat(channel_id)
+        logger.debug(f"Fetched channel info for {channel_id}")
+        return await self.put(
+            channel_id,
+            title=chat.title,
+            linked_chat_id=chat.linked_chat_id,
+            # get_chat не сообщает права бота, а старый статус мог устареть (пропущенный ChatMemberUpdated)
+            bot_is_admin=await self._fetch_bot_admin(bot, channel_id),
+        )
+
+    @staticmethod
+    async def _fetch_bot_admin(bot: Bot, channel_id: int) -> Optional[bool]:
+        try:
+            member = await bot.get_chat_member(channel_id, bot.id)
+        except TelegramError as e:
+            # Неизвестно — не блокируем постинг, ошибка отправки сама сбросит кэш
+            logger.warning(f"Failed to get bot status in channel {channel_id}: {str(e)}")
+            return None
+        return member.status in (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+    async def put(
+        self, channel_id: int, title: Optional[str], linked_chat_id: Optional[int], bot_is_admin: Optional[bool]
+    ) -> ChannelInfo:
+        """
+        Store channel metadata
+
+        :param channel_id: telegram channel id
+        :param title: channel title
+        :param linked_chat_id: linked discussion chat id
+        :param bot_is_admin: whether bot is admin in channel
+        :return: channel info
+        """
+        data = {"title": title, "linked_chat_id": linked_chat_id, "bot_is_admin": bot_is_admin}
+        await self._store.set(str(channel_id), data, self._ttl)
+        return ChannelInfo(channel_id, title, linked_chat_id, bot_is_admin)
+
+    async def set_bot_admin(self, channel_id: int, is_admin: bool) -> None:
+        """
+        Update bot admin status and force metadata refresh (with status check) on next get
+
+        :param channel_id: telegram channel id
+        :param is_admin: whether bot is admin in channel
+        :return: None
+        """
+        data = await self._store.get(str(channel_id)) or {"title": None, "linked_chat_id": None}
+        data.update(bot_is_admin=is_admin, stale=True)
+        await self._store.set(str(channel_id), data, self._ttl)
+
+    async def invalidate(self, channel_id: int) -> None:
+        """
+        Drop cached channel metadata
+
+        :param channel_id: telegram channel id
+        :return: None
+        """
+        await self._store.delete(str(channel_id))
+
+
+# Глобальный экземпляр
+channel_info_cache = ChannelInfoCache(create_kv_store("channel_info"), ttl_seconds=CHANNEL_INFO_CACHE_TTL)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.sql import func
+from telegram import Bot, BotCommand, BotCommandScopeChat, BotCommandScopeDefault
+from telegram.error import TelegramError
+
+from postgres.database import AsyncSessionLocal
+from postgres.models import BotState
+from utils.logger import logger
+
+COMMON_COMMANDS = [
+    BotCommand("start", "Запустить бота"),
+    BotCommand("delete_my_data", "Удалить мои данные"),
+]
+
+ADMIN_COMMANDS = COMMON_COMMANDS + [
+    BotCommand("process_media", "Обработать медиа (админ)"),
+    BotCommand("trace", "Этапы публикации медиа по uuid (админ)"),
+]
+
+
+def commands_hash(admin_ids: List[int]) -> str:
+    """
+    Hash of desired command set: common and admin commands and the admin list
+
+    :param admin_ids: telegram ids of admins
+    :return: hex digest
+    """
+    desired = {
+        "common": [(c.command, c.description) for c in COMMON_COMMANDS],
+        "admin": [(c.command, c.description) for c in ADMIN_COMMANDS],
+        "admin_ids": sorted(set(admin_ids)),
+    }
+    return hashlib.sha256(json.dumps(desired, ensure_ascii=False).encode()).hexdigest()
+
+
+class CommandSync:
+    """
+    Pushes bot commands to Telegram only when the command set or admin list changed
+
+    The hash of the last pushed set and its admin list are stored in `bot_state`, so restarts and replicas
+    don't repeat 1 + len(ADMIN_IDS) `set_my_commands` calls. Admins removed from the list get their chat scope
+    deleted. If a call fails the state is not saved and the next sync (periodic bot job) tries again; once the
+    set is in sync, further calls return without touching the database.
+    """
+
+    STATE_KEY = "bot_commands"
+
+    def __init__(self, session_factory: async_sessionmaker):
+        self._session_factory = session_factory
+        self._synced_hash: Optional[str] = None
+
+    async def sync(self, bot: Bot, admin_ids: List[int]) -> bool:
+        """
+        Push commands if they differ from the stored state
+
+        :param bot: telegram bot
+        :param admin_ids: telegram ids of admins
+        :return: True if commands were pushed
+        """
+        desired = commands_hash(admin_ids)
+        if self._synced_hash == desired:
+            return False
+        state = await self._load()
+        if state and state.get("hash") == desired:
+            logger.debug("Bot commands are up to date")
+            self._synced_hash = desired
+            return False
+
+        ok = True
+        try:
+            await bot.set_my_commands(commands=COMMON_COMMANDS, scope=BotCommandScopeDefault())
+        except TelegramError as e:
+            logger.error(f"Failed to set default bot commands: {str(e)}")
+            return False
+
+        for admin_id in admin_ids:
+            try:
+                await bot.set_my_commands(commands=ADMIN_COMMANDS, scope=BotCommandScopeChat(admin_id))
+            except TelegramError as e:
+                # Например админ еще не писал боту — повторим при следующей синхронизации
+                logger.warning(f"Failed to set admin commands for {admin_id}: {str(e)}")
+                ok = False
+
+        for admin_id in set((state or {}).get("admin_ids", [])) - set(admin_ids):
+            try:
+                await bot.delete_my_commands(scope=BotCommandScopeChat(admin_id))
+            except TelegramError as e:
+                logger.warning(f"Failed to delete admin commands of former admin {admin_id}: {str(e)}")
+                ok = False
+
+        if ok:
+            await self._save({"hash": desired, "admin_ids": sorted(set(admin_ids))})
+            self._synced_hash = desired
+            logger.info(f"Bot commands updated for {len(admin_ids)} admins")
+        return True
+
+    async def _load(self) -> Optional[Dict[str, Any]]:
+        try:
+            async with self._session_factory() as db:
+                return await db.scalar(select(BotState.value).where(BotState.key == self.STATE_KEY))
+        except Exception as e:
+            logger.error(f"Error loading bot commands state: {str(e)}")
+            return None
+
+    async def _save(self, value: Dict[str, Any]) -> None:
+        statement = insert(BotState).values(key=self.STATE_KEY, value=value)
+        statement = statement.on_conflict_do_update(
+            index_elements=[BotState.key], set_={"value": value, "updated_at": func.now()}
+        )
+        try:
+            async with self._session_factory() as db:
+                await db.execute(statement)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error saving bot commands state: {str(e)}")
+
+
+# Глобальный экземпляр
+command_sync = CommandSync(AsyncSessionLocal)
@@ -0,0 +1,266 @@
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.sql import func
+from telegram.ext import Application
+
+from bot.telegram_requests import telegram_requests
+from immich.immich_client import immich_service
+from postgres.database import AsyncSessionLocal
+from postgres.models import DiscussionAttachment
+from utils.config import DISCUSSION_PAYLOAD_CACHE_BYTES, DISCUSSION_PAYLOAD_MAX_BYTES
+from utils.logger import logger
+from utils.tracing import tracer
+
+
+class DiscussionAttachmentQueue:
+    """
+    Deferred upload of original media into the channel's discussion group.
+
+    Posting only records a pending row, the upload is started in background as soon as Telegram's automatic
+    forward of the post is seen (`on_forward`). Rows survive restarts and are picked up again by `resume_pending`.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        pending_ttl: timedelta = timedelta(hours=24),
+        stale_sending: timedelta = timedelta(minutes=15),
+        payload_cache_bytes: int = 8 * 1024 * 1024,
+        payload_max_bytes: int = 2 * 1024 * 1024,
+    ):
+        self._max_attempts = max_attempts
+        self._pending_ttl = pending_ttl
+        self._stale_sending = stale_sending
+        # Исходные байты небольших медиа держим в памяти до прихода пересылки, чтобы не скачивать их из Immich
+        # повторно; крупные (видео, HEIC) скачиваются заново — кэш ограничен несколькими мегабайтами
+        self._payload_cache_bytes = payload_cache_bytes
+        self._payload_max_bytes = min(payload_max_bytes, payload_cache_bytes)
+        self._payloads: OrderedDict[int, bytes] = OrderedDict()
+        self._payloads_size = 0
+
+    async def enqueue(
+        self,
+        telegram_id: int,
+        media_uuid: str,
+        filename: str,
+        channel_id: int,
+        channel_msg_id: int,
+        discussion_chat_id: int,
+        payload: Optional[bytes] = None,
+    ) -> Optional[int]:
+        """
+        Persist pending discussion attachment for a channel post
+
+        :param telegram_id: media owner telegram id
+        :param media_uuid: Immich asset uuid
+        :param filename: document filename
+        :param channel_id: channel id
+        :param channel_msg_id: channel post message id
+        :param discussion_chat_id: linked discussion group id
+        :param payload: original media bytes (optional, kept in memory to avoid re-download)
+        :return: attachment id or None on error
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                attachment = DiscussionAttachment(
+                    telegram_id=telegram_id,
+                    media_uuid=media_uuid,
+                    filename=filename,
+                    channel_id=channel_id,
+                    channel_msg_id=channel_msg_id,
+                    discussion_chat_id=discussion_chat_id,
+                    status="pending",
+                    attempts=0,
+                )
+                db.add(attachment)
+                await db.commit()
+                attachment_id = attachment.attachment_id
+        except Exception as e:
+            logger.error(f"Error saving discussion attachment for channel {channel_id} msg {channel_msg_id}: {str(e)}")
+            return None
+
+        if payload:
+            self._remember_payload(attachment_id, payload)
+        return attachment_id
+
+    async def on_forward(self, app: Application, channel_id: int, channel_msg_id: int, discussion_msg_id: int) -> None:
+        """
+        Attach discussion message to a pending row and start the upload in background
+
+        :param app: telegram application
+        :param channel_id: channel id
+        :param channel_msg_id: channel post message id
+        :param discussion_msg_id: message id of the automatic forward in the discussion group
+        :return: None
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                attachment_id = (
+                    await db.execute(
+                        update(DiscussionAttachment)
+                        .where(
+                            DiscussionAttachment.channel_id == channel_id,
+                            DiscussionAttachment.channel_msg_id == channel_msg_id,
+                            DiscussionAttachment.status == "pending",
+                            DiscussionAttachment.discussion_msg_id.is_(None),
+                        )
+                        .values(discussion_msg_id=discussion_msg_id)
+                        .returning(DiscussionAttachment.attachment_id)
+                    )
+                ).scalar_one_or_none()
+                await db.commit()
+        except Exception as e:
+            logger.error(
+                f"Error updating discussion attachment for channel {channel_id} msg {channel_msg_id}: {str(e)}"
+            )
+            return
+
+        # Не наш пост или пересылка уже обработана
+        if attachment_id is not None:
+            self._schedule(app, attachment_id)
+
+    async def resume_pending(self, app: Application) -> None:
+        """
+        Reschedule attachments left after restart or failed attempts, expire ones whose forward never came
+
+        :param app: telegram application
+        :return: None
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                # Отправка прервалась (например, рестарт посреди загрузки) — возвращаем в очередь
+                await db.execute(
+                    update(DiscussionAttachment)
+                    .where(
+                        DiscussionAttachment.status == "sending",
+                        DiscussionAttachment.updated_at < func.now() - self._stale_sending,
+                    )
+                    .values(status="pending")
+                )
+                await db.execute(
+                    update(DiscussionAttachment)
+                    .where(
+                        DiscussionAttachment.status == "pending",
+                        DiscussionAttachment.discussion_msg_id.is_(None),
+                        DiscussionAttachment.created_at < func.now() - self._pending_ttl,
+                    )
+                    .values(status="expired")
+                )
+                ready_ids = (
+                    await db.scalars(
+                        select(DiscussionAttachment.attachment_id).where(
+                            DiscussionAttachment.status == "pending",
+                            DiscussionAttachment.discussion_msg_id.is_not(None),
+                        )
+                    )
+                ).all()
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error resuming discussion attachments: {str(e)}")
+            return
+
+        for attachment_id in ready_ids:
+            self._schedule(app, attachment_id)
+
+    def _schedule(self, app: Application, attachment_id: int) -> None:
+        app.create_task(self._send(app, attachment_id), name=f"discussion_attachment_{attachment_id}")
+
+    async def _send(self, app: Application, attachment_id: int) -> None:
+        attachment = await self._claim(attachment_id)
+        if attachment is None:
+            # Уже отправляется/отправлено другой задачей или репликой
+            return
+
+        try:
+            # Отдельная задача — свой корневой span в трассе того же медиа
+            with tracer.span(
+                "discussion_upload",
+                trace_key=attachment.media_uuid,
+                attachment_id=attachment_id,
+                attempt=attachment.attempts,
+            ):
+                payload = self._pop_payload(attachment_id)
+                if payload is None:
+                    with tracer.span("download"):
+                        payload = await immich_service.download_asset(attachment.telegram_id, attachment.media_uuid)
+
+                with tracer.span("send_document", bytes=len(payload)):
+                    await telegram_requests.media_bot_for(app).send_document(
+                        chat_id=attachment.discussion_chat_id,
+                        document=payload,
+                        filename=attachment.filename,
+                        reply_to_message_id=attachment.discussion_msg_id,
+                    )
+            await self._finish(attachment_id, "sent")
+            logger.info(f"Sent discussion attachment {attachment_id}, media_uuid: {attachment.media_uuid}")
+        except Exception as e:
+            status = "failed" if attachment.attempts >= self._max_attempts else "pending"
+            await self._finish(attachment_id, status, error=str(e))
+            logger.error(
+                f"Error sending discussion attachment {attachment_id} (attempt {attachment.attempts}): {str(e)}"
+            )
+
+    async def _claim(self, attachment_id: int):
+        try:
+            async with AsyncSessionLocal() as db:
+                attachment = (
+                    await db.execute(
+                        update(DiscussionAttachment)
+                        .where(
+                            DiscussionAttachment.attachment_id == attachment_id,
+                            DiscussionAttachment.status == "pending",
+                            DiscussionAttachment.discussion_msg_id.is_not(None),
+                        )
+                        .values(status="sending", attempts=DiscussionAttachment.attempts + 1)
+                        .returning(
+                            DiscussionAttachment.telegram_id,
+                            DiscussionAttachment.media_uuid,
+                            DiscussionAttachment.filename,
+                            DiscussionAttachment.discussion_chat_id,
+                            DiscussionAttachment.discussion_msg_id,
+                            DiscussionAttachment.attempts,
+                        )
+                    )
+                ).one_or_none()
+                await db.commit()
+                return attachment
+        except Exception as e:
+            logger.error(f"Error claiming discussion attachment {attachment_id}: {str(e)}")
+            return None
+
+    async def _finish(self, attachment_id: int, status: str, error: Optional[str] = None) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(DiscussionAttachment)
+                    .where(DiscussionAttachment.attachment_id == attachment_id)
+                    .values(status=status, error=error)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error updating discussion attachment {attachment_id}: {str(e)}")
+
+    def _remember_payload(self, attachment_id: int, payload: bytes) -> None:
+        if len(payload) > self._payload_max_bytes:
+            return
+        self._payloads[attachment_id] = payload
+        self._payloads_size += len(payload)
+        # Вытесняем самые старые, если пересылки по ним так и не пришли
+        while self._payloads_size > self._payload_cache_bytes:
+            _, evicted = self._payloads.popitem(last=False)
+            self._payloads_size -= len(evicted)
+
+    def _pop_payload(self, attachment_id: int) -> Optional[bytes]:
+        payload = self._payloads.pop(attachment_id, None)
+        if payload is not None:
+            self._payloads_size -= len(payload)
+        return payload
+
+
+# Глобальный экземпляр
+discussion_attachments = DiscussionAttachmentQueue(
+    payload_cache_bytes=DISCUSSION_PAYLOAD_CACHE_BYTES, payload_max_bytes=DISCUSSION_PAYLOAD_MAX_BYTES
+)
@@ -0,0 +1,23 @@
+from telegram import Update, ChatMember
+from telegram.ext import ContextTypes
+
+from bot.channel_info_cache import channel_info_cache
+from utils.logger import logger
+
+
+async def my_chat_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Keeps channel metadata cache in sync when bot's membership in a channel changes
+
+    :param update: telegram update
+    :param context: telegram context
+    :return: None
+    """
+    member_update = update.my_chat_member
+    if not member_update or member_update.chat.type != "channel":
+        return
+
+    channel_id = member_update.chat.id
+    is_admin = member_update.new_chat_member.status in (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+    await channel_info_cache.set_bot_admin(channel_id, is_admin)
+    logger.info(f"Bot membership changed in channel {channel_id}: {member_update.new_chat_member.status}")
@@ -1,10 +1,10 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import update
+from sqlalchemy import delete, select, update
 import datetime
 
 
-from postgres.database import SessionLocal
-from postgres.models import User, Channel, ApiKey, ImmichHost, Album, MediaFile
+from postgres.database import AsyncSessionLocal
+from postgres.models import User, Channel, ApiKey, ImmichHost, Album, MediaFile, PostedAsset
+from postgres.user_config import user_config_cache
 
 
 async def delete_all_handler(bot_update, context) -> None:
@@ -15,25 +15,29 @@ async def delete_all_handler(bot_update, context) -> None:
     :param context: telegram context
     :return: None
     """
-    db: Session = SessionLocal()
     telegram_id = bot_update.message.from_user.id
 
-    # Находим пользователя
-    user = db.query(User).filter(User.telegram_id == telegram_id, User.deleted_at.is_(None)).first()
-
-    if not user:
-        bot_update.message.reply_text("Пользователь не найден.")
-        return
-
-    # Устанавливаем deleted_at для пользователя и всех связанных данных
-    now = datetime.datetime.now(datetime.UTC)
-    user.deleted_at = now
-
-    db.execute(update(Channel).where(Channel.user_id == user.user_id).values(deleted_at=now))
-    db.execute(update(ApiKey).where(ApiKey.user_id == user.user_id).values(deleted_at=now))
-    db.execute(update(ImmichHost).where(ImmichHost.user_id == user.user_id).values(deleted_at=now))
-    db.execute(update(Album).where(Album.user_id == user.user_id).values(deleted_at=now))
-    db.execute(update(MediaFile).where(MediaFile.user_id == user.user_id).values(deleted_at=now))
-
-    db.commit()
+    async with AsyncSessionLocal() as db:
+        # Находим пользователя
+        user = await db.scalar(select(User).where(User.telegram_id == telegram_id, User.deleted_at.is_(None)).limit(1))
+
+        if not user:
+            await bot_update.message.reply_text("Пользователь не найден.")
+            return
+
+        # Устанавливаем deleted_at для пользователя и всех связанных данных
+        # Колонки TIMESTAMP без часового пояса — asyncpg не принимает aware datetime
+        now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        user.deleted_at = now
+
+        await db.execute(update(Channel).where(Channel.user_id == user.user_id).values(deleted_at=now))
+        await db.execute(update(ApiKey).where(ApiKey.user_id == user.user_id).values(deleted_at=now))
+        await db.execute(update(ImmichHost).where(ImmichHost.user_id == user.user_id).values(deleted_at=now))
+        await db.execute(update(Album).where(Album.user_id == user.user_id).values(deleted_at=now))
+        await db.execute(update(MediaFile).where(MediaFile.user_id == user.user_id).values(deleted_at=now))
+        # posted_assets нужен только для проверки дубликатов — удаленные медиа в ней не участвуют
+        await db.execute(delete(PostedAsset).where(PostedAsset.user_id == user.user_id))
+
+        await db.commit()
+    await user_config_cache.invalidate(telegram_id)
     await bot_update.message.reply_text("Все ваши данные были удалены.")
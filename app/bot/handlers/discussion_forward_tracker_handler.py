@@ -1,34 +1,100 @@
 import asyncio
-from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Tuple
+import heapq
+import time
+from typing import Optional, Dict, List, Set, Tuple
+from redis import asyncio as aioredis
 from telegram import Update
 from telegram.ext import ContextTypes
+
+from bot.discussion_attachments import discussion_attachments
+from utils.config import CACHE_BACKEND
 from utils.logger import logger
+from utils.metrics import FORWARD_TRACKER_LOOKUPS
+from utils.redis_client import get_redis
 
 
 class DiscussionForwardTracker:
-    """Mapping tracker channel_message_id → discussion_message_id"""
+    """
+    Mapping tracker channel_message_id → discussion_message_id
+
+    Only forwards from channels we post to are stored (see `track_channel`), the number of entries is capped
+    and entries expire from a deadline heap, so cleanup costs O(expired * log n) instead of a full scan.
+    Futures are created only for callers that actually wait in `get`.
+    """
+
+    def __init__(self, ttl_seconds: int = 300, max_entries: int = 10000):
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        # key → [discussion_msg_id, expires_at (monotonic), was_read]
+        self._mapping: Dict[Tuple[int, int], List] = {}
+        self._deadlines: List[Tuple[float, Tuple[int, int]]] = []
+        self._waiters: Dict[Tuple[int, int], List[asyncio.Future]] = {}
+        self._channels: Set[int] = set()
+
+        self.hits = 0
+        self.timeouts = 0
+        self.orphans = 0  # Пересылки, которые никто не прочитал до истечения или вытеснения
+
+    async def track_channel(self, channel_id: int) -> None:
+        """
+        Start storing forwards from channel
+
+        :param channel_id: channel id
+        :return: None
+        """
+        self._channels.add(channel_id)
+
+    async def is_tracked(self, channel_id: int) -> bool:
+        """
+        Check whether forwards from channel are stored
 
-    def __init__(self, ttl_seconds: int = 300):
-        self._mapping: Dict[Tuple[int, int], Tuple[int, datetime]] = {}
-        self._ttl = timedelta(seconds=ttl_seconds)
-        self._waiters: Dict[Tuple[int, int], asyncio.Event] = defaultdict(asyncio.Event)
+        :param channel_id: channel id
+        :return: True/False
+        """
+        return channel_id in self._channels
 
-    async def store(self, channel_id: int, channel_msg_id: int, discussion_msg_id: int) -> None:
+    async def store(self, channel_id: int, channel_msg_id: int, discussion_msg_id: int) -> bool:
         """
         Store mapping
 
         :param channel_id: initial channel id
         :param channel_msg_id: initial message id
         :param discussion_msg_id: discussion message id of forwarded message
-        :return: None
+        :return: True if mapping was stored, False if channel is not tracked
         """
         key = (channel_id, channel_msg_id)
-        self._mapping[key] = (discussion_msg_id, datetime.now())
+        waiters = self._waiters.pop(key, None)
+        if channel_id not in self._channels and not waiters:
+            return False
+
+        expires_at = time.monotonic() + self._ttl
+        self._mapping[key] = [discussion_msg_id, expires_at, bool(waiters)]
+        heapq.heappush(self._deadlines, (expires_at, key))
+
         # Уведомить ожидающих
-        if key in self._waiters:
-            self._waiters[key].set()
+        for future in waiters or ():
+            if not future.done():
+                future.set_result(discussion_msg_id)
+
+        while len(self._mapping) > self._max_entries:
+            self._pop_earliest()
+        return True
+
+    async def peek(self, channel_id: int, channel_msg_id: int) -> Optional[int]:
+        """
+        Get discussion_msg_id without waiting
+
+        :param channel_id: initial channel id
+        :param channel_msg_id: initial message id
+        :return: discussion message id or None if forward was not seen yet
+        """
+        entry = self._mapping.get((channel_id, channel_msg_id))
+        if entry and entry[1] > time.monotonic():
+            entry[2] = True
+            self.hits += 1
+            FORWARD_TRACKER_LOOKUPS.labels("hit").inc()
+            return entry[0]
+        return None
 
     async def get(self, channel_id: int, channel_msg_id: int, timeout: float = 5.0) -> Optional[int]:
         """
@@ -41,38 +107,229 @@ class DiscussionForwardTracker:
         """
 
         logger.debug(f"Getting cache for key {channel_id}, {channel_msg_id}")
-        key = (channel_id, channel_msg_id)
 
         # Проверить кэш
-        if key in self._mapping:
-            msg_id, ts = self._mapping[key]
-            if datetime.now() - ts < self._ttl:
-                return msg_id
+        msg_id = await self.peek(channel_id, channel_msg_id)
+        if msg_id is not None:
+            return msg_id
 
         # Ждать появления
+        key = (channel_id, channel_msg_id)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(future)
         try:
-            await asyncio.wait_for(self._waiters[key].wait(), timeout)
-            if key in self._mapping:
-                return self._mapping[key][0]
+            msg_id = await asyncio.wait_for(future, timeout)
+            self.hits += 1
+            FORWARD_TRACKER_LOOKUPS.labels("hit").inc()
+            return msg_id
         except asyncio.TimeoutError:
+            self.timeouts += 1
+            FORWARD_TRACKER_LOOKUPS.labels("timeout").inc()
             logger.warning(f"Timeout waiting for discussion message: {key}")
-
-        return None
+            return None
+        finally:
+            # Не оставляем за собой ожидающих, если store так и не пришел
+            waiters = self._waiters.get(key)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[key]
 
     async def cleanup_expired(self):
         """
         Delete expired discussion messages
 
         :return: None"""
-        now = datetime.now()
-        expired = [k for k, (_, ts) in self._mapping.items() if now - ts > self._ttl]
-        for k in expired:
-            del self._mapping[k]
-            self._waiters.pop(k, None)
+        now = time.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            self._pop_earliest()
+
+    def _pop_earliest(self) -> None:
+        expires_at, key = heapq.heappop(self._deadlines)
+        entry = self._mapping.get(key)
+        # Запись в куче устарела — ключ был перезаписан с новым сроком
+        if entry is None or entry[1] != expires_at:
+            return
+        del self._mapping[key]
+        if not entry[2]:
+            self.orphans += 1
+
+    async def stats(self) -> Dict[str, int]:
+        """
+        Tracker counters
+
+        :return: hits, timeouts, orphans, size and number of waiters
+        """
+        return {
+            "hits": self.hits,
+            "timeouts": self.timeouts,
+            "orphans": self.orphans,
+            "size": len(self._mapping),
+            "waiters": sum(len(w) for w in self._waiters.values()),
+        }
+
+
+class RedisDiscussionForwardTracker:
+    """
+    Mapping tracker channel_message_id → discussion_message_id shared between replicas through Redis
+
+    The automatic forward may reach a replica other than the one that posted: mappings are Redis keys with TTL,
+    waiters are woken up via pub/sub, tracked channels are a Redis set. A sorted set of deadlines keeps
+    unread mappings, so orphans and size are countable without scanning keys.
+    """
+
+    def __init__(self, redis: aioredis.Redis, ttl_seconds: int = 300, prefix: str = "forward_tracker"):
+        self._redis = redis
+        self._ttl = ttl_seconds
+        self._prefix = prefix
+        self._channels_key = f"{prefix}:channels"
+        self._unread_key = f"{prefix}:unread"
+        # Локальный кэш отслеживаемых каналов, чтобы не спрашивать Redis на каждую пересылку
+        self._channels: Set[int] = set()
+
+        self.hits = 0
+        self.timeouts = 0
+        self.orphans = 0
+
+    def _key(self, channel_id: int, channel_msg_id: int) -> str:
+        return f"{self._prefix}:msg:{channel_id}:{channel_msg_id}"
+
+    async def track_channel(self, channel_id: int) -> None:
+        """
+        Start storing forwards from channel (for all replicas)
+
+        :param channel_id: channel id
+        :return: None
+        """
+        if channel_id not in self._channels:
+            await self._redis.sadd(self._channels_key, channel_id)
+            self._channels.add(channel_id)
+
+    async def is_tracked(self, channel_id: int) -> bool:
+        """
+        Check whether forwards from channel are stored
+
+        :param channel_id: channel id
+        :return: True/False
+        """
+        if channel_id in self._channels:
+            return True
+        if await self._redis.sismember(self._channels_key, channel_id):
+            self._channels.add(channel_id)
+            return True
+        return False
+
+    async def store(self, channel_id: int, channel_msg_id: int, discussion_msg_id: int) -> bool:
+        """
+        Store mapping and wake up waiters on all replicas
+
+        :param channel_id: initial channel id
+        :param channel_msg_id: initial message id
+        :param discussion_msg_id: discussion message id of forwarded message
+        :return: True if mapping was stored, False if channel is not tracked
+        """
+        if not await self.is_tracked(channel_id):
+            return False
+
+        key = self._key(channel_id, channel_msg_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, discussion_msg_id, ex=self._ttl)
+            pipe.zadd(self._unread_key, {key: time.time() + self._ttl})
+            pipe.publish(key, discussion_msg_id)
+            await pipe.execute()
+        return True
+
+    async def peek(self, channel_id: int, channel_msg_id: int) -> Optional[int]:
+        """
+        Get discussion_msg_id without waiting
+
+        :param channel_id: initial channel id
+        :param channel_msg_id: initial message id
+        :return: discussion message id or None if forward was not seen yet
+        """
+        key = self._key(channel_id, channel_msg_id)
+        value = await self._redis.get(key)
+        if value is None:
+            return None
+        await self._redis.zrem(self._unread_key, key)
+        self.hits += 1
+        FORWARD_TRACKER_LOOKUPS.labels("hit").inc()
+        return int(value)
+
+    async def get(self, channel_id: int, channel_msg_id: int, timeout: float = 5.0) -> Optional[int]:
+        """
+        Get discussion_msg_id with timeout
+
+        :param channel_id: initial channel id
+        :param channel_msg_id: initial message id
+        :param timeout: discussion message timeout
+        :return: discussion message id
+        """
+        msg_id = await self.peek(channel_id, channel_msg_id)
+        if msg_id is not None:
+            return msg_id
+
+        key = self._key(channel_id, channel_msg_id)
+        pubsub = self._redis.pubsub()
+        try:
+            await pubsub.subscribe(key)
+            # store мог случиться между peek и подпиской
+            msg_id = await self.peek(channel_id, channel_msg_id)
+            if msg_id is not None:
+                return msg_id
+
+            async with asyncio.timeout(timeout):
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+                    if message is not None:
+                        await self._redis.zrem(self._unread_key, key)
+                        self.hits += 1
+                        FORWARD_TRACKER_LOOKUPS.labels("hit").inc()
+                        return int(message["data"])
+        except TimeoutError:
+            self.timeouts += 1
+            FORWARD_TRACKER_LOOKUPS.labels("timeout").inc()
+            logger.warning(f"Timeout waiting for discussion message: {key}")
+            return None
+        finally:
+            await pubsub.unsubscribe(key)
+            await pubsub.aclose()
+
+    async def cleanup_expired(self):
+        """
+        Drop expired unread mappings from the deadline index (the keys themselves expire in Redis)
+
+        :return: None"""
+        self.orphans += await self._redis.zremrangebyscore(self._unread_key, "-inf", time.time())
+
+    async def stats(self) -> Dict[str, int]:
+        """
+        Tracker counters (hits/timeouts/orphans are per replica, size is shared)
+
+        :return: hits, timeouts, orphans, size and number of waiters
+        """
+        return {
+            "hits": self.hits,
+            "timeouts": self.timeouts,
+            "orphans": self.orphans,
+            "size": await self._redis.zcount(self._unread_key, time.time(), "+inf"),
+            "waiters": 0,
+        }
+
+
+def create_forward_tracker() -> DiscussionForwardTracker | RedisDiscussionForwardTracker:
+    """
+    Build forward tracker for configured CACHE_BACKEND (memory / redis)
+
+    :return: forward tracker
+    """
+    if CACHE_BACKEND == "redis":
+        return RedisDiscussionForwardTracker(get_redis())
+    return DiscussionForwardTracker()
 
 
 # Глобальный экземпляр
-forward_tracker = DiscussionForwardTracker()
+forward_tracker = create_forward_tracker()
 
 
 async def discussion_forward_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -94,5 +351,10 @@ async def discussion_forward_handler(update: Update, context: ContextTypes.DEFAU
         channel_msg_id = getattr(message.forward_origin, "message_id")
         discussion_msg_id = message.message_id
 
-        await forward_tracker.store(channel_id, channel_msg_id, discussion_msg_id)
+        # Пересылки из чужих каналов в группах, где состоит бот, не храним
+        if not await forward_tracker.store(channel_id, channel_msg_id, discussion_msg_id):
+            return
         logger.debug(f"Tracked forward: channel {channel_id} msg {channel_msg_id} -> discussion msg {discussion_msg_id}")
+
+        # Запускаем отложенную загрузку оригинала в обсуждение, если пост наш
+        await discussion_attachments.on_forward(context.application, channel_id, channel_msg_id, discussion_msg_id)
@@ -1,32 +1,40 @@
+from sqlalchemy import func, select, update as sql_update
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 
 from bot.handlers.setup_handlers.setup_handler_consts import ALBUM_UUID
-from postgres.database import SessionLocal
+from postgres.database import AsyncSessionLocal
 from postgres.models import User, ApiKey
+from postgres.user_config import user_config_cache
 
 
 async def api_key_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int | None:
     """
-    Process api key for Immich and add it to db. Change dialogue state for start handlers
+    Process api key for Immich and add it to db, previous keys of user are soft deleted.
+    Change dialogue state for start handlers
 
     :param update: telegram update
     :param context: telegram bot context
     :return: state of dialogue
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         api_key = update.message.text.strip()
-        user = db.query(User).filter(User.telegram_id == update.effective_user.id, User.deleted_at.is_(None)).first()
+        user = await db.scalar(
+            select(User).where(User.telegram_id == update.effective_user.id, User.deleted_at.is_(None)).limit(1)
+        )
 
         if user:
-            api_key_record = ApiKey(user_id=user.user_id, api_key=api_key)
-            db.add(api_key_record)
-            db.commit()
+            # Активным остается один ключ — старые не копятся и не попадают в настройки пользователя
+            await db.execute(
+                sql_update(ApiKey)
+                .where(ApiKey.user_id == user.user_id, ApiKey.deleted_at.is_(None))
+                .values(deleted_at=func.now())
+            )
+            db.add(ApiKey(user_id=user.user_id, api_key=api_key))
+            await db.commit()
+            await user_config_cache.invalidate(update.effective_user.id)
             await update.message.reply_text("Теперь введите ID альбома в Immich:")
             return ALBUM_UUID
         else:
             await update.message.reply_text("Ошибка: пользователь не найден. Начните с /start")
             return ConversationHandler.END
-    finally:
-        db.close()
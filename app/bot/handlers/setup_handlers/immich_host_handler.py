@@ -1,10 +1,12 @@
+from sqlalchemy import select
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 
 from bot.handlers.setup_handlers.setup_handler_consts import IMMICH_HOST, API_KEY
 from immich.immich_client import ImmichClient
-from postgres.database import SessionLocal
+from postgres.database import AsyncSessionLocal
 from postgres.models import User, ImmichHost
+from postgres.user_config import user_config_cache
 from utils.logger import logger
 
 
@@ -16,43 +18,51 @@ async def immich_host_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     :param context: telegram bot context
     :return: state of dialogue
     """
-    db = SessionLocal()
-    try:
-        host_url = update.message.text.strip()
+    async with AsyncSessionLocal() as db:
+        try:
+            host_url = update.message.text.strip()
 
-        # Validate URL and port
-        if ":" in host_url and not any(c.isdigit() for c in host_url.split(":")[-1]):
-            await update.message.reply_text("Порт должен быть числовым. Пожалуйста, введите URL в формате host:port")
-            return IMMICH_HOST
+            # Validate URL and port
+            if ":" in host_url and not any(c.isdigit() for c in host_url.split(":")[-1]):
+                await update.message.reply_text(
+                    "Порт должен быть числовым. Пожалуйста, введите URL в формате host:port"
+                )
+                return IMMICH_HOST
+
+            normalized_url = ImmichClient.normalize_url(host_url)
+
+            user = await db.scalar(
+                select(User).where(User.telegram_id == update.effective_user.id, User.deleted_at.is_(None)).limit(1)
+            )
+
+            if not user:
+                await update.message.reply_text("Ошибка: пользователь не найден. Начните с /start")
+                return ConversationHandler.END
 
-        normalized_url = ImmichClient.normalize_url(host_url)
-
-        user = db.query(User).filter(User.telegram_id == update.effective_user.id, User.deleted_at.is_(None)).first()
-
-        if not user:
-            await update.message.reply_text("Ошибка: пользователь не найден. Начните с /start")
-            return ConversationHandler.END
-
-        # Check is there any active host for user
-        existing_host = (
-            db.query(ImmichHost).filter(ImmichHost.user_id == user.user_id, ImmichHost.deleted_at.is_(None)).first()
-        )
-
-        if existing_host:
-            existing_host.host_url = normalized_url
-            existing_host.deleted_at = None
-            db.commit()
-            await update.message.reply_text(f"URL сервера обновлен: {normalized_url}\nТеперь введите API ключ Immich:")
-        else:
-            immich_host = ImmichHost(user_id=user.user_id, host_url=normalized_url)
-            db.add(immich_host)
-            db.commit()
-            await update.message.reply_text(f"URL сервера сохранен: {normalized_url}\nТеперь введите API ключ Immich:")
-
-        return API_KEY
-    except Exception as e:
-        logger.error(f"Error in immich_host_handler: {str(e)}")
-        await update.message.reply_text(f"Ошибка: {str(e)}\nПожалуйста, введите правильный URL Immich сервера:")
-        return IMMICH_HOST
-    finally:
-        db.close()
+            # Check is there any active host for user
+            existing_host = await db.scalar(
+                select(ImmichHost).where(ImmichHost.user_id == user.user_id, ImmichHost.deleted_at.is_(None)).limit(1)
+            )
+
+            if existing_host:
+                existing_host.host_url = normalized_url
+                existing_host.deleted_at = None
+                await db.commit()
+                await user_config_cache.invalidate(update.effective_user.id)
+                await update.message.reply_text(
+                    f"URL сервера обновлен: {normalized_url}\nТеперь введите API ключ Immich:"
+                )
+            else:
+                immich_host = ImmichHost(user_id=user.user_id, host_url=normalized_url)
+                db.add(immich_host)
+                await db.commit()
+                await user_config_cache.invalidate(update.effective_user.id)
+                await update.message.reply_text(
+                    f"URL сервера сохранен: {normalized_url}\nТеперь введите API ключ Immich:"
+                )
+
+            return API_KEY
+        except Exception as e:
+            logger.error(f"Error in immich_host_handler: {str(e)}")
+            await update.message.reply_text(f"Ошибка: {str(e)}\nПожалуйста, введите правильный URL Immich сервера:")
+            return IMMICH_HOST
@@ -2,8 +2,9 @@ from telegram import Update
 from telegram.ext import ConversationHandler, ContextTypes
 
 from bot.handlers.setup_handlers.setup_handler_consts import CHANNEL_NAME, IMMICH_HOST, API_KEY, ALBUM_UUID
-from postgres.database import SessionLocal
-from postgres.models import User, Channel, ApiKey, ImmichHost, Album
+from postgres.database import AsyncSessionLocal
+from postgres.models import User
+from postgres.user_config import user_config_cache
 from utils.logger import logger
 
 
@@ -15,49 +16,33 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     :param context: telegram bot context
     :return: state of dialogue
     """
-    db = SessionLocal()
     try:
-        user = db.query(User).filter(User.telegram_id == update.effective_user.id, User.deleted_at.is_(None)).first()
+        config = await user_config_cache.get(update.effective_user.id)
 
-        if not user:
-            user = User(telegram_id=update.effective_user.id, username=update.effective_user.username)
-            db.add(user)
-            db.commit()
-
-        # Проверяем наличие активных каналов
-        has_channels = (
-            db.query(Channel).filter(Channel.user_id == user.user_id, Channel.deleted_at.is_(None)).first() is not None
-        )
-
-        if not has_channels:
+        if not config:
+            async with AsyncSessionLocal() as db:
+                db.add(User(telegram_id=update.effective_user.id, username=update.effective_user.username))
+                await db.commit()
             await update.message.reply_text("Введите имя вашего канала:")
             return CHANNEL_NAME
 
-        # Проверяем наличие активных хостов Immich
-        has_immich_hosts = (
-            db.query(ImmichHost).filter(ImmichHost.user_id == user.user_id, ImmichHost.deleted_at.is_(None)).first()
-            is not None
-        )
+        # Проверяем наличие активного канала
+        if config.telegram_channel_id is None:
+            await update.message.reply_text("Введите имя вашего канала:")
+            return CHANNEL_NAME
 
-        if not has_immich_hosts:
+        # Проверяем наличие активного хоста Immich
+        if not config.host_url:
             await update.message.reply_text("Введите URL Immich сервера:")
             return IMMICH_HOST
 
-        # Проверяем наличие активных API ключей
-        has_api_keys = (
-            db.query(ApiKey).filter(ApiKey.user_id == user.user_id, ApiKey.deleted_at.is_(None)).first() is not None
-        )
-
-        if not has_api_keys:
+        # Проверяем наличие активного API ключа
+        if not config.api_key:
             await update.message.reply_text("Введите API ключ Immich:")
             return API_KEY
 
         # Проверяем наличие активных альбомов
-        has_albums = (
-            db.query(Album).filter(Album.user_id == user.user_id, Album.deleted_at.is_(None)).first() is not None
-        )
-
-        if not has_albums:
+        if not config.albums:
             await update.message.reply_text("Введите ID альбома в Immich:")
             return ALBUM_UUID
 
@@ -67,5 +52,3 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         logger.error(f"Error in start_handler: {str(e)}")
         await update.message.reply_text("Произошла ошибка. Пожалуйста, попробуйте снова.")
         return ConversationHandler.END
-    finally:
-        db.close()
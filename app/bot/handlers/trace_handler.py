@@ -0,0 +1,37 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from bot.check_permissions import is_user_allowed
+from utils.tracing import format_trace, tracer
+
+# Лимит длины сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+async def trace_handler(bot_update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Shows span breakdown of media item: /trace <media_uuid>
+
+    :param bot_update: telegram bot
+    :param context: telegram context
+    :return: None
+    """
+    if not is_user_allowed(bot_update.effective_user):
+        await bot_update.message.reply_text("⛔ У вас нет прав для выполнения этой команды")
+        return
+
+    if not context.args:
+        await bot_update.message.reply_text("Использование: /trace <uuid медиа в Immich>")
+        return
+
+    media_uuid = context.args[0]
+    spans = await tracer.get_trace(media_uuid)
+    if not spans:
+        await bot_update.message.reply_text(f"Трасса для {media_uuid} не найдена")
+        return
+
+    text = format_trace(spans)
+    if len(text) > MAX_MESSAGE_LENGTH:
+        # Отрезаем начало: последние попытки интереснее
+        text = "…\n" + text[-(MAX_MESSAGE_LENGTH - 2) :]
+    await bot_update.message.reply_text(text)
@@ -7,19 +7,37 @@ from datetime import datetime
 from typing import Optional, Tuple, List
 from immich.immich_client import immich_service
 from postgres.models import MediaFile, User
+from telegram import Message
 from telegram.error import TelegramError
 
 from utils.logger import logger
+from bot.channel_info_cache import channel_info_cache
+from bot.discussion_attachments import discussion_attachments
+from bot.telegram_requests import telegram_requests
+from utils.metrics import MEDIA_BYTES, MEDIA_STAGE_DURATION
+from utils.tracing import tracer
 from bot.handlers.discussion_forward_tracker_handler import forward_tracker
 
 
 class MediaPoster:
     def __init__(self, telegram_app):
         self.app = telegram_app
+        # Загрузки медиа идут через отдельный пул соединений, управляющие вызовы — через self.app.bot
+        self.media_bot = telegram_requests.media_bot_for(telegram_app)
 
     async def post_to_channel(self, user: User, media_file: MediaFile, telegram_channel_id: int) -> bool:
         """Основная функция постинга в канал"""
         try:
+            channel_info = await channel_info_cache.get(self.app.bot, telegram_channel_id)
+            if channel_info.bot_is_admin is False:
+                logger.warning(
+                    f"Bot is not admin in channel {telegram_channel_id}, skipping media {media_file.media_id}"
+                )
+                return False
+
+            # Пересылки постов в обсуждение сохраняются только для каналов, куда мы постим
+            await forward_tracker.track_channel(telegram_channel_id)
+
             media_data = await self._download_media(user, media_file)
             logger.info(f"type: {type(media_data)}")
             raw_media_data = media_data
@@ -35,16 +53,19 @@ class MediaPoster:
                 logger.info(f"Converting HEIC/HEIF to JPG for media {media_file.media_id}")
 
                 # Конвертируем в памяти
-                media_data = self._convert_heic_to_jpg(media_data)
+                with MEDIA_STAGE_DURATION.labels("heic_convert").time(), tracer.span("heic_convert"):
+                    media_data = self._convert_heic_to_jpg(media_data)
                 logger.info(f"type: {type(media_data)}")
 
-            caption = await self._generate_caption(media_file)
+            with tracer.span("caption"):
+                caption = await self._generate_caption(media_file)
 
             if media_file.media_type == "image":
                 filename = media_file.media_url.split("/")[-1] if media_file.media_url else "photo.jpg"
-                post = await self.app.bot.send_photo(
-                    chat_id=telegram_channel_id, photo=media_data, caption=caption, parse_mode="Markdown"
-                )
+                with MEDIA_STAGE_DURATION.labels("upload").time(), tracer.span("send_photo", bytes=len(media_data)):
+                    post = await self.media_bot.send_photo(
+                        chat_id=telegram_channel_id, photo=media_data, caption=caption, parse_mode="Markdown"
+                    )
             elif media_file.media_type == "video":
                 filename = media_file.media_url.split("/")[-1] if media_file.media_url else "video.mp4"
 
@@ -55,35 +76,46 @@ class MediaPoster:
                     filename=filename,
                     media_file=media_file,
                 )
-                # return post
+                if not post:
+                    return False
             elif media_file.media_type == "gif":
                 filename = "animation.gif"
-                post = await self.app.bot.send_animation(
-                    chat_id=telegram_channel_id,
-                    animation=media_data,
-                    filename=filename,
-                    caption=caption,
-                    parse_mode="Markdown",
-                )
+                with MEDIA_STAGE_DURATION.labels("upload").time(), tracer.span("send_animation", bytes=len(media_data)):
+                    post = await self.media_bot.send_animation(
+                        chat_id=telegram_channel_id,
+                        animation=media_data,
+                        filename=filename,
+                        caption=caption,
+                        parse_mode="Markdown",
+                    )
             else:
                 logger.error(f"unknown media_type: {media_file.media_type}")
                 return False
             logger.info(post)
+            MEDIA_BYTES.labels("uploaded").inc(len(media_data))
 
-            chat_full_info = await self.app.bot.get_chat(telegram_channel_id)
-            discussion_chat_id = chat_full_info.linked_chat_id
+            discussion_chat_id = channel_info.linked_chat_id
 
             if discussion_chat_id:
-                discussion_msg_id = await forward_tracker.get(
-                    channel_id=telegram_channel_id, channel_msg_id=post.message_id, timeout=10.0
+                # Оригинал в обсуждение отправится в фоне, когда придет автоматическая пересылка поста
+                await discussion_attachments.enqueue(
+                    telegram_id=user.telegram_id,
+                    media_uuid=media_file.media_uuid,
+                    filename=filename,
+                    channel_id=telegram_channel_id,
+                    channel_msg_id=post.message_id,
+                    discussion_chat_id=discussion_chat_id,
+                    payload=raw_media_data,
                 )
 
+                # Пересылка могла прийти раньше, чем мы сохранили запись
+                with tracer.span("forward_tracker.peek") as span:
+                    discussion_msg_id = await forward_tracker.peek(telegram_channel_id, post.message_id)
+                    if span is not None:
+                        span.attributes["found"] = discussion_msg_id is not None
                 if discussion_msg_id:
-                    await self.app.bot.send_document(
-                        chat_id=discussion_chat_id,
-                        document=raw_media_data,
-                        filename=filename,
-                        reply_to_message_id=discussion_msg_id,
+                    await discussion_attachments.on_forward(
+                        self.app, telegram_channel_id, post.message_id, discussion_msg_id
                     )
 
             logger.info(
@@ -91,6 +123,8 @@ class MediaPoster:
             )
             return True
         except TelegramError as e:
+            # Канал могли удалить, сменить обсуждение или права бота — перечитаем метаданные в следующий раз
+            await channel_info_cache.invalidate(telegram_channel_id)
             print(
                 f"Telegram error posting media, user_id: {user.user_id}, telegram_id: {user.telegram_id}, media_uuid: {media_file.media_uuid}, channel_id: {telegram_channel_id}. Error: {str(e)}"
             )
@@ -143,8 +177,8 @@ class MediaPoster:
         if not lat or not lon:
             return None
 
-        # Пробуем определить город
-        # city = await self.get_city_from_coords(float(lat), float(lon))
+        # Название места без города в EXIF определяется геокодером при загрузке медиа, отложенные ячейки
+        # дозаполняются перед постингом (MediaJobs._resolve_locations), поэтому здесь сетевых запросов нет
 
         # Формируем ссылку на карты
         map_url = f"https://maps.google.com/?q={lat},{lon}"
@@ -186,7 +220,11 @@ class MediaPoster:
         """Скачивание медиа с Immich"""
         try:
             logger.info("download_media")
-            result = await immich_service.download_asset(user.telegram_id, media_file.media_uuid)
+            with MEDIA_STAGE_DURATION.labels("download").time(), tracer.span("download") as span:
+                result = await immich_service.download_asset(user.telegram_id, media_file.media_uuid)
+            MEDIA_BYTES.labels("downloaded").inc(len(result))
+            if span is not None:
+                span.attributes["bytes"] = len(result)
             return result
         except Exception as e:
             print(f"Error downloading media {media_file.media_id}: {str(e)}")
@@ -228,7 +266,7 @@ class MediaPoster:
 
     async def _send_video_safely(
         self, chat_id: int, video_data: bytes, caption: str, media_file: MediaFile, filename: str
-    ) -> bool:
+    ) -> Optional[Message]:
         """Безопасная отправка видео с конвертацией и сжатием"""
         try:
             # Проверяем формат и размер
@@ -239,9 +277,10 @@ class MediaPoster:
 
             # Конвертируем если нужно
             if media_file.file_format != "mp4" or file_size_mb > 50:
-                video_data, width, height = await self._convert_to_mpeg4(
-                    video_data, orientation=media_file.info["orientation"]
-                )
+                with MEDIA_STAGE_DURATION.labels("ffmpeg").time(), tracer.span("ffmpeg", input_bytes=len(video_data)):
+                    video_data, width, height = await self._convert_to_mpeg4(
+                        video_data, orientation=media_file.info["orientation"]
+                    )
                 # filename = 'video.mp4'
 
             if media_file.info["orientation"] in [5, 6, 7, 8]:
@@ -250,34 +289,34 @@ class MediaPoster:
             # Отправляем видео
             try:
                 logger.info("sending video")
-                await self.app.bot.send_video(
-                    chat_id=chat_id,
-                    video=video_data,
-                    caption=caption,
-                    parse_mode="Markdown",
-                    supports_streaming=True,
-                    width=width,
-                    height=height,
-                    read_timeout=300,
-                    write_timeout=300,
-                    connect_timeout=300,
-                    pool_timeout=300,
-                )
-                return True
+                with MEDIA_STAGE_DURATION.labels("upload").time(), tracer.span("send_video", bytes=len(video_data)):
+                    return await self.media_bot.send_video(
+                        chat_id=chat_id,
+                        video=video_data,
+                        caption=caption,
+                        parse_mode="Markdown",
+                        supports_streaming=True,
+                        width=width,
+                        height=height,
+                        read_timeout=300,
+                        write_timeout=300,
+                        connect_timeout=300,
+                        pool_timeout=300,
+                    )
             except TelegramError as e:
                 logger.error(f"Sending video, telegram error: {str(e)}")
-                return False
+                return None
         except Exception as e:
             logger.error(f"Video send failed: {str(e)}")
             # Fallback - отправка как документ
             try:
-                await self.app.bot.send_document(
-                    chat_id=chat_id, document=video_data, caption=caption, parse_mode="Markdown", filename=filename
-                )
-                return True
+                with MEDIA_STAGE_DURATION.labels("upload").time(), tracer.span("send_document", bytes=len(video_data)):
+                    return await self.media_bot.send_document(
+                        chat_id=chat_id, document=video_data, caption=caption, parse_mode="Markdown", filename=filename
+                    )
             except Exception as e:
                 logger.error(f"Document send also failed: {str(e)}")
-                return False
+                return None
 
     async def _convert_to_mpeg4(
         self, input_data: bytes, orientation: int = 1, max_size_mb: int = 50
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+from telegram import Bot
+from telegram._utils.defaultvalue import DefaultValue
+from telegram.error import TimedOut
+from telegram.ext import Application, ExtBot
+from telegram.request import BaseRequest, HTTPXRequest
+
+from utils.config import (
+    TELEGRAM_CONTROL_POOL_SIZE,
+    TELEGRAM_CONTROL_TIMEOUT,
+    TELEGRAM_MEDIA_POOL_SIZE,
+    TELEGRAM_MEDIA_TIMEOUT,
+)
+from utils.metrics import TELEGRAM_POOL_TIMEOUTS, TELEGRAM_POOL_WAIT
+
+
+@dataclass
+class PoolWaitStats:
+    requests: int = 0
+    waited: int = 0  # Запросы, которым пришлось ждать свободное соединение
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    timeouts: int = 0  # Запрос не отправлен: соединение не освободилось за pool_timeout
+
+
+class MeteredHTTPXRequest(HTTPXRequest):
+    """
+    HTTPXRequest that measures how long requests wait for a free connection of its pool
+
+    Requests take a slot of a semaphore sized as the pool before going to httpx, so the wait happens (and is
+    counted) here and httpx itself never waits for a connection.
+    """
+
+    def __init__(self, name: str, connection_pool_size: int = 1, pool_timeout: Optional[float] = 1.0, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, pool_timeout=pool_timeout, **kwargs)
+        self.name = name
+        self.size = connection_pool_size
+        self._pool_timeout = pool_timeout
+        self._slots = asyncio.Semaphore(connection_pool_size)
+        self.in_flight = 0
+        self.stats = PoolWaitStats()
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data=None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> tuple[int, bytes]:
+        timeout = self._pool_timeout if isinstance(pool_timeout, DefaultValue) else pool_timeout
+        self.stats.requests += 1
+        started = time.monotonic()
+        if self._slots.locked():
+            self.stats.waited += 1
+        try:
+            async with asyncio.timeout(timeout):
+                await self._slots.acquire()
+        except TimeoutError as e:
+            self.stats.timeouts += 1
+            TELEGRAM_POOL_TIMEOUTS.labels(self.name).inc()
+            raise TimedOut(f"Pool timeout: all {self.size} connections of {self.name} pool are occupied") from e
+
+        waited = time.monotonic() - started
+        self.stats.wait_seconds += waited
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+        TELEGRAM_POOL_WAIT.labels(self.name).observe(waited)
+        self.in_flight += 1
+        try:
+            return await super().do_request(
+                url=url,
+                method=method,
+                request_data=request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout,
+            )
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Pool wait counters
+
+        :return: dict of counters with pool size and requests in flight
+        """
+        return {"size": self.size, "in_flight": self.in_flight, **asdict(self.stats)}
+
+
+class TelegramRequests:
+    """
+    Separate Bot API connection pools: small low-latency one for control calls (get_chat, replies, commands)
+    and large one with long timeouts for media uploads
+
+    Media goes through a second bot object with the same token, so a few long uploads can't take all
+    connections of control traffic.
+    """
+
+    def __init__(self, control: MeteredHTTPXRequest, media: MeteredHTTPXRequest):
+        self.control = control
+        self.media = media
+        self.media_bot: Optional[Bot] = None
+
+    def attach(self, token: str, base_url: str = "https://api.telegram.org/bot") -> None:
+        """
+        Create media bot (call once when building the application)
+
+        :param token: bot token
+        :param base_url: Bot API url, the same as of the application bot
+        :return: None
+        """
+        self.media_bot = ExtBot(token, base_url=base_url, request=self.media)
+
+    def media_bot_for(self, application: Application) -> Bot:
+        """
+        Bot for media uploads, application bot if media bot is not created
+
+        :param application: telegram application
+        :return: bot
+        """
+        return self.media_bot or application.bot
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Wait counters of both pools
+
+        :return: {pool name: counters}
+        """
+        return {request.name: request.get_stats() for request in (self.control, self.media)}
+
+
+# Глобальный экземпляр
+telegram_requests = TelegramRequests(
+    control=MeteredHTTPXRequest(
+        "control",
+        connection_pool_size=TELEGRAM_CONTROL_POOL_SIZE,
+        read_timeout=TELEGRAM_CONTROL_TIMEOUT,
+        write_timeout=TELEGRAM_CONTROL_TIMEOUT,
+        connect_timeout=5.0,
+        pool_timeout=5.0,
+    ),
+    media=MeteredHTTPXRequest(
+        "media",
+        connection_pool_size=TELEGRAM_MEDIA_POOL_SIZE,
+        read_timeout=TELEGRAM_MEDIA_TIMEOUT,
+        write_timeout=TELEGRAM_MEDIA_TIMEOUT,
+        media_write_timeout=TELEGRAM_MEDIA_TIMEOUT,
+        connect_timeout=30.0,
+        # Загрузка ждет своей очереди, а не падает через секунду
+        pool_timeout=TELEGRAM_MEDIA_TIMEOUT,
+    ),
+)
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Up to `max_concurrent_updates` updates at once, updates of one user in one chat strictly in order
+
+    The key is (chat id, user id) — the same as the default `ConversationHandler` key, so the setup dialog never
+    sees two messages of one user at the same time. A slow handler of one user (e.g. album check in Immich) no
+    longer holds back other users and forwards in discussion groups. An update waiting for its key does not take
+    a concurrency slot.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}  # Сколько обновлений держат/ждут замок ключа
+
+    @staticmethod
+    def update_key(update: object) -> Optional[Hashable]:
+        """
+        Key of serialization, None — update may run in parallel with anything
+
+        :param update: incoming update
+        :return: (chat id, user id) or None
+        """
+        if not isinstance(update, Update):
+            return None
+        chat, user = update.effective_chat, update.effective_user
+        if chat is None and user is None:
+            return None
+        return chat.id if chat else None, user.id if user else None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.update_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # Сначала очередь своего ключа, потом общий лимит — ожидающий не занимает слот
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
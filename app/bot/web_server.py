@@ -0,0 +1,153 @@
+import hmac
+from typing import Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from prometheus_client import CONTENT_TYPE_LATEST
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from telegram import Update
+from telegram.ext import Application
+
+from bot.handlers.discussion_forward_tracker_handler import forward_tracker
+from bot.telegram_requests import telegram_requests
+from immich.connection_probe import connection_validator
+from immich.host_guard import host_guards
+from immich.http_pools import host_pools
+from immich.immich_client import immich_service
+from utils.config import (
+    BASE_URL,
+    BOT_MODE,
+    WEB_SERVER_HOST,
+    STATS_TOKEN,
+    WEB_SERVER_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN,
+)
+from utils.logger import logger
+from utils import metrics as app_metrics
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+def _secret_matches(received: str, expected: str) -> bool:
+    """Сравнение за постоянное время, чтобы секрет нельзя было подобрать по времени ответа (байты — для не-ASCII)"""
+    return hmac.compare_digest(received.encode(), expected.encode())
+
+
+def create_web_app(
+    application: Application, webhook_secret: Optional[str] = None, stats_token: Optional[str] = None
+) -> Starlette:
+    """
+    HTTP app of the bot: Telegram webhook (when secret is given), /health, /metrics (Prometheus) and /stats (JSON)
+
+    /stats requires `Authorization: Bearer <stats_token>`, without a token it answers only to loopback clients.
+    Immich hosts in /metrics and /stats are shown by hashed id (see utils.metrics.host_id).
+
+    :param application: telegram application (updates go to its update_queue)
+    :param webhook_secret: expected X-Telegram-Bot-Api-Secret-Token, None — no webhook route
+    :param stats_token: bearer token of /stats, None — loopback clients only
+    :return: ASGI app
+    """
+
+    async def telegram_webhook(request: Request) -> Response:
+        if not _secret_matches(request.headers.get(SECRET_HEADER, ""), webhook_secret):
+            logger.warning(f"Rejected webhook request from {request.client.host if request.client else 'unknown'}")
+            return Response(status_code=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except ValueError:
+            return Response(status_code=400)
+        await application.update_queue.put(update)
+        return Response()
+
+    async def health(request: Request) -> Response:
+        running = application.running
+        return JSONResponse({"status": "ok" if running else "starting", "mode": BOT_MODE}, 200 if running else 503)
+
+    async def metrics(request: Request) -> Response:
+        # Размеры кэшей и состояние хостов снимаются в момент опроса, счетчики копятся по ходу работы
+        app_metrics.IMMICH_CLIENTS.set(len(immich_service.active_clients))
+        app_metrics.UPDATE_QUEUE_SIZE.set(application.update_queue.qsize())
+        # Метки забытых хостов не копятся — набор строится заново при каждом опросе
+        app_metrics.IMMICH_HOST_OPEN.clear()
+        app_metrics.IMMICH_HOST_LIMIT.clear()
+        for host, host_stats in host_guards.stats().items():
+            host_id = app_metrics.host_id(host)
+            app_metrics.IMMICH_HOST_OPEN.labels(host_id).set(0 if host_stats["state"] == "closed" else 1)
+            app_metrics.IMMICH_HOST_LIMIT.labels(host_id).set(host_stats["limit"])
+        tracker_stats = await forward_tracker.stats()
+        app_metrics.FORWARD_TRACKER_ENTRIES.set(tracker_stats["size"])
+        app_metrics.FORWARD_TRACKER_WAITERS.set(tracker_stats["waiters"])
+        return Response(app_metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+    def stats_allowed(request: Request) -> bool:
+        if stats_token:
+            return _secret_matches(request.headers.get("Authorization", ""), f"Bearer {stats_token}")
+        return request.client is not None and request.client.host in LOOPBACK_HOSTS
+
+    async def stats(request: Request) -> Response:
+        if not stats_allowed(request):
+            return Response(status_code=403)
+        return JSONResponse(
+            {
+                "immich_clients": len(immich_service.active_clients),
+                "immich_pools": {app_metrics.host_id(host): pool for host, pool in host_pools.stats().items()},
+                "immich_hosts": {app_metrics.host_id(host): guard for host, guard in host_guards.stats().items()},
+                "immich_connection_checks": connection_validator.get_stats(),
+                "forward_tracker": await forward_tracker.stats(),
+                "telegram_pools": telegram_requests.stats(),
+                "update_queue": application.update_queue.qsize(),
+            }
+        )
+
+    routes = [Route("/health", health), Route("/metrics", metrics), Route("/stats", stats)]
+    if webhook_secret:
+        routes.append(Route(WEBHOOK_PATH, telegram_webhook, methods=["POST"]))
+    return Starlette(routes=routes)
+
+
+async def run_application(application: Application) -> None:
+    """
+    Run bot with the built-in HTTP server until SIGINT/SIGTERM
+
+    In webhook mode Telegram sends updates to BASE_URL + WEBHOOK_PATH, in polling mode the server only serves
+    /health and /metrics. `run_polling` is not used, so post_init/post_shutdown are called here.
+
+    :param application: telegram application
+    :return: None
+    """
+    webhook = BOT_MODE == "webhook"
+    server = uvicorn.Server(
+        uvicorn.Config(
+            create_web_app(application, WEBHOOK_SECRET_TOKEN if webhook else None, STATS_TOKEN),
+            host=WEB_SERVER_HOST,
+            port=WEB_SERVER_PORT,
+            log_config=None,
+        )
+    )
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        if webhook:
+            await application.bot.set_webhook(
+                url=f"{BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"Webhook set to {BASE_URL.rstrip('/')}{WEBHOOK_PATH}")
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        try:
+            # Uvicorn сам перехватывает SIGINT/SIGTERM и завершает serve()
+            await server.serve()
+        finally:
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
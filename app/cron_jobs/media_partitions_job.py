@@ -0,0 +1,218 @@
+import re
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from telegram.ext import ContextTypes
+
+from postgres.database import async_engine
+from utils.config import MEDIA_PARTITION_LOCK_TIMEOUT_MS, MEDIA_PARTITION_RETENTION_MONTHS
+from utils.logger import logger
+
+PARTITION_NAME_RE = re.compile(r"^media_files_p(\d{4})(\d{2})$")
+# lock_not_available: lock_timeout истек
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def add_months(month: date, months: int) -> date:
+    """
+    Shift first day of month by number of months
+
+    :param month: first day of month
+    :param months: number of months (may be negative)
+    :return: first day of shifted month
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """
+    Name of media_files partition for month
+
+    :param month: first day of month
+    :return: partition name, e.g. media_files_p202610
+    """
+    return f"media_files_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """
+    Month of media_files partition by its name
+
+    :param name: partition name
+    :return: first day of month or None for default/foreign partitions
+    """
+    match = PARTITION_NAME_RE.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+class MediaPartitionMaintenance:
+    """
+    Keeps media_files partitioned by month small
+
+    Creates partitions ahead of time (otherwise rows land in media_files_default) and compacts old partitions:
+    posted rows are copied to posted_assets (dedup only), then the partition is detached and dropped.
+    Partitions with media still waiting to be posted are kept.
+
+    DDL on media_files waits for the lock at most `lock_timeout_ms`, so a long query of the bot cannot queue
+    every other query on the table behind the maintenance. A partition that hits the timeout is retried next run.
+    Without a default partition it is detached CONCURRENTLY; Postgres forbids that when media_files_default
+    exists, then the plain DETACH takes the short ACCESS EXCLUSIVE lock on media_files.
+    """
+
+    def __init__(
+        self, engine: AsyncEngine, retention_months: int = 3, months_ahead: int = 2, lock_timeout_ms: int = 5000
+    ):
+        self._engine = engine
+        self._retention_months = retention_months
+        self._months_ahead = months_ahead
+        self._lock_timeout_ms = lock_timeout_ms
+
+    async def run(self, today: Optional[date] = None) -> List[str]:
+        """
+        Create upcoming partitions and compact old ones
+
+        :param today: current date (for tests)
+        :return: names of compacted partitions
+        """
+        current_month = (today or date.today()).replace(day=1)
+        try:
+            async with self._engine.begin() as conn:
+                await self._set_lock_timeout(conn)
+                await self._ensure_partitions(conn, current_month)
+        except DBAPIError as e:
+            if not self._is_lock_timeout(e):
+                raise
+            # Партиции создаются заранее на months_ahead месяцев — хватит до следующего запуска
+            logger.warning("Lock timeout while creating media partitions, retrying next run")
+
+        compacted = []
+        cutoff = add_months(current_month, -self._retention_months)
+        for name in await self._list_partitions():
+            month = partition_month(name)
+            if month is None or month >= cutoff:
+                continue
+            try:
+                # Каждая партиция отдельно: ошибка на одной не мешает остальным
+                if await self._compact_partition(name):
+                    compacted.append(name)
+            except DBAPIError as e:
+                if not self._is_lock_timeout(e):
+                    logger.error(f"Error compacting partition {name}: {str(e)}")
+                    continue
+                logger.warning(f"Lock timeout while compacting partition {name}, retrying next run")
+            except Exception as e:
+                logger.error(f"Error compacting partition {name}: {str(e)}")
+
+        logger.info(f"Media partitions maintenance finished, compacted: {compacted}")
+        return compacted
+
+    async def _ensure_partitions(self, conn: AsyncConnection, current_month: date) -> None:
+        for offset in range(self._months_ahead + 1):
+            month = add_months(current_month, offset)
+            await conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF media_files "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                )
+            )
+
+    async def _list_partitions(self) -> List[str]:
+        async with self._engine.connect() as conn:
+            result = await conn.execute(
+                text(
+                    "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = 'media_files'::regclass ORDER BY c.relname"
+                )
+            )
+            return [row[0] for row in result]
+
+    @staticmethod
+    def _is_lock_timeout(error: DBAPIError) -> bool:
+        return getattr(error.orig, "sqlstate", None) == LOCK_NOT_AVAILABLE
+
+    async def _set_lock_timeout(self, conn: AsyncConnection, local: bool = True) -> None:
+        scope = "LOCAL " if local else ""
+        await conn.execute(text(f"SET {scope}lock_timeout = {int(self._lock_timeout_ms)}"))
+
+    async def _compact_partition(self, name: str) -> bool:
+        # Отсоединение, прерванное прошлым запуском (DETACH CONCURRENTLY), архив уже записан
+        detach_pending = await self._detach_pending(name)
+        if not detach_pending:
+            async with self._engine.begin() as conn:
+                await self._set_lock_timeout(conn)
+                has_pending = await conn.scalar(
+                    text(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE processed IS NOT true AND deleted_at IS NULL)")
+                )
+                if has_pending:
+                    logger.info(f"Partition {name} still has unposted media, skipping")
+                    return False
+
+                archived = await conn.execute(
+                    text(
+                        "INSERT INTO posted_assets (media_url, user_id, media_uuid) "
+                        f"SELECT media_url, user_id, media_uuid FROM {name} WHERE deleted_at IS NULL "
+                        "ON CONFLICT (media_url) DO NOTHING"
+                    )
+                )
+            logger.info(f"Partition {name}: archived {archived.rowcount} posted assets")
+
+        if detach_pending:
+            await self._execute_autocommit(f"ALTER TABLE media_files DETACH PARTITION {name} FINALIZE")
+        elif await self._has_default_partition():
+            # CONCURRENTLY недоступен при наличии default-партиции: короткая транзакция с lock_timeout
+            async with self._engine.begin() as conn:
+                await self._set_lock_timeout(conn)
+                await conn.execute(text(f"ALTER TABLE media_files DETACH PARTITION {name}"))
+        else:
+            await self._execute_autocommit(f"ALTER TABLE media_files DETACH PARTITION {name} CONCURRENTLY")
+
+        async with self._engine.begin() as conn:
+            await self._set_lock_timeout(conn)
+            await conn.execute(text(f"DROP TABLE {name}"))
+        logger.info(f"Partition {name} compacted")
+        return True
+
+    async def _execute_autocommit(self, statement: str) -> None:
+        # DETACH ... CONCURRENTLY/FINALIZE нельзя выполнять внутри транзакции
+        async with self._engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await self._set_lock_timeout(conn, local=False)
+            await conn.execute(text(statement))
+
+    async def _detach_pending(self, name: str) -> bool:
+        async with self._engine.connect() as conn:
+            return bool(
+                await conn.scalar(
+                    text("SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(:name)"),
+                    {"name": name},
+                )
+            )
+
+    async def _has_default_partition(self) -> bool:
+        async with self._engine.connect() as conn:
+            return bool(
+                await conn.scalar(
+                    text(
+                        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+                        "WHERE partrelid = 'media_files'::regclass AND partdefid <> 0)"
+                    )
+                )
+            )
+
+
+# Глобальный экземпляр
+media_partition_maintenance = MediaPartitionMaintenance(
+    async_engine, retention_months=MEDIA_PARTITION_RETENTION_MONTHS, lock_timeout_ms=MEDIA_PARTITION_LOCK_TIMEOUT_MS
+)
+
+
+async def media_partitions_job(context: ContextTypes.DEFAULT_TYPE):
+    """Задача для планировщика"""
+    try:
+        await media_partition_maintenance.run()
+    except Exception as e:
+        logger.error(f"Media partitions maintenance failed: {e}")
@@ -1,21 +1,55 @@
-from typing import Generator, List, Dict, Any, Optional
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterator, List, Dict, Any, Optional, Tuple
 
-from sqlalchemy import and_
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import Select, and_, exists, func, or_, select, true, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import selectinload
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from bot.channel_info_cache import channel_info_cache
 from bot.check_permissions import is_user_allowed
-from immich.immich_client import ImmichService, immich_service
+from immich.connection_probe import connection_validator
+from immich.host_guard import host_guards
+from immich.http_pools import host_pools
+from immich.immich_client import ImmichClient, immich_service
 from bot.post_to_channel import MediaPoster
-from postgres.database import SessionLocal
-from postgres.models import User, Album, MediaFile, ImmichHost, ApiKey
+from geo.reverse_geocoder import reverse_geocoder
+from postgres.database import AsyncSessionLocal
+from postgres.models import User, Album, MediaFile, ImmichHost, ApiKey, PostedAsset, BotState, media_capture_date
+from postgres.user_config import user_config_cache
+from cron_jobs.posting_budget import PostingBudget
+from cron_jobs.posting_results import PostingJournalError, posting_results
+from utils.config import (
+    MEDIA_JOB_CONCURRENCY,
+    POST_RUN_MAX_ITEMS,
+    POST_RUN_MAX_BYTES,
+    POST_RUN_MAX_SECONDS,
+    POST_USER_MAX_ITEMS,
+    POST_USER_MAX_BYTES,
+    POST_USER_MAX_SECONDS,
+    POST_STREAM_CHUNK,
+)
 from utils.logger import logger
+from utils.metrics import (
+    MEDIA_BACKLOG,
+    MEDIA_ITEMS_FETCHED,
+    MEDIA_ITEMS_POSTED,
+    MEDIA_JOB_DURATION,
+    MEDIA_JOB_RUNS,
+    MEDIA_STAGE_DURATION,
+)
+from utils.tracing import tracer
+
+# Ключ bot_state: пользователь, на котором предыдущий запуск исчерпал бюджет постинга
+POSTING_CURSOR_KEY = "posting_cursor"
 
 
 class MediaJobs:
     def __init__(self):
-        self.immich_service = ImmichService()
+        # Общий сервис приложения: соединения и проверенные клиенты сохраняются между запусками
+        self.immich_service = immich_service
         self.media_poster = None
 
     async def _init_poster(self, context: ContextTypes.DEFAULT_TYPE = None):
@@ -23,26 +57,44 @@ class MediaJobs:
         if context:
             self.media_poster = MediaPoster(context.application)
 
-    def _get_active_users_batch(self, batch_size: int = 100) -> Generator[User, None, None]:
-        """Генератор для пакетной загрузки активных пользователей с улучшенной обработкой"""
+    async def _get_active_users_batch(
+        self, batch_size: int = 100, start_after_user_id: Optional[int] = None
+    ) -> AsyncGenerator[User, None]:
+        """
+        Асинхронный генератор для пакетной загрузки активных пользователей.
+        С start_after_user_id обход начинается со следующего пользователя и идет по кругу
+        """
         logger.info(f"Starting batch processing with batch_size={batch_size}")
-        offset = 0
-        while True:
-            db = SessionLocal()
-            try:
-                users = (
-                    db.query(User)
-                    .join(ApiKey, and_(ApiKey.user_id == User.user_id, ApiKey.deleted_at.is_(None)))
-                    .join(ImmichHost, and_(ImmichHost.user_id == User.user_id, ImmichHost.deleted_at.is_(None)))
-                    .options(joinedload(User.albums), joinedload(User.channels))
-                    .filter(User.deleted_at.is_(None))
-                    .offset(offset)
-                    .limit(batch_size)
-                    .all()
-                )
+        if start_after_user_id is None:
+            ranges = [true()]
+        else:
+            ranges = [User.user_id > start_after_user_id, User.user_id <= start_after_user_id]
+
+        for user_range in ranges:
+            offset = 0
+            while True:
+                async with AsyncSessionLocal() as db:
+                    try:
+                        users = (
+                            await db.scalars(
+                                select(User)
+                                .join(ApiKey, and_(ApiKey.user_id == User.user_id, ApiKey.deleted_at.is_(None)))
+                                .join(
+                                    ImmichHost,
+                                    and_(ImmichHost.user_id == User.user_id, ImmichHost.deleted_at.is_(None)),
+                                )
+                                .options(selectinload(User.albums), selectinload(User.channels))
+                                .where(User.deleted_at.is_(None), user_range)
+                                .order_by(User.user_id)
+                                .offset(offset)
+                                .limit(batch_size)
+                            )
+                        ).all()
+                    except Exception as e:
+                        logger.error(f"Error fetching users batch (offset={offset}): {str(e)}")
+                        raise
 
                 if not users:
-                    logger.info("No more users to process")
                     break
 
                 for user in users:
@@ -50,112 +102,114 @@ class MediaJobs:
                     yield user
                     offset += 1
 
-            except Exception as e:
-                logger.error(f"Error fetching users batch (offset={offset}): {str(e)}")
-                raise
-            finally:
-                db.close()
-                logger.debug(f"Closed DB session for batch offset={offset}")
+        logger.info("No more users to process")
 
     async def _fetch_new_media(self):
-        """Загрузка новых медиафайлов из Immich с улучшенной обработкой"""
+        """Загрузка новых медиафайлов из Immich, до MEDIA_JOB_CONCURRENCY пользователей параллельно"""
         logger.info("Starting fetch_new_media")
-        processed_users = 0
-        processed_media = 0
+        semaphore = asyncio.Semaphore(MEDIA_JOB_CONCURRENCY)
+        tasks = []
+
+        async def fetch_for_user(user: User) -> int:
+            async with semaphore:
+                return await self._fetch_new_media_for_user(user)
 
         try:
-            for user in self._get_active_users_batch():
+            async for user in self._get_active_users_batch():
                 logger.info(f"fetch_new_media: get_active_users_batch - {user.telegram_id}")
-                db = SessionLocal()  # Новая сессия для каждого пользователя
-                try:
-                    logger.info(f"Processing user {user.user_id}")
-                    processed_users += 1
-
-                    for album in user.albums:
-                        if album.deleted_at:
-                            logger.debug(f"Skipping deleted album {album.album_id}: {album.album_uuid}")
-                            continue
-
-                        logger.info(f"Fetching media for album {album.album_id}: {album.album_uuid}")
-                        try:
-                            logger.info("fetch_new_media: fetch_media_from_immich")
-                            media_items = await self._fetch_media_from_immich(user.user_id, album.album_id)
-                            logger.info(f"Found {len(media_items)} media items")
-
-                            for media_data in media_items:
-                                # Проверяем что файл не существует И принадлежит текущему пользователю
-                                existing_media = (
-                                    db.query(MediaFile)
-                                    .filter(
-                                        MediaFile.media_url == media_data["media_url"],
-                                        # MediaFile.user_id == user.user_id,  # Добавляем проверку user_id
-                                        MediaFile.deleted_at.is_(None),
-                                    )
-                                    .first()
-                                )
-
-                                if not existing_media:
-                                    try:
-                                        # Явно устанавливаем user_id для нового медиафайла
-                                        media_data["user_id"] = user.user_id
-                                        media_data["album_id"] = album.album_id
-                                        media_file = MediaFile(**media_data)
-
-                                        db.add(media_file)
-                                        db.commit()
-                                        processed_media += 1
-                                        logger.info(
-                                            f"Added new media {media_data['media_uuid']} for user {user.user_id}"
-                                        )
-                                    except Exception as e:
-                                        db.rollback()
-                                        logger.error(f"Error saving media {media_data['media_uuid']}: {str(e)}")
-                        except Exception as e:
-                            logger.error(f"Error processing album {album.album_id}: {str(e)}")
-                            db.rollback()
-
-                except Exception as e:
-                    logger.error(f"Error processing user {user.user_id}: {str(e)}")
-                finally:
-                    db.close()
-                    logger.debug(f"Closed DB session for user {user.user_id}")
-
+                tasks.append(asyncio.create_task(fetch_for_user(user)))
         except Exception as e:
             logger.error(f"Fatal error in fetch_new_media: {str(e)}")
         finally:
-            logger.info(f"Completed processing. Users: {processed_users}, Media: {processed_media}")
-
-    async def _fetch_media_from_immich(self, user_id: int, album_id: str) -> List[Dict[str, Any]]:
-        try:
-            logger.info(f"Fetching media for user {user_id}, album {album_id}")
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            processed_media = sum(r for r in results if isinstance(r, int))
+            logger.info(f"Completed processing. Users: {len(tasks)}, Media: {processed_media}")
 
-            # Получаем telegram_id пользователя
-            db = SessionLocal()
+    async def _fetch_new_media_for_user(self, user: User) -> int:
+        """Загрузка новых медиафайлов одного пользователя, возвращает количество добавленных"""
+        processed_media = 0
+        async with AsyncSessionLocal() as db:  # Новая сессия для каждого пользователя
             try:
-                user = db.query(User).filter(User.user_id == user_id, User.deleted_at.is_(None)).first()
-
-                if not user:
-                    logger.error(f"User {user_id} not found")
-                    return []
+                logger.info(f"Processing user {user.user_id}")
 
-                album = (
-                    db.query(Album)
-                    .filter(Album.album_id == album_id, Album.user_id == user.user_id, Album.deleted_at.is_(None))
-                    .first()
-                )
+                for album in user.albums:
+                    if album.deleted_at:
+                        logger.debug(f"Skipping deleted album {album.album_id}: {album.album_uuid}")
+                        continue
 
-                if not album:
-                    logger.error(f"Album {album.album_uuid} not found in database for user {user.telegram_id}")
-                    return []
-
-                logger.info(f"Using telegram_id: {user.telegram_id}, album_id: {album.album_uuid}")
+                    logger.info(f"Fetching media for album {album.album_id}: {album.album_uuid}")
+                    try:
+                        logger.info("fetch_new_media: fetch_media_from_immich")
+                        fetch_started = time.perf_counter()
+                        media_items = await self._fetch_media_from_immich(user, album)
+                        # Альбом скачивается целиком, в трассу каждого медиа попадает только длительность
+                        album_fetch_ms = round((time.perf_counter() - fetch_started) * 1000)
+                        logger.info(f"Found {len(media_items)} media items")
+
+                        new_items = []
+                        for media_data in media_items:
+                            # Проверяем что файл не существует И принадлежит текущему пользователю
+                            # Старые отправленные медиа хранятся только в posted_assets (см. MediaPartitionMaintenance)
+                            existing_media = await db.scalar(
+                                select(
+                                    or_(
+                                        exists().where(
+                                            MediaFile.media_url == media_data["media_url"],
+                                            # MediaFile.user_id == user.user_id,  # Добавляем проверку user_id
+                                            MediaFile.deleted_at.is_(None),
+                                        ),
+                                        exists().where(PostedAsset.media_url == media_data["media_url"]),
+                                    )
+                                )
+                            )
+
+                            if not existing_media:
+                                new_items.append(media_data)
+
+                        # Геокодируем только новые медиа — уже известные не расходуют бюджет геокодера
+                        await self._resolve_locations([item["info"]["location"] for item in new_items])
+
+                        for media_data in new_items:
+                            try:
+                                with tracer.span(
+                                    "discover",
+                                    trace_key=media_data["media_uuid"],
+                                    user_id=user.user_id,
+                                    album_id=album.album_id,
+                                    album_fetch_ms=album_fetch_ms,
+                                ):
+                                    # Явно устанавливаем user_id для нового медиафайла
+                                    media_data["user_id"] = user.user_id
+                                    media_data["album_id"] = album.album_id
+                                    media_file = MediaFile(**media_data)
+
+                                    db.add(media_file)
+                                    await db.commit()
+                                    processed_media += 1
+                                    MEDIA_ITEMS_FETCHED.inc()
+                                    logger.info(f"Added new media {media_data['media_uuid']} for user {user.user_id}")
+                            except Exception as e:
+                                await db.rollback()
+                                logger.error(f"Error saving media {media_data['media_uuid']}: {str(e)}")
+                    except Exception as e:
+                        logger.error(f"Error processing album {album.album_id}: {str(e)}")
+                        await db.rollback()
 
+            except Exception as e:
+                logger.error(f"Error processing user {user.user_id}: {str(e)}")
             finally:
-                db.close()
+                logger.debug(f"Closed DB session for user {user.user_id}")
+        return processed_media
+
+    async def _fetch_media_from_immich(self, user: User, album: Album) -> List[Dict[str, Any]]:
+        """Ассеты альбома из Immich (пользователь и альбом уже загружены _get_active_users_batch)"""
+        try:
+            logger.info(f"Fetching media for user {user.user_id}, album {album.album_id}")
 
             # Диагностика перед вызовом
             logger.info(f"Requesting album info for {album.album_id}: {album.album_uuid}...")
-            album_info = await self.immich_service.get_user_album_info(user.telegram_id, album.album_uuid)
+            with MEDIA_STAGE_DURATION.labels("immich_fetch").time():
+                album_info = await self.immich_service.get_user_album_info(user.telegram_id, album.album_uuid)
             # logger.info(f"Received album info in {time.time() - start_time:.2f} seconds")
             logger.info("Received album info")
 
@@ -169,6 +223,29 @@ class MediaJobs:
             logger.error(f"Error in fetch_media_from_immich: {type(e).__name__}: {str(e)}")
             return []
 
+    async def _resolve_locations(self, locations: List[Dict[str, Any]]) -> None:
+        """
+        Обратное геокодирование местоположений с пометкой geocode_pending (результат кэшируется).
+        Ячейки, отложенные из-за бюджета геокодера, сохраняют пометку и дозаполняются при постинге
+        """
+        pending = [location for location in locations if location.get("geocode_pending")]
+        if not pending:
+            return
+
+        try:
+            await reverse_geocoder.prefetch((location["latitude"], location["longitude"]) for location in pending)
+        except Exception as e:
+            logger.error(f"Error reverse geocoding locations: {str(e)}")
+            return
+
+        for location in pending:
+            if reverse_geocoder.is_cached(location["latitude"], location["longitude"]):
+                location["location_name"] = (
+                    reverse_geocoder.lookup_cached(location["latitude"], location["longitude"])
+                    or location["location_name"]
+                )
+                del location["geocode_pending"]
+
     def _process_assets(self, assets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Обработка массива ассетов из Immich"""
         processed = []
@@ -274,6 +351,10 @@ class MediaJobs:
             location["latitude"], location["longitude"] = exif_info["latitude"], exif_info["longitude"]
             # return f"{exif_info['latitude']}, {exif_info['longitude']}"
 
+            # Города нет в EXIF — название подставит геокодер (см. _resolve_locations)
+            if not exif_info.get("city") and reverse_geocoder.enabled:
+                location["geocode_pending"] = True
+
         return location
 
     # async def fetch_new_media(self):
@@ -302,58 +383,252 @@ class MediaJobs:
     #     finally:
     #         db.close()
 
+    @staticmethod
+    def _unprocessed_media_query(user_id: int, after: Optional[Tuple[Optional[str], int]] = None) -> Select:
+        """
+        Неотправленные медиа пользователя с датой съемки в порядке съемки (сортировка по индексу).
+        after — (дата съемки, media_id) последней прочитанной медиа, следующая порция начинается после нее
+        """
+        query = (
+            select(MediaFile, media_capture_date)
+            .where(
+                MediaFile.user_id == user_id,
+                MediaFile.processed.is_(False),
+                MediaFile.deleted_at.is_(None),
+            )
+            .order_by(media_capture_date, MediaFile.media_id)
+        )
+        if after is None:
+            return query
+
+        after_date, after_id = after
+        if after_date is None:
+            # Медиа без даты идут последними (NULLS LAST)
+            return query.where(media_capture_date.is_(None), MediaFile.media_id > after_id)
+        return query.where(
+            or_(
+                tuple_(media_capture_date, MediaFile.media_id) > tuple_(after_date, after_id),
+                media_capture_date.is_(None),
+            )
+        )
+
+    async def _unprocessed_media(self, user_id: int) -> AsyncIterator[MediaFile]:
+        """
+        Очередь пользователя порциями по POST_STREAM_CHUNK: keyset-пагинация, каждая порция читается в своей
+        короткой транзакции, между порциями соединение не удерживается
+        """
+        after = None
+        while True:
+            async with AsyncSessionLocal() as db:
+                page = (await db.execute(self._unprocessed_media_query(user_id, after).limit(POST_STREAM_CHUNK))).all()
+            for media, _ in page:
+                yield media
+            if len(page) < POST_STREAM_CHUNK:
+                return
+            last, last_date = page[-1]
+            after = (last_date, last.media_id)
+
     async def _post_media_to_channels(self):
-        """Постинг медиа в каналы пользователей"""
+        """Постинг медиа в каналы пользователей в пределах бюджетов запуска и пользователя"""
         if not self.media_poster:
             logger.error("MediaPoster not initialized")
             return
 
-        db: Session = SessionLocal()
+        # Результаты, не записанные упавшим запуском, — иначе эти медиа будут отправлены повторно
+        await posting_results.replay()
+
+        run_budget = PostingBudget(POST_RUN_MAX_ITEMS, POST_RUN_MAX_BYTES, POST_RUN_MAX_SECONDS)
         try:
-            for user in self._get_active_users_batch():
-                channel = next((c for c in user.channels if not c.deleted_at), None)
-                if not channel:
-                    continue
-
-                for media in (
-                    db.query(MediaFile)
-                    .filter(
-                        MediaFile.user_id == user.user_id,
-                        MediaFile.processed.is_(False),
-                        MediaFile.deleted_at.is_(None),
-                    )
-                    .all()
-                ):
-                    try:
-                        success = await self.media_poster.post_to_channel(user, media, channel.telegram_channel_id)
-                        media.posted_to_channel = success
-                        media.processed = True
-                        media.error = None if success else "Posting failed"
-                        db.commit()
-                    except Exception as e:
-                        logger.error(f"Error posting media {media.media_id}: {str(e)}")
-                        db.rollback()
+            await self._post_backlogs(run_budget)
         finally:
-            db.close()
+            await posting_results.flush()
+
+    async def _post_backlogs(self, run_budget: PostingBudget) -> None:
+        """
+        Обход пользователей и постинг их очередей. Обход начинается после пользователя, на котором предыдущий
+        запуск исчерпал бюджет, — иначе пользователи в конце списка никогда не получали бы очередь
+        """
+        last_user_id = None
+        async for user in self._get_active_users_batch(start_after_user_id=await self._load_posting_cursor()):
+            if run_budget.exhausted():
+                logger.info(f"Posting run budget exhausted: {run_budget.items} items, {run_budget.bytes} bytes")
+                break
+
+            channel = next((c for c in user.channels if not c.deleted_at), None)
+            if not channel:
+                continue
+
+            config = await user_config_cache.get(user.telegram_id)
+            host_url = ImmichClient.host_key(config.host_url) if config and config.host_url else None
+            if host_url and not host_guards.available(host_url):
+                logger.warning(f"Immich host of user {user.user_id} is unavailable, skipping posting")
+                continue
+
+            if not await self._bot_can_post(channel.telegram_channel_id):
+                # Медиа остаются в очереди до возвращения прав администратора
+                logger.warning(f"Bot is not admin in channel of user {user.user_id}, skipping posting")
+                continue
+
+            # Очередь читается порциями в коротких транзакциях, результаты пишутся пачками в своих сессиях
+            media_stream = self._unprocessed_media(user.user_id)
+            last_user_id = user.user_id
+            try:
+                await self._post_user_backlog(
+                    user, channel.telegram_channel_id, media_stream, run_budget, host_url=host_url
+                )
+            finally:
+                await media_stream.aclose()
+
+        if run_budget.exhausted() and last_user_id is not None:
+            await self._save_posting_cursor(last_user_id)
+
+    @staticmethod
+    async def _load_posting_cursor() -> Optional[int]:
+        """Пользователь, на котором предыдущий запуск исчерпал бюджет (bot_state), None — обход с начала"""
+        try:
+            async with AsyncSessionLocal() as db:
+                value = await db.scalar(select(BotState.value).where(BotState.key == POSTING_CURSOR_KEY))
+        except Exception as e:
+            logger.error(f"Error loading posting cursor: {str(e)}")
+            return None
+        return value["user_id"] if value else None
+
+    @staticmethod
+    async def _save_posting_cursor(user_id: int) -> None:
+        """Запоминание пользователя, на котором исчерпан бюджет запуска"""
+        value = {"user_id": user_id}
+        statement = insert(BotState).values(key=POSTING_CURSOR_KEY, value=value)
+        statement = statement.on_conflict_do_update(
+            index_elements=[BotState.key], set_={"value": value, "updated_at": func.now()}
+        )
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(statement)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error saving posting cursor: {str(e)}")
+
+    async def _post_user_backlog(
+        self,
+        user: User,
+        telegram_channel_id: int,
+        media_stream: AsyncIterator[MediaFile],
+        run_budget: PostingBudget,
+        host_url: Optional[str] = None,
+    ) -> None:
+        """Постинг очереди одного пользователя, пока не исчерпан бюджет пользователя или запуска"""
+        user_budget = PostingBudget(POST_USER_MAX_ITEMS, POST_USER_MAX_BYTES, POST_USER_MAX_SECONDS)
+        async for media in media_stream:
+            if user_budget.exhausted() or run_budget.exhausted():
+                logger.info(f"Posting budget exhausted for user {user.user_id}, rest is left for next run")
+                break
+
+            try:
+                with tracer.span(
+                    "post_media",
+                    trace_key=media.media_uuid,
+                    user_id=user.user_id,
+                    media_id=media.media_id,
+                    media_type=media.media_type,
+                    file_size=media.file_size or 0,
+                ) as span:
+                    await posting_results.begin(media.media_id, media.created_at)
+                    try:
+                        await self._backfill_location(media)
+                        success = await self.media_poster.post_to_channel(user, media, telegram_channel_id)
+                    except Exception:
+                        await posting_results.release(media.media_id, media.created_at)
+                        raise
+                    span.attributes["success"] = success
+                    if not success and host_url and not host_guards.available(host_url):
+                        # Скачать не удалось, потому что хост Immich лег — медиа остается в очереди
+                        await posting_results.release(media.media_id, media.created_at)
+                        logger.warning(
+                            f"Immich host of user {user.user_id} became unavailable, rest is left for next run"
+                        )
+                        break
+                    if not success and not await self._bot_can_post(telegram_channel_id):
+                        # Права администратора отозвали во время запуска — медиа остается в очереди
+                        await posting_results.release(media.media_id, media.created_at)
+                        logger.warning(
+                            f"Bot lost admin rights in channel of user {user.user_id}, rest is left for next run"
+                        )
+                        break
+                    user_budget.consume(media.file_size)
+                    run_budget.consume(media.file_size)
+                    with tracer.span("record_result"):
+                        await posting_results.record(media.media_id, media.created_at, success)
+                    MEDIA_ITEMS_POSTED.labels("success" if success else "failed").inc()
+            except PostingJournalError:
+                # Без журнала упавший запуск отправит медиа повторно — прерываем постинг
+                raise
+            except Exception as e:
+                logger.error(f"Error posting media {media.media_id}: {str(e)}")
+
+    async def _backfill_location(self, media: MediaFile) -> None:
+        """Дозаполнение местоположения, отложенного при загрузке (бюджет геокодера был исчерпан)"""
+        location = (media.info or {}).get("location") or {}
+        if not location.get("geocode_pending"):
+            return
+
+        location = dict(location)
+        await self._resolve_locations([location])
+        # Новый словарь вместо изменения на месте — объект отсоединен от сессии, в БД не пишем
+        media.info = {**media.info, "location": location}
+
+    async def _bot_can_post(self, telegram_channel_id: int) -> bool:
+        """Бот не лишен прав администратора в канале (неизвестный статус не мешает постингу)"""
+        try:
+            channel_info = await channel_info_cache.get(self.media_poster.app.bot, telegram_channel_id)
+        except Exception as e:
+            logger.warning(f"Failed to get info of channel {telegram_channel_id}: {str(e)}")
+            return True
+        return channel_info.bot_is_admin is not False
+
+    @staticmethod
+    async def _update_backlog_metric() -> None:
+        """Размер очереди на постинг после запуска (по частичному индексу неотправленных медиа)"""
+        try:
+            async with AsyncSessionLocal() as db:
+                backlog = await db.scalar(
+                    select(func.count())
+                    .select_from(MediaFile)
+                    .where(MediaFile.processed.is_(False), MediaFile.deleted_at.is_(None))
+                )
+            MEDIA_BACKLOG.set(backlog or 0)
+        except Exception as e:
+            logger.error(f"Error counting posting backlog: {str(e)}")
 
     async def run_media_job(self, context: ContextTypes.DEFAULT_TYPE = None):
         """Основная задача обработки медиа"""
         logger.info("init_poster")
         await self._init_poster(context)
+        reverse_geocoder.start_run()
+        result = "success"
+        started = time.perf_counter()
         try:
             logger.info("fetch_new_media")
             await self._fetch_new_media()
             logger.info("post_media_to_channels")
             await self._post_media_to_channels()
         except Exception as e:
+            result = "error"
             logger.error(f"Media job error: {str(e)}")
         finally:
-            await self.immich_service.close_all()
+            MEDIA_JOB_RUNS.labels(result).inc()
+            MEDIA_JOB_DURATION.observe(time.perf_counter() - started)
+            await self._update_backlog_metric()
+            logger.info(
+                f"Immich connection pools: {host_pools.stats()}, hosts: {host_guards.stats()}, "
+                f"connection checks: {connection_validator.get_stats()}, "
+                f"cached clients: {len(self.immich_service.active_clients)}"
+            )
 
 
 # Глобальный экземпляр для использования в задачах
 media_jobs = MediaJobs()
 
+
 async def send_posting_report_to_chat(text: str, context: ContextTypes.DEFAULT_TYPE):
     if context.job and context.job.data and "chat_id" in context.job.data:
         try:
@@ -369,7 +644,6 @@ async def posting_media_to_channel_job(context: ContextTypes.DEFAULT_TYPE):
     """Задача для планировщика"""
     try:
         await send_posting_report_to_chat("🔄 Запускаю обработку медиа...", context)
-        await immich_service.start()
         await media_jobs.run_media_job(context)
         await send_posting_report_to_chat("✅ Обработка медиа завершена", context)
     except Exception as e:
@@ -387,6 +661,7 @@ async def manual_trigger_posting_media_to_channel_job(update: Update, context: C
         posting_media_to_channel_job,
         when=0,
         name="manual_media_job",
-        data={"chat_id": update.effective_chat.id,}
+        data={
+            "chat_id": update.effective_chat.id,
+        },
     )
-
@@ -0,0 +1,41 @@
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class PostingBudget:
+    """
+    Limit of posting work in items, bytes and seconds (0 — no limit)
+
+    The rest of the backlog stays unprocessed and is picked up by the next run.
+    """
+
+    max_items: int = 0
+    max_bytes: int = 0
+    max_seconds: float = 0
+    items: int = 0
+    bytes: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def exhausted(self) -> bool:
+        """
+        Check whether any of the limits is reached
+
+        :return: True/False
+        """
+        if self.max_items and self.items >= self.max_items:
+            return True
+        if self.max_bytes and self.bytes >= self.max_bytes:
+            return True
+        return bool(self.max_seconds) and time.monotonic() - self.started_at >= self.max_seconds
+
+    def consume(self, size: Optional[int]) -> None:
+        """
+        Account one posted item
+
+        :param size: file size in bytes (None if unknown)
+        :return: None
+        """
+        self.items += 1
+        self.bytes += size or 0
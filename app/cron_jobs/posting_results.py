@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, TIMESTAMP, Text, column, update, values
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from postgres.database import AsyncSessionLocal
+from postgres.models import MediaFile
+from utils.config import CACHE_BACKEND, POST_RESULTS_JOURNAL, POST_RESULTS_FLUSH_ITEMS, POST_RESULTS_FLUSH_SECONDS
+from utils.logger import logger
+
+# media_id, created_at (ключ партиции), error
+PostingResult = Tuple[int, datetime, Optional[str]]
+
+# Служебные строки журнала: медиа отправляется / отправка не состоялась
+SENDING = "sending"
+RELEASED = "released"
+INTERRUPTED_ERROR = "Interrupted while posting"
+
+
+class PostingJournalError(Exception):
+    """Journal could not be written: posting must stop, otherwise a crash may repost media"""
+
+
+class PostingResultRecorder:
+    """
+    Batched recording of posting results
+
+    Results are written to media_files by a single `UPDATE ... FROM (VALUES ...)` every `flush_items` items or
+    `flush_seconds` seconds instead of a commit per item. Until then each result is appended to a local journal
+    (fsync after every line), so after a crash the next run replays the journal before posting and nothing is
+    reposted. Updates are idempotent, replaying an already flushed batch is harmless.
+
+    Before the Telegram call `begin` journals a "sending" marker. A marker left without result or `release` means
+    the process died mid-send: replay marks such media processed with an error instead of sending it again.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        journal_path: str,
+        flush_items: int = 50,
+        flush_seconds: float = 10.0,
+    ):
+        self._session_factory = session_factory
+        self._journal_path = journal_path
+        self._flush_items = flush_items
+        self._flush_seconds = flush_seconds
+        self._pending: List[PostingResult] = []
+        self._sending: Dict[int, datetime] = {}
+        self._last_flush = time.monotonic()
+
+    async def begin(self, media_id: int, created_at: datetime) -> None:
+        """
+        Journal that media is being sent (call right before the Telegram call)
+
+        :param media_id: media id
+        :param created_at: media created_at (partition key)
+        :return: None
+        """
+        await self._append_to_journal([[SENDING, media_id, created_at.isoformat()]])
+        self._sending[media_id] = created_at
+
+    async def release(self, media_id: int, created_at: datetime) -> None:
+        """
+        Journal that media was not sent and stays in the queue (after `begin`, instead of `record`)
+
+        :param media_id: media id
+        :param created_at: media created_at (partition key)
+        :return: None
+        """
+        await self._append_to_journal([[RELEASED, media_id, created_at.isoformat()]])
+        self._sending.pop(media_id, None)
+
+    async def record(self, media_id: int, created_at: datetime, success: bool) -> None:
+        """
+        Record result of posting (call right after the Telegram call)
+
+        :param media_id: media id
+        :param created_at: media created_at (partition key)
+        :param success: whether media was posted
+        :return: None
+        """
+        result = (media_id, created_at, None if success else "Posting failed")
+        await self._append_to_journal([_result_line(result)])
+        self._sending.pop(media_id, None)
+        self._pending.append(result)
+
+        if len(self._pending) >= self._flush_items or time.monotonic() - self._last_flush >= self._flush_seconds:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Write pending results to db, journal is truncated only after commit
+
+        :return: None
+        """
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+
+        batch = list(self._pending)
+        try:
+            await self._write(batch)
+        except Exception as e:
+            # Результаты остаются в журнале и очереди — запишем при следующем flush или replay
+            logger.error(f"Error flushing {len(batch)} posting results: {str(e)}")
+            return
+
+        self._pending = self._pending[len(batch) :]
+        await self._rewrite_journal()
+        logger.debug(f"Flushed {len(batch)} posting results")
+
+    async def replay(self) -> None:
+        """
+        Write results left in journal by a crashed run (call before posting)
+
+        :return: None
+        """
+        journal = self._read_journal()
+        if not journal:
+            return
+
+        interrupted = sum(1 for _, _, error in journal if error == INTERRUPTED_ERROR)
+        if interrupted:
+            logger.warning(f"{interrupted} media were interrupted while posting, marking them processed")
+        logger.info(f"Replaying {len(journal)} posting results from journal")
+        # Ошибка пробрасывается: постить без записи прошлых результатов — значит отправить их повторно
+        await self._write(journal)
+        await self._rewrite_journal()
+
+    async def _write(self, batch: List[PostingResult]) -> None:
+        results = values(
+            column("media_id", Integer),
+            column("created_at", TIMESTAMP),
+            column("error", Text),
+            name="results",
+        ).data(batch)
+        async with self._session_factory() as db:
+            await db.execute(
+                update(MediaFile)
+                .where(MediaFile.media_id == results.c.media_id, MediaFile.created_at == results.c.created_at)
+                .values(processed=True, error=results.c.error)
+            )
+            await db.commit()
+
+    async def _append_to_journal(self, lines: List[List[Any]]) -> None:
+        # fsync может занять десятки миллисекунд на медленном диске — не блокируем цикл событий
+        try:
+            await asyncio.to_thread(self._write_journal, self._journal_path, "a", lines)
+        except OSError as e:
+            raise PostingJournalError(f"Cannot write posting journal {self._journal_path}: {str(e)}") from e
+
+    async def _rewrite_journal(self) -> None:
+        # Незаписанные результаты и незавершенные отправки
+        lines = [_result_line(result) for result in self._pending]
+        lines += [[SENDING, media_id, created_at.isoformat()] for media_id, created_at in self._sending.items()]
+        tmp_path = f"{self._journal_path}.tmp"
+        try:
+            await asyncio.to_thread(self._write_journal, tmp_path, "w", lines)
+            os.replace(tmp_path, self._journal_path)
+        except OSError as e:
+            raise PostingJournalError(f"Cannot write posting journal {self._journal_path}: {str(e)}") from e
+
+    @staticmethod
+    def _write_journal(path: str, mode: str, lines: List[List[Any]]) -> None:
+        with open(path, mode, encoding="utf-8") as journal:
+            for line in lines:
+                journal.write(json.dumps(line) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _read_journal(self) -> List[PostingResult]:
+        if not os.path.exists(self._journal_path):
+            return []
+
+        results = []
+        sending: Dict[int, datetime] = {}
+        with open(self._journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                    if entry[0] in (SENDING, RELEASED):
+                        kind, media_id, created_at = entry
+                        if kind == SENDING:
+                            sending[media_id] = datetime.fromisoformat(created_at)
+                        else:
+                            sending.pop(media_id, None)
+                        continue
+                    media_id, created_at, error = entry
+                    results.append((media_id, datetime.fromisoformat(created_at), error))
+                    sending.pop(media_id, None)
+                except (ValueError, TypeError, IndexError):
+                    # Недописанная строка при падении во время записи
+                    logger.warning(f"Skipping broken posting journal line: {line!r}")
+
+        # Процесс упал во время отправки: дошло ли медиа до Telegram, неизвестно — не отправляем повторно
+        results += [(media_id, created_at, INTERRUPTED_ERROR) for media_id, created_at in sending.items()]
+        return results
+
+
+def _result_line(result: PostingResult) -> List[Any]:
+    media_id, created_at, error = result
+    return [media_id, created_at.isoformat(), error]
+
+
+def create_posting_result_recorder() -> PostingResultRecorder:
+    """
+    Build recorder with journal from POST_RESULTS_JOURNAL
+
+    :return: posting result recorder
+    """
+    os.makedirs(os.path.dirname(POST_RESULTS_JOURNAL) or ".", exist_ok=True)
+    # Журнал локален для реплики, другие реплики видят результат только в БД — там пишем каждый результат сразу
+    flush_items = 1 if CACHE_BACKEND == "redis" else POST_RESULTS_FLUSH_ITEMS
+    return PostingResultRecorder(
+        AsyncSessionLocal,
+        POST_RESULTS_JOURNAL,
+        flush_items=flush_items,
+        flush_seconds=POST_RESULTS_FLUSH_SECONDS,
+    )
+
+
+# Глобальный экземпляр
+posting_results = create_posting_result_recorder()
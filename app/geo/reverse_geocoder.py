@@ -0,0 +1,319 @@
+import asyncio
+import csv
+import math
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional, Dict, Iterable, List, Tuple
+
+from geopy.exc import GeopyError
+from geopy.geocoders import Nominatim
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from postgres.database import AsyncSessionLocal
+from postgres.models import GeoCache
+from utils.config import (
+    GEOCODER_BACKEND,
+    GEOCODER_DATASET_PATH,
+    GEOCODER_GRID_PRECISION,
+    GEOCODER_MAX_CELLS_PER_RUN,
+    GEOCODER_MEMORY_CELLS,
+    GEOCODER_MIN_DELAY,
+    GEOCODER_USER_AGENT,
+)
+from utils.logger import logger
+
+
+def _join_location_parts(*parts: Optional[str]) -> Optional[str]:
+    """Склеивает части локации в формате `city, state, country` (как у EXIF из Immich)"""
+    name = ", ".join(p for p in parts if p)
+    return name or None
+
+
+class NominatimBackend:
+    """Reverse geocoding through OpenStreetMap Nominatim (network, rate limited)"""
+
+    name = "nominatim"
+    rate_limited = True
+
+    def __init__(self, user_agent: str, timeout: float = 10.0):
+        self._geocoder = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    async def reverse(self, lat: float, lon: float) -> Optional[str]:
+        """
+        Resolve place name for coordinates
+
+        :param lat: latitude
+        :param lon: longitude
+        :return: place name or None if nothing was found
+        """
+        # geopy синхронный, поэтому не блокируем event loop
+        location = await asyncio.to_thread(self._geocoder.reverse, (lat, lon), exactly_one=True, language="ru", zoom=10)
+        if not location:
+            return None
+
+        address = location.raw.get("address", {})
+        city = address.get("city") or address.get("town") or address.get("village") or address.get("hamlet")
+        return _join_location_parts(city, address.get("state"), address.get("country"))
+
+
+class OfflineBackend:
+    """
+    Reverse geocoding against a local GeoNames dump (cities500.txt / cities15000.txt etc.)
+
+    Dataset is loaded lazily and indexed by 1x1 degree buckets, so a lookup only scans neighbouring buckets.
+    """
+
+    name = "offline"
+    rate_limited = False
+
+    # Колонки формата GeoNames: name, latitude, longitude, country code
+    _NAME_COL, _LAT_COL, _LON_COL, _COUNTRY_COL = 1, 4, 5, 8
+
+    def __init__(self, dataset_path: str, max_distance_km: float = 50.0):
+        self._dataset_path = dataset_path
+        self._max_distance_km = max_distance_km
+        self._buckets: Optional[Dict[Tuple[int, int], List[Tuple[float, float, str]]]] = None
+        self._load_lock = asyncio.Lock()
+
+    def _load(self) -> Dict[Tuple[int, int], List[Tuple[float, float, str]]]:
+        buckets: Dict[Tuple[int, int], List[Tuple[float, float, str]]] = defaultdict(list)
+        with open(self._dataset_path, encoding="utf-8", newline="") as f:
+            for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                try:
+                    lat, lon = float(row[self._LAT_COL]), float(row[self._LON_COL])
+                    name = _join_location_parts(row[self._NAME_COL], row[self._COUNTRY_COL])
+                except (IndexError, ValueError):
+                    continue
+                buckets[(math.floor(lat), math.floor(lon))].append((lat, lon, name))
+
+        logger.info(f"Loaded offline geocoding dataset {self._dataset_path}: {len(buckets)} buckets")
+        return buckets
+
+    def nearest(self, lat: float, lon: float) -> Optional[str]:
+        """
+        Find the nearest known place (dataset must be loaded)
+
+        :param lat: latitude
+        :param lon: longitude
+        :return: place name or None if nothing is within max distance
+        """
+        best_name, best_dist = None, self._max_distance_km
+        cos_lat = math.cos(math.radians(lat))
+        base_lat, base_lon = math.floor(lat), math.floor(lon)
+
+        for d_lat in (-1, 0, 1):
+            for d_lon in (-1, 0, 1):
+                for p_lat, p_lon, name in self._buckets.get((base_lat + d_lat, base_lon + d_lon), ()):
+                    # Равнопромежуточная проекция — достаточно точно на расстояниях в десятки км
+                    dist = 111.2 * math.hypot(p_lat - lat, (p_lon - lon) * cos_lat)
+                    if dist < best_dist:
+                        best_name, best_dist = name, dist
+
+        return best_name
+
+    async def reverse(self, lat: float, lon: float) -> Optional[str]:
+        """
+        Resolve place name for coordinates
+
+        :param lat: latitude
+        :param lon: longitude
+        :return: place name or None if nothing was found
+        """
+        if self._buckets is None:
+            async with self._load_lock:
+                if self._buckets is None:
+                    self._buckets = await asyncio.to_thread(self._load)
+        return self.nearest(lat, lon)
+
+
+class ReverseGeocoder:
+    """
+    Reverse geocoder with a two-level cache (memory + `geo_cache` table).
+
+    Coordinates are snapped to a grid cell (`grid_precision` decimal places), so photos taken at the same place
+    share one cache entry. Network lookups happen only in `prefetch` (at ingest or posting time),
+    `lookup_cached` never leaves the process. At most `max_cells_per_run` cells are looked up between
+    `start_run` calls (0 — no limit), the rest stay uncached until the next run. The memory cache keeps at most
+    `max_memory_cells` recently used cells, evicted cells are loaded from `geo_cache` again.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        grid_precision: int = 2,
+        min_delay_seconds: float = 1.0,
+        max_cells_per_run: int = 0,
+        max_memory_cells: int = 10000,
+    ):
+        self._backend = backend
+        self._precision = grid_precision
+        self._min_delay = min_delay_seconds
+        self._max_cells_per_run = max_cells_per_run
+        self._cells_this_run = 0
+        self._max_memory_cells = max_memory_cells
+        self._names: OrderedDict[str, Optional[str]] = OrderedDict()
+        self._rate_lock = asyncio.Lock()
+        self._last_call = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._backend is not None
+
+    def cell_key(self, lat: float, lon: float) -> str:
+        """
+        Grid cell key for coordinates
+
+        :param lat: latitude
+        :param lon: longitude
+        :return: cell key, e.g. "55.76,37.62"
+        """
+        return f"{float(lat):.{self._precision}f},{float(lon):.{self._precision}f}"
+
+    def lookup_cached(self, lat: float, lon: float) -> Optional[str]:
+        """
+        Get place name from memory cache only (never makes network or DB calls)
+
+        :param lat: latitude
+        :param lon: longitude
+        :return: place name or None
+        """
+        key = self.cell_key(lat, lon)
+        if key not in self._names:
+            return None
+        self._names.move_to_end(key)
+        return self._names[key]
+
+    def is_cached(self, lat: float, lon: float) -> bool:
+        """
+        Check that the cell of coordinates is resolved (name may be None if nothing was found)
+
+        :param lat: latitude
+        :param lon: longitude
+        :return: True if the cell is in memory cache
+        """
+        return self.cell_key(lat, lon) in self._names
+
+    def _remember(self, names: Dict[str, Optional[str]]) -> None:
+        """Put names into memory cache, evicting least recently used cells over the limit"""
+        for key, name in names.items():
+            self._names[key] = name
+            self._names.move_to_end(key)
+        while len(self._names) > self._max_memory_cells:
+            self._names.popitem(last=False)
+
+    def start_run(self) -> None:
+        """
+        Reset the per-run lookup budget (called at the start of every media job run)
+
+        :return: None
+        """
+        self._cells_this_run = 0
+
+    async def prefetch(self, coords: Iterable[Tuple[float, float]]) -> None:
+        """
+        Resolve and cache names for all cells of given coordinates which are not cached yet
+
+        :param coords: iterable of (latitude, longitude)
+        :return: None
+        """
+        if not self.enabled:
+            return
+
+        missing = {self.cell_key(lat, lon) for lat, lon in coords} - self._names.keys()
+        if not missing:
+            return
+
+        self._remember(await self._load_from_db(list(missing)))
+
+        pending = sorted(key for key in missing if key not in self._names)
+        if self._max_cells_per_run:
+            allowed = max(self._max_cells_per_run - self._cells_this_run, 0)
+            if len(pending) > allowed:
+                logger.info(
+                    f"Geocoding budget of {self._max_cells_per_run} cells per run reached, "
+                    f"{len(pending) - allowed} cells deferred to the next run"
+                )
+                pending = pending[:allowed]
+        # Неудачные запросы тоже расходуют бюджет — они так же нагружают сервис
+        self._cells_this_run += len(pending)
+
+        resolved: Dict[str, Optional[str]] = {}
+        for key in pending:
+            # Геокодим центр ячейки, а не исходную точку — имя относится ко всей ячейке
+            lat, lon = (float(v) for v in key.split(","))
+            try:
+                resolved[key] = await self._reverse_rate_limited(lat, lon)
+            except (GeopyError, OSError) as e:
+                # Не кэшируем сетевые ошибки — попробуем в следующий запуск
+                logger.warning(f"Reverse geocoding failed for cell {key}: {str(e)}")
+
+        if resolved:
+            self._remember(resolved)
+            await self._save_to_db(resolved)
+            logger.info(f"Reverse geocoded {len(resolved)} new cells with backend {self._backend.name}")
+
+    async def _reverse_rate_limited(self, lat: float, lon: float) -> Optional[str]:
+        if not self._backend.rate_limited:
+            return await self._backend.reverse(lat, lon)
+
+        async with self._rate_lock:
+            delay = self._last_call + self._min_delay - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await self._backend.reverse(lat, lon)
+            finally:
+                self._last_call = time.monotonic()
+
+    async def _load_from_db(self, keys: List[str]) -> Dict[str, Optional[str]]:
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = await db.execute(
+                    select(GeoCache.cell_key, GeoCache.location_name).where(GeoCache.cell_key.in_(keys))
+                )
+                return {cell_key: location_name for cell_key, location_name in rows}
+        except Exception as e:
+            logger.error(f"Error loading geo cache: {str(e)}")
+            return {}
+
+    async def _save_to_db(self, names: Dict[str, Optional[str]]) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                stmt = insert(GeoCache).values(
+                    [{"cell_key": k, "location_name": v, "backend": self._backend.name} for k, v in names.items()]
+                )
+                await db.execute(stmt.on_conflict_do_nothing(index_elements=["cell_key"]))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error saving geo cache: {str(e)}")
+
+
+def create_reverse_geocoder() -> ReverseGeocoder:
+    """
+    Build reverse geocoder from config (GEOCODER_BACKEND: nominatim / offline / none)
+
+    :return: reverse geocoder
+    """
+    backend = None
+    if GEOCODER_BACKEND == "nominatim":
+        backend = NominatimBackend(user_agent=GEOCODER_USER_AGENT)
+    elif GEOCODER_BACKEND == "offline":
+        if GEOCODER_DATASET_PATH:
+            backend = OfflineBackend(GEOCODER_DATASET_PATH)
+        else:
+            logger.error("GEOCODER_BACKEND=offline requires GEOCODER_DATASET_PATH, reverse geocoding disabled")
+    elif GEOCODER_BACKEND != "none":
+        logger.error(f"Unknown GEOCODER_BACKEND: {GEOCODER_BACKEND}, reverse geocoding disabled")
+
+    return ReverseGeocoder(
+        backend,
+        grid_precision=GEOCODER_GRID_PRECISION,
+        min_delay_seconds=GEOCODER_MIN_DELAY,
+        max_cells_per_run=GEOCODER_MAX_CELLS_PER_RUN,
+        max_memory_cells=GEOCODER_MEMORY_CELLS,
+    )
+
+
+# Глобальный экземпляр
+reverse_geocoder = create_reverse_geocoder()
@@ -0,0 +1,128 @@
+import hashlib
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict
+
+from utils.config import IMMICH_PROBE_FAIL_BACKOFF, IMMICH_PROBE_MAX_FAIL_BACKOFF, IMMICH_PROBE_OK_TTL
+from utils.kv_store import create_kv_store
+from utils.logger import logger
+
+
+@dataclass
+class ProbeStats:
+    probes: int = 0
+    probe_failures: int = 0
+    probe_seconds: float = 0.0
+    cached_ok: int = 0  # Проверка пропущена: недавно была успешной
+    cached_failed: int = 0  # Отказ без запроса: не истек backoff после неудачи
+
+
+class ConnectionValidator:
+    """
+    Cached `/api/users/me` check of Immich connection by (host, API key hash)
+
+    A success is trusted for `ok_ttl` seconds. After a failure the pair is rejected without a request until
+    the backoff expires; the backoff doubles with every failure in a row up to `max_fail_backoff`.
+    Storage is pluggable (memory / Redis, see `create_kv_store`), so replicas share results.
+    """
+
+    def __init__(
+        self,
+        store,
+        ok_ttl: float = 600,
+        fail_backoff: float = 30,
+        max_fail_backoff: float = 900,
+        probe_timeout: float = 5,
+    ):
+        self._store = store
+        self._probe_timeout = probe_timeout
+        self._ok_ttl = ok_ttl
+        self._fail_backoff = fail_backoff
+        self._max_fail_backoff = max_fail_backoff
+        self.stats = ProbeStats()
+
+    @staticmethod
+    def cache_key(base_url: str, api_key: str) -> str:
+        """
+        Cache key of host and API key (the key itself is not stored)
+
+        :param base_url: normalized Immich URL
+        :param api_key: Immich API key
+        :return: cache key
+        """
+        return f"{base_url}|{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+
+    async def validate(self, client) -> bool:
+        """
+        Check that client can reach Immich with its API key
+
+        :param client: ImmichClient
+        :return: True/False
+        """
+        key = self.cache_key(client.base_url, client.api_key)
+        cached = await self._store.get(key)
+        if cached and cached["ok"]:
+            self.stats.cached_ok += 1
+            return True
+        if cached and time.time() < cached["retry_at"]:
+            self.stats.cached_failed += 1
+            return False
+
+        ok = await self._probe(client)
+        if ok:
+            await self._store.set(key, {"ok": True}, self._ok_ttl)
+        else:
+            failures = (cached or {}).get("failures", 0) + 1
+            backoff = min(self._fail_backoff * 2 ** (failures - 1), self._max_fail_backoff)
+            # Запись живет дольше backoff, чтобы серия неудач продолжала удваивать его
+            await self._store.set(
+                key,
+                {"ok": False, "failures": failures, "retry_at": time.time() + backoff},
+                self._max_fail_backoff * 2,
+            )
+            logger.warning(f"Immich connection check failed for {client.base_url}, next try in {backoff:.0f}s")
+        return ok
+
+    async def forget(self, base_url: str, api_key: str) -> None:
+        """
+        Drop cached result (e.g. API returned 401 for a validated key)
+
+        :param base_url: normalized Immich URL
+        :param api_key: Immich API key
+        :return: None
+        """
+        await self._store.delete(self.cache_key(base_url, api_key))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Probe counters
+
+        :return: dict of counters
+        """
+        return asdict(self.stats)
+
+    async def _probe(self, client) -> bool:
+        self.stats.probes += 1
+        started = time.monotonic()
+        try:
+            # Таймаут httpx: зависший хост засчитывается circuit breaker как сбой, а не как отмена
+            response = await client.request("GET", "/api/users/me", timeout=self._probe_timeout)
+            ok = response.status_code == 200
+        except Exception as e:
+            logger.warning(f"Connection test failed: {str(e)}")
+            ok = False
+        finally:
+            self.stats.probe_seconds += time.monotonic() - started
+
+        if not ok:
+            self.stats.probe_failures += 1
+        return ok
+
+
+# Глобальный экземпляр
+connection_validator = ConnectionValidator(
+    create_kv_store("immich_probe"),
+    ok_ttl=IMMICH_PROBE_OK_TTL,
+    fail_backoff=IMMICH_PROBE_FAIL_BACKOFF,
+    max_fail_backoff=IMMICH_PROBE_MAX_FAIL_BACKOFF,
+)
@@ -0,0 +1,290 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+
+from utils.config import (
+    IMMICH_BREAKER_FAILURE_RATE,
+    IMMICH_BREAKER_MAX_OPEN_SECONDS,
+    IMMICH_BREAKER_MIN_CALLS,
+    IMMICH_BREAKER_OPEN_SECONDS,
+    IMMICH_HOST_MAX_CONCURRENCY,
+    IMMICH_SLOW_CALL_SECONDS,
+)
+from utils.logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Immich host is considered down, request was not sent"""
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker over a sliding window of calls
+
+    A call is bad if it failed on the host side (network error, timeout, 5xx, 429) or took longer than
+    `slow_call_seconds`. When bad calls reach `failure_rate` of the window (at least `min_calls` calls) the breaker
+    opens for `open_seconds`; then one trial call is let through. A failed trial doubles the open time up to
+    `max_open_seconds`, a successful one closes the breaker.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_calls: int = 5,
+        window: int = 20,
+        open_seconds: float = 30,
+        max_open_seconds: float = 600,
+        slow_call_seconds: float = 20,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self._clock = clock
+        self._outcomes: Deque[bool] = deque(maxlen=window)  # True — плохой вызов
+        self._state = CLOSED
+        self._open_until = 0.0
+        self._current_open_seconds = open_seconds
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() >= self._open_until:
+            return HALF_OPEN
+        return self._state
+
+    def available(self) -> bool:
+        """
+        Check whether a call may be sent now (without taking the half-open trial)
+
+        :return: True/False
+        """
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and not self._trial_in_flight)
+
+    def before_call(self) -> None:
+        """
+        Take permission for a call
+
+        :return: None
+        :raises CircuitOpenError: breaker is open or trial call is already in flight
+        """
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and not self._trial_in_flight:
+            self._state = HALF_OPEN
+            self._trial_in_flight = True
+            return
+        raise CircuitOpenError(f"circuit is {state}, retry in {max(0.0, self._open_until - self._clock()):.0f}s")
+
+    def record(self, failed: bool, latency: float) -> None:
+        """
+        Account finished call
+
+        :param failed: host side failure
+        :param latency: call duration in seconds
+        :return: None
+        """
+        bad = failed or latency >= self.slow_call_seconds
+        if self._state == HALF_OPEN:
+            self._trial_in_flight = False
+            if bad:
+                self._current_open_seconds = min(self._current_open_seconds * 2, self.max_open_seconds)
+                self._open()
+            else:
+                self._close()
+            return
+
+        self._outcomes.append(bad)
+        if (
+            len(self._outcomes) >= self.min_calls
+            and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate
+            and self._state == CLOSED
+        ):
+            self._open()
+
+    def cancel_call(self) -> None:
+        """
+        Forget cancelled call (it says nothing about host health), half-open trial goes to the next call
+
+        :return: None
+        """
+        self._trial_in_flight = False
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._open_until = self._clock() + self._current_open_seconds
+        self._outcomes.clear()
+
+    def _close(self) -> None:
+        self._state = CLOSED
+        self._current_open_seconds = self.open_seconds
+        self._outcomes.clear()
+
+
+class AimdLimiter:
+    """
+    Concurrency limit with additive increase / multiplicative decrease
+
+    A fast successful call raises the limit by 1/limit (about +1 per limit calls), a failed or slow one halves it.
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 20, slow_call_seconds: float = 20):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.slow_call_seconds = slow_call_seconds
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, failed: bool, latency: float, adjust: bool = True) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            if adjust and (failed or latency >= self.slow_call_seconds):
+                self.limit = max(float(self.min_limit), self.limit / 2)
+            elif adjust:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+def is_host_failure(response: Optional[httpx.Response], error: Optional[BaseException]) -> bool:
+    """
+    Whether outcome says the host is unhealthy (4xx means the host is fine, the request is not)
+
+    :param response: response or None
+    :param error: raised exception or None
+    :return: True/False
+    """
+    if error is not None:
+        return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class HostGuard:
+    """Circuit breaker and AIMD limiter of one Immich host"""
+
+    def __init__(self, breaker: CircuitBreaker, limiter: AimdLimiter):
+        self.breaker = breaker
+        self.limiter = limiter
+
+    async def request(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Send request through breaker and limiter
+
+        :param send: coroutine function sending the request
+        :return: response
+        :raises CircuitOpenError: host is down
+        """
+        self.breaker.before_call()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            self.breaker.cancel_call()
+            raise
+        started = time.monotonic()
+        response, error = None, None
+        try:
+            response = await send()
+            return response
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            latency = time.monotonic() - started
+            if isinstance(error, asyncio.CancelledError) and latency < self.breaker.slow_call_seconds:
+                # Быстрая отмена — не сигнал о здоровье хоста. Таймауты запросов задаются через httpx (timeout=),
+                # тогда зависший хост приходит сюда как httpx.TimeoutException
+                self.breaker.cancel_call()
+                await self.limiter.release(False, latency, adjust=False)
+            elif isinstance(error, asyncio.CancelledError):
+                # Вызов отменили, когда он уже был медленным (например внешний asyncio.timeout) — хост завис
+                self.breaker.record(True, latency)
+                await self.limiter.release(True, latency)
+            else:
+                failed = is_host_failure(response, error)
+                self.breaker.record(failed, latency)
+                await self.limiter.release(failed, latency)
+
+
+class HostGuardRegistry:
+    """Host guards by normalized Immich URL"""
+
+    def __init__(
+        self,
+        breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+        limiter_factory: Callable[[], AimdLimiter] = AimdLimiter,
+    ):
+        self._breaker_factory = breaker_factory
+        self._limiter_factory = limiter_factory
+        self._guards: Dict[str, HostGuard] = {}
+
+    def get(self, base_url: str) -> HostGuard:
+        """
+        Guard of host (created on first use)
+
+        :param base_url: normalized Immich URL
+        :return: host guard
+        """
+        guard = self._guards.get(base_url)
+        if guard is None:
+            guard = HostGuard(self._breaker_factory(), self._limiter_factory())
+            self._guards[base_url] = guard
+        return guard
+
+    def available(self, base_url: str) -> bool:
+        """
+        Check whether host accepts requests now
+
+        :param base_url: normalized Immich URL
+        :return: True/False
+        """
+        guard = self._guards.get(base_url)
+        available = guard is None or guard.breaker.available()
+        if not available:
+            logger.debug(f"Immich host {base_url} circuit is {guard.breaker.state}")
+        return available
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Breaker state and concurrency limit by host
+
+        :return: {base_url: {state, limit, in_flight}}
+        """
+        return {
+            base_url: {
+                "state": guard.breaker.state,
+                "limit": int(guard.limiter.limit),
+                "in_flight": guard.limiter.in_flight,
+            }
+            for base_url, guard in self._guards.items()
+        }
+
+
+# Глобальный экземпляр
+host_guards = HostGuardRegistry(
+    breaker_factory=lambda: CircuitBreaker(
+        failure_rate=IMMICH_BREAKER_FAILURE_RATE,
+        min_calls=IMMICH_BREAKER_MIN_CALLS,
+        open_seconds=IMMICH_BREAKER_OPEN_SECONDS,
+        max_open_seconds=IMMICH_BREAKER_MAX_OPEN_SECONDS,
+        slow_call_seconds=IMMICH_SLOW_CALL_SECONDS,
+    ),
+    limiter_factory=lambda: AimdLimiter(
+        max_limit=IMMICH_HOST_MAX_CONCURRENCY, slow_call_seconds=IMMICH_SLOW_CALL_SECONDS
+    ),
+)
@@ -0,0 +1,149 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+
+from utils.config import IMMICH_HTTP2, IMMICH_POOL_MAX_CONNECTIONS, IMMICH_POOL_MAX_KEEPALIVE
+from utils.logger import logger
+
+
+def http2_available() -> bool:
+    """
+    Check whether optional h2 package (httpx HTTP/2 support) is installed
+
+    :return: True/False
+    """
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass
+class HostPool:
+    client: httpx.AsyncClient
+    http2: bool
+    users: int = 0  # Сколько ImmichClient сейчас используют пул
+    requests: int = 0
+
+
+class HostPoolRegistry:
+    """
+    One httpx connection pool per Immich host
+
+    Users of the same (often family) server share TCP/TLS connections instead of keeping a pool per user.
+    The API key is not part of the pool — `ImmichClient` sends it with every request. A pool is closed
+    when the last client of its host is closed.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        http2: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._http2 = http2
+        if http2 and not http2_available():
+            logger.warning("IMMICH_HTTP2 is enabled but h2 is not installed (uv sync --extra http2), using HTTP/1.1")
+            self._http2 = False
+        self._transport = transport
+        self._pools: Dict[str, HostPool] = {}
+
+    def acquire(self, base_url: str) -> httpx.AsyncClient:
+        """
+        Get shared client of host (call `release` when done)
+
+        :param base_url: normalized Immich URL
+        :return: httpx client with base_url of host
+        """
+        pool = self._pools.get(base_url)
+        if pool is None or pool.client.is_closed:
+            pool = HostPool(client=self._create_client(base_url), http2=self._http2)
+            self._pools[base_url] = pool
+            logger.info(f"Created connection pool for {base_url} (http2={self._http2})")
+        pool.users += 1
+        return pool.client
+
+    async def release(self, base_url: str) -> None:
+        """
+        Release host pool, the last release closes it
+
+        :param base_url: normalized Immich URL
+        :return: None
+        """
+        pool = self._pools.get(base_url)
+        if pool is None:
+            return
+
+        pool.users -= 1
+        if pool.users <= 0:
+            self._pools.pop(base_url, None)
+            await self._close(base_url, pool)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Pool statistics by host
+
+        :return: {base_url: {users, requests, http2, connections, idle_connections}}
+        """
+        stats = {}
+        for base_url, pool in self._pools.items():
+            connections = self._connections(pool.client)
+            stats[base_url] = {
+                "users": pool.users,
+                "requests": pool.requests,
+                "http2": pool.http2,
+                "connections": len(connections),
+                "idle_connections": sum(1 for c in connections if c.is_idle()),
+            }
+        return stats
+
+    async def close_all(self) -> None:
+        """
+        Close all pools
+
+        :return: None
+        """
+        pools, self._pools = self._pools, {}
+        for base_url, pool in pools.items():
+            await self._close(base_url, pool)
+
+    def _create_client(self, base_url: str) -> httpx.AsyncClient:
+        async def count_request(request: httpx.Request) -> None:
+            pool = self._pools.get(base_url)
+            if pool is not None:
+                pool.requests += 1
+
+        return httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=self._limits,
+            http2=self._http2,
+            transport=self._transport,
+            event_hooks={"request": [count_request]},
+        )
+
+    @staticmethod
+    def _connections(client: httpx.AsyncClient) -> list:
+        # httpx не отдает состояние пула публично — берем соединения httpcore, если транспорт стандартный
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        return list(getattr(pool, "connections", []))
+
+    @staticmethod
+    async def _close(base_url: str, pool: HostPool) -> None:
+        try:
+            await pool.client.aclose()
+            logger.info(f"Closed connection pool for {base_url}")
+        except Exception as e:
+            logger.warning(f"Error closing pool for {base_url}: {str(e)}")
+
+
+# Глобальный экземпляр
+host_pools = HostPoolRegistry(
+    max_connections=IMMICH_POOL_MAX_CONNECTIONS,
+    max_keepalive=IMMICH_POOL_MAX_KEEPALIVE,
+    http2=IMMICH_HTTP2,
+)
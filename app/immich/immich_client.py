@@ -1,27 +1,39 @@
 import httpx
 import asyncio
-from typing import Optional, Dict, Any, Callable, Coroutine, TypeVar, Deque, List
-from collections import deque
+import heapq
+import itertools
+import time
+from typing import Optional, Dict, Any, Callable, Coroutine, TypeVar, List, Tuple
+from collections import OrderedDict
 from functools import wraps
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from postgres.database import SessionLocal
-from postgres.models import User, ApiKey, ImmichHost
+from immich.connection_probe import connection_validator
+from immich.host_guard import CircuitOpenError, HostGuardRegistry, host_guards
+from immich.http_pools import HostPoolRegistry, host_pools
+from postgres.user_config import user_config_cache
 from utils.logger import logger
+from utils.metrics import IMMICH_REQUEST_DURATION
 
 T = TypeVar("T")
 
 
 class ImmichClient:
-    def __init__(self, base_url: str, api_key: str):
-        self.base_url = base_url.rstrip("/")
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        pools: Optional[HostPoolRegistry] = None,
+        guards: Optional[HostGuardRegistry] = None,
+    ):
+        self.base_url = self.host_key(base_url)
         self.api_key = api_key
-        self.client = httpx.AsyncClient(
-            base_url=self.base_url,
-            headers={"x-api-key": self.api_key},
-            timeout=httpx.Timeout(30.0, connect=10.0),
-            limits=httpx.Limits(max_connections=10),
-        )
+        # Пул соединений общий для всех пользователей хоста, API ключ передается в каждом запросе
+        self._pools = pools or host_pools
+        self.client = self._pools.acquire(self.base_url)
+        # Circuit breaker и AIMD лимит тоже общие на хост
+        self.guard = (guards or host_guards).get(self.base_url)
+        self.headers = {"x-api-key": self.api_key}
+        self._closed = False
         self.last_used = datetime.now()
         self.created_at = datetime.now()
 
@@ -54,6 +66,40 @@ class ImmichClient:
 
         return url
 
+    @classmethod
+    def host_key(cls, url: str) -> str:
+        """
+        Key of Immich host for shared pools and breakers
+
+        :param url: url string
+        :return: normalized url without trailing slash
+        """
+        return cls.normalize_url(url).rstrip("/")
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send request with user's API key through host circuit breaker and concurrency limit
+
+        :param method: HTTP method
+        :param url: path relative to base_url
+        :param kwargs: httpx request arguments
+        :return: response
+        :raises CircuitOpenError: host is considered down
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.guard.request(
+                lambda: self.client.request(method, url, headers=self.headers, **kwargs)
+            )
+            outcome = f"{response.status_code // 100}xx"
+            return response
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        finally:
+            IMMICH_REQUEST_DURATION.labels(method, outcome).observe(time.perf_counter() - started)
+
     async def refresh(self) -> None:
         """
         Refresh cache
@@ -79,14 +125,12 @@ class ImmichClient:
         :return: dict
         """
         try:
-            async with asyncio.timeout(30):  # Общий таймаут операции
-                response = await self.client.get(
-                    f"/api/albums/{album_uuid}",
-                    timeout=20.0,  # Таймаут конкретного запроса
-                )
-                response.raise_for_status()
-                return response.json()
-        except asyncio.TimeoutError:
+            # Таймаут httpx, а не asyncio.timeout снаружи: зависший хост должен дойти до circuit breaker
+            # как httpx.TimeoutException, а не как отмена
+            response = await self.request("GET", f"/api/albums/{album_uuid}", timeout=20.0)
+            response.raise_for_status()
+            return response.json()
+        except httpx.TimeoutException:
             logger.error(f"Timeout while fetching album {album_uuid}")
             raise
         except httpx.HTTPStatusError as e:
@@ -103,7 +147,7 @@ class ImmichClient:
         :return: list of albums
         """
         await self.refresh()
-        response = await self.client.get("/api/albums")
+        response = await self.request("GET", "/api/albums")
         response.raise_for_status()
         return response.json()
 
@@ -115,7 +159,7 @@ class ImmichClient:
         :return: list of album assets
         """
         await self.refresh()
-        response = await self.client.get(f"/api/albums/{album_id}/assets")
+        response = await self.request("GET", f"/api/albums/{album_id}/assets")
         response.raise_for_status()
         return response.json()
 
@@ -126,7 +170,7 @@ class ImmichClient:
         :param asset_id: asset id
         :return: asset (media) information"""
         await self.refresh()
-        response = await self.client.get(f"/api/asset/{asset_id}")
+        response = await self.request("GET", f"/api/asset/{asset_id}")
         response.raise_for_status()
         return response.json()
 
@@ -138,7 +182,7 @@ class ImmichClient:
         :return: asset (media) binary data
         """
         await self.refresh()
-        response = await self.client.get(f"/api/assets/{asset_uuid}/original")
+        response = await self.request("GET", f"/api/assets/{asset_uuid}/original")
         response.raise_for_status()
         return response.content
 
@@ -150,28 +194,31 @@ class ImmichClient:
         :return: list of assets
         """
         await self.refresh()
-        response = await self.client.post("/api/search/metadata", json=query)
+        response = await self.request("POST", "/api/search/metadata", json=query)
         response.raise_for_status()
         return response.json()
 
     async def close(self) -> None:
         """
-        Close the client
+        Release the host pool (closed when its last client is closed)
 
         :return: None
         """
-        try:
-            await self.client.aclose()
-        except Exception as e:
-            logger.warning(f"Error closing client: {str(e)}")
+        if self._closed:
+            return
+        self._closed = True
+        await self._pools.release(self.base_url)
 
 
 class ImmichService:
     def __init__(self, client_ttl: timedelta = timedelta(hours=2), max_clients: int = 1000):
-        self.active_clients: Dict[int, ImmichClient] = {}
+        # Порядок ключей — порядок использования: первый — давно не использованный (LRU), все операции O(1)
+        self.active_clients: OrderedDict[int, ImmichClient] = OrderedDict()
         self.client_ttl = client_ttl
         self.max_clients = max_clients
-        self._lru_queue: Deque[int] = deque(maxlen=max_clients)
+        # Куча сроков истечения (deadline, seq, telegram_id, client): устаревшие записи пропускаются при извлечении
+        self._expiry_heap: List[Tuple[datetime, int, int, ImmichClient]] = []
+        self._expiry_seq = itertools.count()
         self._cleanup_task: Optional[asyncio.Task] = None
         self._lock = asyncio.Lock()
 
@@ -197,33 +244,20 @@ class ImmichService:
         async def wrapper(self: "ImmichService", telegram_id: int, *args, **kwargs) -> T:
             async with self._lock:
                 if not await self.ensure_client(telegram_id):
-                    # Попробуем создать клиента еще раз
-                    db: Session = SessionLocal()
-                    try:
-                        user = db.query(User).filter(User.telegram_id == telegram_id, User.deleted_at.is_(None)).first()
-
-                        if not user:
-                            raise ValueError(f"User {telegram_id} not found")
-
-                        # Проверяем наличие необходимых данных
-                        has_host = (
-                            db.query(ImmichHost)
-                            .filter(ImmichHost.user_id == user.user_id, ImmichHost.deleted_at.is_(None))
-                            .first()
-                            is not None
+                    # Выясняем причину по снимку настроек (без отдельных запросов к User/ImmichHost/ApiKey)
+                    config = await user_config_cache.get(telegram_id)
+                    if not config:
+                        raise ValueError(f"User {telegram_id} not found")
+
+                    if not config.host_url or not config.api_key:
+                        raise ValueError(
+                            f"User {telegram_id} missing Immich configuration: "
+                            f"host={bool(config.host_url)}, api_key={bool(config.api_key)}"
                         )
 
-                        has_key = (
-                            db.query(ApiKey).filter(ApiKey.user_id == user.user_id, ApiKey.deleted_at.is_(None)).first()
-                            is not None
-                        )
-
-                        if not has_host or not has_key:
-                            raise ValueError(
-                                f"User {telegram_id} missing Immich configuration: host={has_host}, api_key={has_key}"
-                            )
-                    finally:
-                        db.close()
+                    # Хост лежит — повторная попытка только еще раз упрется в открытый breaker
+                    if not host_guards.available(ImmichClient.host_key(config.host_url)):
+                        raise CircuitOpenError(f"Immich host of user {telegram_id} is unavailable")
 
                     # Попытка создать клиента еще раз
                     if not await self.ensure_client(telegram_id):
@@ -235,6 +269,11 @@ class ImmichService:
                 return await func(self, client, *args, **kwargs)
             except Exception as e:
                 logger.error(f"Error in {func.__name__} for user {telegram_id}: {str(e)}")
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 401:
+                    # Ключ отозвали — не доверяем закэшированной проверке и пересоздадим клиента
+                    await connection_validator.forget(client.base_url, client.api_key)
+                    async with self._lock:
+                        await self._remove_client(telegram_id)
                 raise
 
         return wrapper
@@ -251,120 +290,104 @@ class ImmichService:
             await self._remove_client(telegram_id)
 
         # Enforce max clients limit
-        if len(self.active_clients) >= self.max_clients:
+        while len(self.active_clients) >= self.max_clients:
             await self._remove_oldest_client()
 
         # Create new client
-        db: Session = SessionLocal()
-        try:
-            user = db.query(User).filter(User.telegram_id == telegram_id, User.deleted_at.is_(None)).first()
+        config = await user_config_cache.get(telegram_id)
 
-            if not user:
-                logger.error(f"User with telegram_id {telegram_id} not found")
-                return None
+        if not config:
+            logger.error(f"User with telegram_id {telegram_id} not found")
+            return None
 
-            host = (
-                db.query(ImmichHost).filter(ImmichHost.user_id == user.user_id, ImmichHost.deleted_at.is_(None)).first()
-            )
-
-            if not host:
-                logger.error(f"No Immich host configured for user {telegram_id}")
-                return None
+        if not config.host_url:
+            logger.error(f"No Immich host configured for user {telegram_id}")
+            return None
 
-            api_key = (
-                db.query(ApiKey)
-                .filter(ApiKey.user_id == user.user_id, ApiKey.deleted_at.is_(None))
-                .order_by(ApiKey.created_at.desc())
-                .first()
-            )
-
-            if not api_key:
-                logger.error(f"No API key found for user {telegram_id}")
-                return None
+        if not config.api_key:
+            logger.error(f"No API key found for user {telegram_id}")
+            return None
 
-            try:
-                # Test connection before adding client
-                test_client = ImmichClient(host.host_url, api_key.api_key)
-                # await test_client.get_albums()  # Test connection
-                # await test_client.close()
-
-                if not await self._test_connection(test_client):
-                    logger.error(f"Connection test failed for user {telegram_id}")
-                    await test_client.close()
-                    return None
-
-                client = ImmichClient(host.host_url, api_key.api_key)
-                self.active_clients[telegram_id] = client
-                self._lru_queue.append(telegram_id)
-                logger.info(f"Created new Immich client for user {telegram_id}")
-                if not await self._test_connection(client):
-                    logger.error(f"Connection test failed for user {telegram_id}")
-                    await client.close()
-                    return None
+        if not host_guards.available(ImmichClient.host_key(config.host_url)):
+            logger.warning(f"Immich host of user {telegram_id} is unavailable (circuit open), skipping")
+            return None
 
-                return client
-            except Exception as e:
-                logger.error(f"Failed to create Immich client for user {telegram_id}: {str(e)}")
+        try:
+            client = ImmichClient(config.host_url, config.api_key)
+            # Одна проверка соединения, результат кэшируется по (хост, ключ) — см. ConnectionValidator
+            if not await connection_validator.validate(client):
+                logger.error(f"Connection test failed for user {telegram_id}")
+                await client.close()
                 return None
-        finally:
-            db.close()
 
-    async def _test_connection(self, client: ImmichClient) -> bool:
-        """Проверка работоспособности соединения"""
-        try:
-            async with asyncio.timeout(5):
-                response = await client.client.get("/api/users/me")
-                logger.info("Connection test succeeded")
-                return response.status_code == 200
+            self.active_clients[telegram_id] = client
+            self._schedule_expiry(telegram_id, client)
+            logger.info(f"Created new Immich client for user {telegram_id}")
+            return client
         except Exception as e:
-            logger.warning(f"Connection test failed: {str(e)}")
-            logger.error(f"Connection test failed: {e}")
-            return False
+            logger.error(f"Failed to create Immich client for user {telegram_id}: {str(e)}")
+            return None
 
     def _update_lru(self, telegram_id: int):
-        """Update LRU queue for the client"""
-        try:
-            self._lru_queue.remove(telegram_id)
-        except ValueError:
-            pass
-        self._lru_queue.append(telegram_id)
+        """Mark client as most recently used"""
+        if telegram_id in self.active_clients:
+            self.active_clients.move_to_end(telegram_id)
+
+    def _schedule_expiry(self, telegram_id: int, client: ImmichClient) -> None:
+        """Put client's deadline to the expiry heap"""
+        deadline = client.last_used + self.client_ttl
+        heapq.heappush(self._expiry_heap, (deadline, next(self._expiry_seq), telegram_id, client))
 
     async def _remove_client(self, telegram_id: int):
         """Remove and close a specific client"""
-        if telegram_id in self.active_clients:
-            try:
-                await self.active_clients[telegram_id].close()
-            finally:
-                self.active_clients.pop(telegram_id, None)
-                try:
-                    self._lru_queue.remove(telegram_id)
-                except ValueError:
-                    pass
+        client = self.active_clients.pop(telegram_id, None)
+        if client is not None:
+            await client.close()
 
     async def _remove_oldest_client(self):
         """Remove the least recently used client"""
-        if not self._lru_queue:
+        if not self.active_clients:
             return
 
-        oldest_id = self._lru_queue[0]
-        await self._remove_client(oldest_id)
+        oldest_id, client = self.active_clients.popitem(last=False)
+        logger.info(f"Evicting least recently used Immich client of user {oldest_id}")
+        await client.close()
+
+    async def _expire_clients(self, now: Optional[datetime] = None) -> int:
+        """
+        Close clients whose TTL has passed (only heap head is inspected)
+
+        :param now: current time (for tests)
+        :return: number of closed clients
+        """
+        now = now or datetime.now()
+        expired = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, _, telegram_id, client = heapq.heappop(self._expiry_heap)
+            if self.active_clients.get(telegram_id) is not client:
+                continue  # Клиент уже удален или пересоздан
+            if client.last_used + self.client_ttl > now:
+                # Клиент использовался после постановки в кучу — переносим срок
+                self._schedule_expiry(telegram_id, client)
+                continue
+            await self._remove_client(telegram_id)
+            expired += 1
+        return expired
+
+    def _next_cleanup_delay(self) -> float:
+        """Seconds until the nearest deadline (at most 5 minutes, new clients expire later than that)"""
+        if not self._expiry_heap:
+            return 60 * 5
+        delay = (self._expiry_heap[0][0] - datetime.now()).total_seconds()
+        return min(max(delay, 1.0), 60 * 5)
 
     async def _cleanup_expired_clients(self):
-        """Background task to clean up expired clients"""
+        """Background task to close expired clients when the nearest deadline comes"""
         while True:
-            await asyncio.sleep(60 * 5)  # Check every 5 minutes
+            await asyncio.sleep(self._next_cleanup_delay())
             try:
                 async with self._lock:
-                    now = datetime.now()
-                    to_remove = []
-
-                    for uid, client in self.active_clients.items():
-                        if (now - client.last_used) >= self.client_ttl:
-                            to_remove.append(uid)
-
-                    for uid in to_remove:
-                        await self._remove_client(uid)
-
+                    await self._expire_clients()
             except Exception as e:
                 logger.error(f"Error in client cleanup task: {str(e)}")
 
@@ -374,6 +397,7 @@ class ImmichService:
         if telegram_id in self.active_clients:
             client = self.active_clients[telegram_id]
             if await client.is_valid(self.client_ttl):
+                self._update_lru(telegram_id)
                 return True
             await self._remove_client(telegram_id)
 
@@ -395,8 +419,9 @@ class ImmichService:
             try:
                 return await client.get_album_info(album_uuid)
             except (httpx.NetworkError, httpx.TimeoutException) as e:
-                if attempt == max_retries - 1:
-                    logger.error(f"Failed to get album info after {max_retries} attempts")
+                # Breaker хоста открылся — ждать и повторять бессмысленно
+                if attempt == max_retries - 1 or not client.guard.breaker.available():
+                    logger.error(f"Failed to get album info after {attempt + 1} attempts")
                     raise e
                 logger.warning(f"Attempt {attempt + 1} failed, retrying in {retry_delay} sec...")
                 await asyncio.sleep(retry_delay)
@@ -425,6 +450,11 @@ class ImmichService:
         return await client.search_metadata(query)
 
     async def close_all(self):
+        """
+        Stop the cleanup task and close all clients (call on application shutdown)
+
+        :return: None
+        """
         if self._cleanup_task is not None:
             self._cleanup_task.cancel()
             try:
@@ -433,6 +463,13 @@ class ImmichService:
                 pass
             self._cleanup_task = None
 
+        async with self._lock:
+            while self.active_clients:
+                _, client = self.active_clients.popitem(last=False)
+                await client.close()
+            self._expiry_heap.clear()
+
 
-# Initialize with default TTL of 2 hours and max 1000 clients
+# Глобальный экземпляр: один на приложение, клиенты живут между запусками задач
+# (start/close_all вызываются в post_init/post_shutdown приложения)
 immich_service = ImmichService()
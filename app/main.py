@@ -1,8 +1,10 @@
+import asyncio
 import subprocess
 import sys
 
 from utils.logger import logger
 from bot.bot_client import init_bot
+from bot.web_server import run_application
 
 
 def run_migrations():
@@ -31,7 +33,8 @@ def main():
     run_migrations()
 
     bot = init_bot()
-    bot.run_polling()
+    # Polling или webhook (BOT_MODE) вместе с HTTP сервером /health и /metrics
+    asyncio.run(run_application(bot))
 
 
 if __name__ == "__main__":
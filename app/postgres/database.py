@@ -3,9 +3,11 @@ import os
 import sqlalchemy
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 
 from utils.logger import logger
+from utils.metrics import instrument_engine
 
 # Получаем переменные окружения
 try:
@@ -15,6 +17,9 @@ try:
     db_host = os.getenv("POSTGRES_HOST")
     db_port = os.getenv("POSTGRES_PORT")
     db_name = os.getenv("POSTGRES_DB")
+    # Читаем здесь, а не из utils.config, чтобы alembic не требовал переменных бота
+    media_job_concurrency = int(os.getenv("MEDIA_JOB_CONCURRENCY", 4))
+    db_pool_reserve = int(os.getenv("DB_POOL_RESERVE", 5))
 except Exception as e:
     logger.critical("Not Found: Postgres variables in env")
     raise e
@@ -27,4 +32,19 @@ logger.info(DATABASE_URL)
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок для обработчиков и задач, чтобы запросы не блокировали event loop бота.
+# Пул: по соединению на каждого параллельно обрабатываемого пользователя + запас для обработчиков апдейтов
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=media_job_concurrency + db_pool_reserve,
+    max_overflow=db_pool_reserve,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Длительность запросов в db_query_duration_seconds (/metrics)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
 Base = sqlalchemy.orm.declarative_base()
@@ -5,10 +5,13 @@ from sqlalchemy import (
     Boolean,
     ForeignKey,
     TIMESTAMP,
-    JSON,
     Text,
     BigInteger,
+    UniqueConstraint,
+    Index,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -18,6 +21,8 @@ from postgres.database import Base
 # Таблица users
 class User(Base):
     __tablename__ = "users"
+    # Частичные индексы под запросы с фильтром deleted_at IS NULL (см. миграцию c4e9a1f27b86)
+    __table_args__ = (Index("ix_users_telegram_id_active", "telegram_id", postgresql_where=text("deleted_at IS NULL")),)
 
     user_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     username = Column(String(255), nullable=True)
@@ -36,6 +41,11 @@ class User(Base):
 # Таблица channels
 class Channel(Base):
     __tablename__ = "channels"
+    __table_args__ = (
+        Index(
+            "ix_channels_user_id_active", "user_id", "telegram_channel_id", postgresql_where=text("deleted_at IS NULL")
+        ),
+    )
 
     channel_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
@@ -52,6 +62,14 @@ class Channel(Base):
 # Таблица api_keys
 class ApiKey(Base):
     __tablename__ = "api_keys"
+    __table_args__ = (
+        Index(
+            "ix_api_keys_user_id_active",
+            "user_id",
+            text("created_at DESC"),
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
 
     key_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
@@ -66,6 +84,7 @@ class ApiKey(Base):
 # Таблица immich_hosts
 class ImmichHost(Base):
     __tablename__ = "immich_hosts"
+    __table_args__ = (Index("ix_immich_hosts_user_id_active", "user_id", postgresql_where=text("deleted_at IS NULL")),)
 
     host_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
@@ -80,6 +99,7 @@ class ImmichHost(Base):
 # Таблица albums
 class Album(Base):
     __tablename__ = "albums"
+    __table_args__ = (Index("ix_albums_user_id_active", "user_id", postgresql_where=text("deleted_at IS NULL")),)
 
     album_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
@@ -96,7 +116,34 @@ class Album(Base):
 # Таблица media_files
 class MediaFile(Base):
     __tablename__ = "media_files"
-
+    __table_args__ = (
+        # Проверка дубликатов в MediaJobs
+        Index("ix_media_files_media_url_active", "media_url", postgresql_where=text("deleted_at IS NULL")),
+        # Очередь на постинг в порядке съемки; условие совпадает с запросом (processed IS false),
+        # иначе планировщик не возьмет индекс
+        Index(
+            "ix_media_files_unprocessed_by_date",
+            "user_id",
+            text("(info ->> 'date')"),
+            "media_id",
+            postgresql_where=text("processed IS false AND deleted_at IS NULL"),
+        ),
+        # Фильтры по EXIF: info @> '{"camera": ...}' и т.п.
+        Index("ix_media_files_info_gin", "info", postgresql_using="gin", postgresql_ops={"info": "jsonb_path_ops"}),
+        Index("ix_media_files_info_camera", text("(info ->> 'camera')")),
+        Index(
+            "ix_media_files_user_id_with_location",
+            "user_id",
+            postgresql_where=text("(info -> 'location' ->> 'latitude') IS NOT NULL AND deleted_at IS NULL"),
+        ),
+        # Внешние ключи: удаление пользователя/альбома
+        Index("ix_media_files_user_id", "user_id"),
+        Index("ix_media_files_album_id", "album_id"),
+        # Партиции по месяцу created_at (media_files_pYYYYMM + media_files_default), см. MediaPartitionMaintenance
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    # Ключ партиционирования обязан входить в первичный ключ
     media_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     media_uuid = Column(String(36), nullable=False)
     user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
@@ -105,15 +152,77 @@ class MediaFile(Base):
     media_type = Column(String(50), nullable=False)  # Тип медиа: photo, video и т.д.
     processed = Column(Boolean, default=False)
     error = Column(Text)
-    created_at = Column(TIMESTAMP, server_default=func.now())
+    created_at = Column(TIMESTAMP, primary_key=True, server_default=func.now())
     deleted_at = Column(TIMESTAMP, nullable=True)  # Добавили deleted_at
     file_size = Column(Integer, nullable=True)
     file_format = Column(String(30), nullable=True)
 
-    # Метаданные медиа в формате JSON
-    info = Column(JSON, nullable=True)  # Пример: {"location": "New York", "iso": "100", "aperture": "f/2.8", ...}
+    # Метаданные медиа в формате JSONB (индексы по date, camera, location — см. __table_args__)
+    info = Column(JSONB, nullable=True)  # Пример: {"location": "New York", "iso": "100", "aperture": "f/2.8", ...}
 
     # Связь с таблицей albums
     album = relationship("Album", back_populates="media_files")
     # Связь с таблицей users
     user = relationship("User", back_populates="media_files")
+
+
+# Дата съемки из EXIF — то же выражение, что в индексе ix_media_files_unprocessed_by_date.
+# Ключ подставлен литералом: с параметром (asyncpg) планировщик не сопоставит выражение с индексом
+media_capture_date = MediaFile.info.op("->>", return_type=String)(text("'date'"))
+
+
+# Таблица posted_assets — отправленные медиа из сжатых старых партиций media_files, только для проверки дубликатов
+class PostedAsset(Base):
+    __tablename__ = "posted_assets"
+
+    media_url = Column(String(255), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False, index=True)
+    media_uuid = Column(String(36), nullable=False)
+    archived_at = Column(TIMESTAMP, server_default=func.now())
+
+
+# Таблица geo_cache — кэш обратного геокодирования по ячейкам сетки координат
+class GeoCache(Base):
+    __tablename__ = "geo_cache"
+
+    cell_key = Column(String(32), primary_key=True)  # Округленные координаты, например "55.76,37.62"
+    location_name = Column(String(255), nullable=True)  # None — место не найдено (негативный кэш)
+    backend = Column(String(30), nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+
+# Таблица discussion_attachments — отложенная отправка оригинала в группу обсуждения канала
+class DiscussionAttachment(Base):
+    __tablename__ = "discussion_attachments"
+    __table_args__ = (
+        UniqueConstraint("channel_id", "channel_msg_id", name="uq_discussion_attachments_channel_msg"),
+        # resume_pending выбирает только незавершенные отправки
+        Index(
+            "ix_discussion_attachments_status_open",
+            "status",
+            postgresql_where=text("status IN ('pending', 'sending')"),
+        ),
+    )
+
+    attachment_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    telegram_id = Column(BigInteger, nullable=False)  # Владелец медиа — для повторного скачивания из Immich
+    media_uuid = Column(String(36), nullable=False)
+    filename = Column(String(255), nullable=False)
+    channel_id = Column(BigInteger, nullable=False)
+    channel_msg_id = Column(BigInteger, nullable=False)
+    discussion_chat_id = Column(BigInteger, nullable=False)
+    discussion_msg_id = Column(BigInteger, nullable=True)  # Заполняется, когда Telegram переслал пост в группу
+    status = Column(String(20), nullable=False, default="pending")  # pending / sending / sent / failed / expired
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+
+# Таблица bot_state — служебное состояние бота, которое должно переживать рестарты (например хэш команд)
+class BotState(Base):
+    __tablename__ = "bot_state"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(JSONB, nullable=False)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,188 @@
+import asyncio
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import Select, and_, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from postgres.database import AsyncSessionLocal
+from postgres.models import User, Channel, ImmichHost, ApiKey, Album
+from utils.config import USER_CONFIG_CACHE_TTL
+from utils.kv_store import create_kv_store
+from utils.logger import logger
+
+
+@dataclass(frozen=True)
+class AlbumConfig:
+    album_id: int
+    album_uuid: str
+
+
+@dataclass(frozen=True)
+class UserConfig:
+    """Snapshot of active user settings (None / empty — not configured yet)"""
+
+    user_id: int
+    telegram_id: int
+    telegram_channel_id: Optional[int]
+    host_url: Optional[str]
+    api_key: Optional[str]
+    albums: Tuple[AlbumConfig, ...]
+
+
+def user_config_query(telegram_id: int) -> Select:
+    """
+    Single query for user with active channel, host, api key and albums
+
+    Channel, host and api key are scalar subqueries (first channel and host, newest key), only albums are joined,
+    so there is one row per album instead of a product of all active settings.
+
+    :param telegram_id: telegram user id
+    :return: select statement
+    """
+    channel = (
+        select(Channel.telegram_channel_id)
+        .where(Channel.user_id == User.user_id, Channel.deleted_at.is_(None))
+        .order_by(Channel.channel_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    host = (
+        select(ImmichHost.host_url)
+        .where(ImmichHost.user_id == User.user_id, ImmichHost.deleted_at.is_(None))
+        .order_by(ImmichHost.host_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    api_key = (
+        select(ApiKey.api_key)
+        .where(ApiKey.user_id == User.user_id, ApiKey.deleted_at.is_(None))
+        .order_by(ApiKey.created_at.desc().nulls_last())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            User.user_id,
+            User.telegram_id,
+            channel.label("telegram_channel_id"),
+            host.label("host_url"),
+            api_key.label("api_key"),
+            Album.album_id,
+            Album.album_uuid,
+        )
+        .outerjoin(Album, and_(Album.user_id == User.user_id, Album.deleted_at.is_(None)))
+        .where(User.telegram_id == telegram_id, User.deleted_at.is_(None))
+        .order_by(User.user_id, Album.album_id)
+    )
+
+
+class UserConfigCache:
+    """
+    Read-through in-process TTL cache of `UserConfig` by telegram id
+
+    Setup handlers and /delete_all call `invalidate` after commit. It also writes a new version token of the user
+    to `version_store` (memory / Redis, see `create_kv_store`); a cached entry loaded under another token is
+    reloaded, so other replicas see the change on their next `get`. Unknown users are not cached, so /start
+    right after registration reads the new row.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, ttl_seconds: float = 300, version_store=None):
+        self._session_factory = session_factory
+        self._ttl = ttl_seconds
+        self._version_store = version_store
+        # telegram_id -> (истекает, снимок, токен версии на момент чтения)
+        self._entries: Dict[int, Tuple[float, UserConfig, Any]] = {}
+        # Одновременные промахи по одному пользователю ждут один запрос
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._versions: Dict[int, int] = {}
+
+    async def get(self, telegram_id: int) -> Optional[UserConfig]:
+        """
+        Get user settings from cache or db
+
+        :param telegram_id: telegram user id
+        :return: user config or None if user not found
+        """
+        shared_version = await self._shared_version(telegram_id)
+        entry = self._entries.get(telegram_id)
+        if entry and entry[0] > time.monotonic() and entry[2] == shared_version:
+            return entry[1]
+
+        if telegram_id in self._loading:
+            return await asyncio.shield(self._loading[telegram_id])
+
+        version = self._versions.get(telegram_id, 0)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[telegram_id] = future
+        try:
+            config = await self._load(telegram_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим — не даем asyncio ругаться на непрочитанное
+            future.exception()
+            raise
+        else:
+            future.set_result(config)
+        finally:
+            if self._loading.get(telegram_id) is future:
+                del self._loading[telegram_id]
+
+        # Настройки изменили, пока шел запрос, — прочитанный снимок мог устареть
+        if config is not None and self._versions.get(telegram_id, 0) == version:
+            self._entries[telegram_id] = (time.monotonic() + self._ttl, config, shared_version)
+        return config
+
+    async def invalidate(self, telegram_id: int) -> None:
+        """
+        Drop cached user settings (call after writing them)
+
+        :param telegram_id: telegram user id
+        :return: None
+        """
+        self._entries.pop(telegram_id, None)
+        # Следующий get не присоединяется к запросу, начатому до записи
+        self._loading.pop(telegram_id, None)
+        self._versions[telegram_id] = self._versions.get(telegram_id, 0) + 1
+        if self._version_store is not None:
+            # Токен живет дольше любой записи кэша, после его истечения записи других реплик уже перечитаны
+            await self._version_store.set(str(telegram_id), secrets.token_hex(8), self._ttl * 2)
+
+    async def _shared_version(self, telegram_id: int) -> Any:
+        if self._version_store is None:
+            return None
+        return await self._version_store.get(str(telegram_id))
+
+    async def _load(self, telegram_id: int) -> Optional[UserConfig]:
+        async with self._session_factory() as db:
+            rows = (await db.execute(user_config_query(telegram_id))).all()
+
+        if not rows:
+            return None
+
+        first = rows[0]
+        albums = {}
+        for row in rows:
+            if row.user_id == first.user_id and row.album_id is not None:
+                albums.setdefault(row.album_id, AlbumConfig(row.album_id, row.album_uuid))
+
+        logger.debug(f"Loaded config for user {telegram_id}")
+        return UserConfig(
+            user_id=first.user_id,
+            telegram_id=first.telegram_id,
+            telegram_channel_id=first.telegram_channel_id,
+            host_url=first.host_url,
+            api_key=first.api_key,
+            albums=tuple(albums.values()),
+        )
+
+
+# Глобальный экземпляр
+user_config_cache = UserConfigCache(
+    AsyncSessionLocal, ttl_seconds=USER_CONFIG_CACHE_TTL, version_store=create_kv_store("user_config_version")
+)
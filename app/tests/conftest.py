@@ -1,5 +1,13 @@
+import os
+
 import pytest
+import pytest_asyncio
 import asyncio
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+# Тесты не пишут трассы в data/traces.jsonl
+os.environ.setdefault("TRACING_EXPORTER", "none")
 
 
 @pytest.fixture(scope="session")
@@ -8,3 +16,35 @@ def event_loop():
     loop = asyncio.new_event_loop()
     yield loop
     loop.close()
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    """Redis client for tests of shared backends (skipped if REDIS_TEST_URL is not reachable)"""
+    client = aioredis.from_url(os.getenv("REDIS_TEST_URL", "redis://localhost:6379/15"), decode_responses=True)
+    try:
+        await client.ping()
+    except (RedisError, OSError):
+        await client.aclose()
+        pytest.skip("Redis is not available")
+
+    await client.flushdb()
+    yield client
+    await client.flushdb()
+    await client.aclose()
+
+
+@pytest_asyncio.fixture
+async def hanging_host():
+    """URL of a local TCP server that accepts connections and never answers (hung Immich)"""
+    connections = []
+
+    async def accept(reader, writer):
+        connections.append(writer)
+
+    server = await asyncio.start_server(accept, "127.0.0.1", 0)
+    yield f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    for writer in connections:
+        writer.close()
+    server.close()
+    await server.wait_closed()
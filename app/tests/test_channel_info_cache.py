@@ -0,0 +1,125 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from telegram.error import TelegramError
+
+from bot.channel_info_cache import ChannelInfoCache
+from bot.handlers.chat_member_handler import my_chat_member_handler
+from utils.kv_store import MemoryKeyValueStore
+
+
+@pytest.fixture
+def cache():
+    return ChannelInfoCache(MemoryKeyValueStore(), ttl_seconds=60)
+
+
+@pytest.fixture
+def bot():
+    bot = MagicMock()
+    bot.get_chat = AsyncMock(return_value=SimpleNamespace(title="My channel", linked_chat_id=-100500))
+    bot.get_chat_member = AsyncMock(return_value=SimpleNamespace(status="administrator"))
+    return bot
+
+
+class TestChannelInfoCacheGet:
+    """Tests for ChannelInfoCache.get"""
+
+    @pytest.mark.asyncio
+    async def test_get_fetches_once(self, cache, bot):
+        first = await cache.get(bot, -1001)
+        second = await cache.get(bot, -1001)
+
+        bot.get_chat.assert_awaited_once_with(-1001)
+        assert first == second
+        assert second.linked_chat_id == -100500
+        assert second.title == "My channel"
+
+    @pytest.mark.asyncio
+    async def test_get_refetches_after_ttl(self, bot):
+        cache = ChannelInfoCache(MemoryKeyValueStore(), ttl_seconds=0)
+
+        await cache.get(bot, -1001)
+        await cache.get(bot, -1001)
+
+        assert bot.get_chat.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_get_refetches_after_invalidate(self, cache, bot):
+        await cache.get(bot, -1001)
+        await cache.invalidate(-1001)
+        await cache.get(bot, -1001)
+
+        assert bot.get_chat.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_put_fills_cache(self, cache, bot):
+        await cache.put(-1001, title="From setup", linked_chat_id=None, bot_is_admin=True)
+
+        info = await cache.get(bot, -1001)
+
+        bot.get_chat.assert_not_called()
+        assert info.bot_is_admin is True
+        assert info.linked_chat_id is None
+
+    @pytest.mark.asyncio
+    async def test_set_bot_admin_refetches_status(self, cache, bot):
+        await cache.put(-1001, title="From setup", linked_chat_id=None, bot_is_admin=True)
+        bot.get_chat_member.return_value = SimpleNamespace(status="member")
+
+        await cache.set_bot_admin(-1001, False)
+        info = await cache.get(bot, -1001)
+
+        bot.get_chat.assert_awaited_once()
+        assert info.bot_is_admin is False
+        assert info.linked_chat_id == -100500
+
+    @pytest.mark.asyncio
+    async def test_refetch_rederives_admin_status(self, bot):
+        # Бота снова сделали админом, а ChatMemberUpdated не дошел — False не должен пережить обновление
+        cache = ChannelInfoCache(MemoryKeyValueStore(), ttl_seconds=0)
+        await cache.set_bot_admin(-1001, False)
+
+        info = await cache.get(bot, -1001)
+
+        bot.get_chat_member.assert_awaited_once_with(-1001, bot.id)
+        assert info.bot_is_admin is True
+
+    @pytest.mark.asyncio
+    async def test_unknown_admin_status_on_error(self, cache, bot):
+        bot.get_chat_member.side_effect = TelegramError("Member list is inaccessible")
+
+        info = await cache.get(bot, -1001)
+
+        assert info.bot_is_admin is None
+
+
+class TestMyChatMemberHandler:
+    """Tests for my_chat_member_handler"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "status,expected",
+        [("administrator", True), ("creator", True), ("member", False), ("left", False), ("kicked", False)],
+        ids=["administrator", "owner", "member", "left", "kicked"],
+    )
+    async def test_updates_admin_status(self, monkeypatch, cache, status, expected):
+        monkeypatch.setattr("bot.handlers.chat_member_handler.channel_info_cache", cache)
+        update = MagicMock()
+        update.my_chat_member.chat.type = "channel"
+        update.my_chat_member.chat.id = -1001
+        update.my_chat_member.new_chat_member.status = status
+
+        await my_chat_member_handler(update, MagicMock())
+
+        assert (await cache._store.get("-1001"))["bot_is_admin"] is expected
+
+    @pytest.mark.asyncio
+    async def test_ignores_non_channel_chats(self, monkeypatch, cache):
+        monkeypatch.setattr("bot.handlers.chat_member_handler.channel_info_cache", cache)
+        update = MagicMock()
+        update.my_chat_member.chat.type = "supergroup"
+
+        await my_chat_member_handler(update, MagicMock())
+
+        assert await cache._store.get("-1001") is None
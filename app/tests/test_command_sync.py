@@ -0,0 +1,104 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telegram.error import BadRequest
+
+from bot.command_sync import ADMIN_COMMANDS, COMMON_COMMANDS, CommandSync, commands_hash
+
+
+class FakeSessionFactory:
+    """Stores bot_state value in memory instead of Postgres"""
+
+    def __init__(self, value=None):
+        self.value = value
+        self.saves = 0
+        self.loads = 0
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def scalar(self, statement):
+        self.loads += 1
+        return self.value
+
+    async def execute(self, statement):
+        self.saves += 1
+        self.value = statement.compile().params["value"]
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def bot():
+    bot = MagicMock()
+    bot.set_my_commands = AsyncMock()
+    bot.delete_my_commands = AsyncMock()
+    return bot
+
+
+class TestCommandSync:
+    """Tests for hash based bot command synchronization"""
+
+    @pytest.mark.asyncio
+    async def test_first_sync_pushes_all_scopes(self, bot):
+        factory = FakeSessionFactory()
+
+        assert await CommandSync(factory).sync(bot, [1, 2]) is True
+
+        assert bot.set_my_commands.await_count == 3
+        assert bot.set_my_commands.await_args_list[0].kwargs["commands"] == COMMON_COMMANDS
+        assert bot.set_my_commands.await_args_list[1].kwargs["commands"] == ADMIN_COMMANDS
+        assert factory.value == {"hash": commands_hash([1, 2]), "admin_ids": [1, 2]}
+
+    @pytest.mark.asyncio
+    async def test_unchanged_set_not_pushed(self, bot):
+        factory = FakeSessionFactory({"hash": commands_hash([2, 1]), "admin_ids": [1, 2]})
+
+        assert await CommandSync(factory).sync(bot, [1, 2]) is False
+
+        bot.set_my_commands.assert_not_called()
+        assert factory.saves == 0
+
+    @pytest.mark.asyncio
+    async def test_removed_admin_scope_deleted(self, bot):
+        factory = FakeSessionFactory({"hash": commands_hash([1, 2]), "admin_ids": [1, 2]})
+
+        await CommandSync(factory).sync(bot, [1])
+
+        assert bot.set_my_commands.await_count == 2
+        assert bot.delete_my_commands.await_args.kwargs["scope"].chat_id == 2
+        assert factory.value["admin_ids"] == [1]
+
+    @pytest.mark.asyncio
+    async def test_failed_admin_push_retried_next_time(self, bot):
+        factory = FakeSessionFactory()
+        bot.set_my_commands.side_effect = [None, BadRequest("Chat not found")]
+
+        await CommandSync(factory).sync(bot, [1])
+
+        assert factory.saves == 0
+
+    @pytest.mark.asyncio
+    async def test_periodic_retry_then_no_op(self, bot):
+        factory = FakeSessionFactory()
+        command_sync = CommandSync(factory)
+        bot.set_my_commands.side_effect = [None, BadRequest("Chat not found"), None, None]
+
+        assert await command_sync.sync(bot, [1]) is True
+        assert factory.saves == 0
+        # Следующий запуск периодической задачи выставляет команды админа
+        await command_sync.sync(bot, [1])
+        assert factory.saves == 1
+        assert bot.set_my_commands.await_count == 4
+
+        loads = factory.loads
+        assert await command_sync.sync(bot, [1]) is False
+        assert factory.loads == loads
+        assert bot.set_my_commands.await_count == 4
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from immich import connection_probe
+from immich.connection_probe import ConnectionValidator
+from immich.host_guard import CircuitBreaker, HostGuardRegistry
+from immich.http_pools import HostPoolRegistry
+from immich.immich_client import ImmichClient
+from utils.kv_store import MemoryKeyValueStore
+
+
+class FakeClient:
+    def __init__(self, status_code=200, api_key="secret-key"):
+        self.base_url = "http://immich.local"
+        self.api_key = api_key
+        self.status_code = status_code
+        self.requests = 0
+
+    async def request(self, method, url, **kwargs):
+        self.requests += 1
+        if self.status_code is None:
+            raise httpx.ConnectError("connection refused")
+        return SimpleNamespace(status_code=self.status_code)
+
+
+@pytest.fixture
+def validator():
+    return ConnectionValidator(MemoryKeyValueStore(), ok_ttl=600, fail_backoff=30, max_fail_backoff=120)
+
+
+@pytest.fixture
+def wall_clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(connection_probe.time, "time", lambda: clock.now)
+    return clock
+
+
+class TestConnectionValidator:
+    """Tests for cached Immich connection checks"""
+
+    @pytest.mark.asyncio
+    async def test_success_skips_next_probe(self, validator):
+        client = FakeClient()
+
+        assert await validator.validate(client) is True
+        assert await validator.validate(FakeClient()) is True
+
+        assert client.requests == 1
+        assert validator.get_stats()["probes"] == 1
+        assert validator.get_stats()["cached_ok"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failure_rejected_until_backoff(self, validator, wall_clock):
+        client = FakeClient(status_code=None)
+
+        assert await validator.validate(client) is False
+        wall_clock.now += 29
+        assert await validator.validate(client) is False
+        assert client.requests == 1
+
+        wall_clock.now += 1
+        client.status_code = 200
+        assert await validator.validate(client) is True
+        assert client.requests == 2
+
+    @pytest.mark.asyncio
+    async def test_backoff_doubles_up_to_max(self, validator, wall_clock):
+        client = FakeClient(status_code=401)
+
+        for backoff in (30, 60, 120, 120):
+            await validator.validate(client)
+            wall_clock.now += backoff - 1
+            await validator.validate(client)
+            wall_clock.now += 1
+
+        assert client.requests == 4
+        assert validator.get_stats()["cached_failed"] == 4
+
+    @pytest.mark.asyncio
+    async def test_key_change_probes_again(self, validator):
+        await validator.validate(FakeClient(status_code=401))
+
+        client = FakeClient(api_key="new-key")
+        assert await validator.validate(client) is True
+        assert client.requests == 1
+
+    @pytest.mark.asyncio
+    async def test_forget_drops_success(self, validator):
+        client = FakeClient()
+        await validator.validate(client)
+
+        await validator.forget(client.base_url, client.api_key)
+        await validator.validate(client)
+
+        assert client.requests == 2
+
+    @pytest.mark.asyncio
+    async def test_hung_host_probe_fails_and_opens_circuit(self, hanging_host):
+        validator = ConnectionValidator(MemoryKeyValueStore(), probe_timeout=0.2)
+        guards = HostGuardRegistry(breaker_factory=lambda: CircuitBreaker(failure_rate=0.5, min_calls=2))
+        pools = HostPoolRegistry()
+        clients = [ImmichClient(hanging_host, f"key-{i}", pools=pools, guards=guards) for i in range(2)]
+
+        # Разные ключи — два настоящих запроса к зависшему хосту
+        for client in clients:
+            assert await validator.validate(client) is False
+
+        assert guards.available(clients[0].base_url) is False
+        for client in clients:
+            await client.close()
+
+    def test_cache_key_does_not_contain_api_key(self):
+        key = ConnectionValidator.cache_key("http://immich.local", "secret-key")
+
+        assert "secret-key" not in key
+        assert key.startswith("http://immich.local|")
@@ -0,0 +1,128 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from bot import discussion_attachments as discussion_attachments_module
+from bot.discussion_attachments import DiscussionAttachmentQueue
+
+
+@pytest.fixture
+def queue():
+    return DiscussionAttachmentQueue(max_attempts=3, payload_cache_bytes=10)
+
+
+@pytest.fixture
+def app():
+    app = MagicMock()
+    app.bot.send_document = AsyncMock()
+    return app
+
+
+def make_attachment(attempts=1):
+    return SimpleNamespace(
+        telegram_id=1,
+        media_uuid="uuid-1",
+        filename="photo.heic",
+        discussion_chat_id=-100500,
+        discussion_msg_id=42,
+        attempts=attempts,
+    )
+
+
+class TestPayloadCache:
+    """Tests for in-memory payload cache"""
+
+    def test_pop_remembered_payload(self, queue):
+        queue._remember_payload(1, b"abc")
+
+        assert queue._pop_payload(1) == b"abc"
+        assert queue._pop_payload(1) is None
+        assert queue._payloads_size == 0
+
+    def test_evicts_oldest_over_limit(self, queue):
+        queue._remember_payload(1, b"aaaa")
+        queue._remember_payload(2, b"bbbb")
+        queue._remember_payload(3, b"cccc")
+
+        assert list(queue._payloads) == [2, 3]
+        assert queue._payloads_size == 8
+
+    def test_skips_payload_larger_than_limit(self, queue):
+        queue._remember_payload(1, b"x" * 11)
+
+        assert queue._payloads == {}
+        assert queue._payloads_size == 0
+
+    def test_skips_payload_larger_than_item_limit(self):
+        queue = DiscussionAttachmentQueue(payload_cache_bytes=10, payload_max_bytes=4)
+
+        queue._remember_payload(1, b"x" * 5)
+        queue._remember_payload(2, b"x" * 4)
+
+        assert list(queue._payloads) == [2]
+
+
+class TestSend:
+    """Tests for background upload of a claimed attachment"""
+
+    @pytest.mark.asyncio
+    async def test_send_uses_cached_payload(self, queue, app, monkeypatch):
+        finished = []
+        monkeypatch.setattr(queue, "_claim", AsyncMock(return_value=make_attachment()))
+
+        async def fake_finish(*args, **kwargs):
+            finished.append((args, kwargs))
+
+        monkeypatch.setattr(queue, "_finish", fake_finish)
+        download = AsyncMock()
+        monkeypatch.setattr(discussion_attachments_module.immich_service, "download_asset", download)
+        queue._remember_payload(7, b"raw")
+
+        await queue._send(app, 7)
+
+        download.assert_not_called()
+        app.bot.send_document.assert_awaited_once_with(
+            chat_id=-100500, document=b"raw", filename="photo.heic", reply_to_message_id=42
+        )
+        assert finished == [((7, "sent"), {})]
+
+    @pytest.mark.asyncio
+    async def test_send_redownloads_without_payload(self, queue, app, monkeypatch):
+        monkeypatch.setattr(queue, "_claim", AsyncMock(return_value=make_attachment()))
+        monkeypatch.setattr(queue, "_finish", AsyncMock())
+        download = AsyncMock(return_value=b"from immich")
+        monkeypatch.setattr(discussion_attachments_module.immich_service, "download_asset", download)
+
+        await queue._send(app, 7)
+
+        download.assert_awaited_once_with(1, "uuid-1")
+        assert app.bot.send_document.await_args.kwargs["document"] == b"from immich"
+
+    @pytest.mark.asyncio
+    async def test_send_skips_unclaimed(self, queue, app, monkeypatch):
+        monkeypatch.setattr(queue, "_claim", AsyncMock(return_value=None))
+
+        await queue._send(app, 7)
+
+        app.bot.send_document.assert_not_called()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "attempts,expected_status",
+        [(1, "pending"), (2, "pending"), (3, "failed")],
+        ids=["first_attempt_retry", "second_attempt_retry", "last_attempt_failed"],
+    )
+    async def test_send_failure_status(self, queue, app, monkeypatch, attempts, expected_status):
+        finished = []
+        monkeypatch.setattr(queue, "_claim", AsyncMock(return_value=make_attachment(attempts)))
+
+        async def fake_finish(*args, **kwargs):
+            finished.append((args, kwargs))
+
+        monkeypatch.setattr(queue, "_finish", fake_finish)
+        queue._remember_payload(7, b"raw")
+        app.bot.send_document.side_effect = RuntimeError("flood")
+
+        await queue._send(app, 7)
+
+        assert finished == [((7, expected_status), {"error": "flood"})]
@@ -1,12 +1,24 @@
 import pytest
+import pytest_asyncio
 import asyncio
-from datetime import datetime, timedelta
+import time
 from bot.handlers.discussion_forward_tracker_handler import DiscussionForwardTracker
 
 
-@pytest.fixture
-def tracker():
-    return DiscussionForwardTracker(ttl_seconds=60)
+@pytest_asyncio.fixture
+async def tracker():
+    tracker = DiscussionForwardTracker(ttl_seconds=60)
+    for channel_id in (123, 444, 111) + tuple(range(10)):
+        await tracker.track_channel(channel_id)
+    return tracker
+
+
+def expire(tracker, key):
+    """Move entry deadline to the past (heap entry is re-pushed to keep it consistent)"""
+    past = time.monotonic() - 1
+    tracker._mapping[key][1] = past
+    tracker._deadlines.append((past, key))
+    tracker._deadlines.sort()
 
 
 class TestDiscussionForwardTrackerStore:
@@ -14,21 +26,21 @@ class TestDiscussionForwardTrackerStore:
 
     @pytest.mark.asyncio
     async def test_store_creates_mapping(self, tracker):
-        await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=789)
+        assert await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=789) is True
 
         key = (123, 456)
         assert key in tracker._mapping
         assert tracker._mapping[key][0] == 789
 
     @pytest.mark.asyncio
-    async def test_store_sets_event(self, tracker):
-        key = (123, 456)
-        # Access waiter to create event
-        _ = tracker._waiters[key]
+    async def test_store_resolves_waiter(self, tracker):
+        waiter = asyncio.create_task(tracker.get(channel_id=123, channel_msg_id=456, timeout=1.0))
+        await asyncio.sleep(0)
 
         await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=789)
 
-        assert tracker._waiters[key].is_set()
+        assert await waiter == 789
+        assert tracker._waiters == {}
 
     @pytest.mark.asyncio
     async def test_store_overwrites_existing(self, tracker):
@@ -38,9 +50,34 @@ class TestDiscussionForwardTrackerStore:
         key = (123, 456)
         assert tracker._mapping[key][0] == 200
 
+    @pytest.mark.asyncio
+    async def test_store_ignores_untracked_channel(self, tracker):
+        assert await tracker.store(channel_id=999, channel_msg_id=1, discussion_msg_id=2) is False
+
+        assert tracker._mapping == {}
+
+    @pytest.mark.asyncio
+    async def test_store_untracked_channel_with_waiter(self, tracker):
+        waiter = asyncio.create_task(tracker.get(channel_id=999, channel_msg_id=1, timeout=1.0))
+        await asyncio.sleep(0)
+
+        assert await tracker.store(channel_id=999, channel_msg_id=1, discussion_msg_id=2) is True
+        assert await waiter == 2
+
+    @pytest.mark.asyncio
+    async def test_store_respects_max_entries(self):
+        tracker = DiscussionForwardTracker(ttl_seconds=60, max_entries=3)
+        await tracker.track_channel(1)
+
+        for msg_id in range(5):
+            await tracker.store(channel_id=1, channel_msg_id=msg_id, discussion_msg_id=msg_id * 10)
+
+        assert set(tracker._mapping) == {(1, 2), (1, 3), (1, 4)}
+        assert tracker.orphans == 2
+
 
 class TestDiscussionForwardTrackerGet:
-    """Tests for get method"""
+    """Tests for get and peek methods"""
 
     @pytest.mark.asyncio
     async def test_get_existing_mapping(self, tracker):
@@ -56,6 +93,12 @@ class TestDiscussionForwardTrackerGet:
 
         assert result is None
 
+    @pytest.mark.asyncio
+    async def test_get_timeout_leaves_no_waiters(self, tracker):
+        await tracker.get(channel_id=999, channel_msg_id=999, timeout=0.01)
+
+        assert tracker._waiters == {}
+
     @pytest.mark.asyncio
     async def test_get_waits_for_store(self, tracker):
         async def delayed_store():
@@ -69,44 +112,63 @@ class TestDiscussionForwardTrackerGet:
 
     @pytest.mark.asyncio
     async def test_get_expired_mapping_returns_none(self, tracker):
-        # Store with past timestamp
-        key = (123, 456)
-        expired_time = datetime.now() - timedelta(seconds=120)  # Expired 2 minutes ago
-        tracker._mapping[key] = (789, expired_time)
+        await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=789)
+        expire(tracker, (123, 456))
 
         result = await tracker.get(channel_id=123, channel_msg_id=456, timeout=0.1)
 
         assert result is None
 
+    @pytest.mark.asyncio
+    async def test_peek_does_not_wait(self, tracker):
+        assert await tracker.peek(channel_id=123, channel_msg_id=456) is None
+
+        await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=789)
+
+        assert await tracker.peek(channel_id=123, channel_msg_id=456) == 789
+        assert tracker._waiters == {}
+
 
 class TestDiscussionForwardTrackerCleanup:
     """Tests for cleanup_expired method"""
 
     @pytest.mark.asyncio
     async def test_cleanup_removes_expired(self, tracker):
-        # Add expired entry
-        key_expired = (111, 222)
-        expired_time = datetime.now() - timedelta(seconds=120)
-        tracker._mapping[key_expired] = (333, expired_time)
+        await tracker.store(channel_id=111, channel_msg_id=222, discussion_msg_id=333)
+        expire(tracker, (111, 222))
 
-        # Add fresh entry
         await tracker.store(channel_id=444, channel_msg_id=555, discussion_msg_id=666)
 
         await tracker.cleanup_expired()
 
-        assert key_expired not in tracker._mapping
+        assert (111, 222) not in tracker._mapping
         assert (444, 555) in tracker._mapping
 
     @pytest.mark.asyncio
-    async def test_cleanup_removes_waiters(self, tracker):
-        key = (111, 222)
-        expired_time = datetime.now() - timedelta(seconds=120)
-        tracker._mapping[key] = (333, expired_time)
-        _ = tracker._waiters[key]  # Create waiter
+    async def test_cleanup_counts_orphans(self, tracker):
+        await tracker.store(channel_id=111, channel_msg_id=1, discussion_msg_id=10)
+        await tracker.store(channel_id=111, channel_msg_id=2, discussion_msg_id=20)
+        await tracker.peek(channel_id=111, channel_msg_id=2)
+        expire(tracker, (111, 1))
+        expire(tracker, (111, 2))
+
+        await tracker.cleanup_expired()
+
+        assert tracker._mapping == {}
+        assert tracker.orphans == 1
+
+    @pytest.mark.asyncio
+    async def test_cleanup_skips_overwritten_deadline(self, tracker):
+        await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=1)
+        old_deadline = tracker._mapping[(123, 456)][1]
+        await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=2)
+        tracker._deadlines = [(time.monotonic() - 1, (123, 456))] + [
+            d for d in tracker._deadlines if d[0] != old_deadline
+        ]
 
         await tracker.cleanup_expired()
 
-        assert key not in tracker._waiters
+        assert tracker._mapping[(123, 456)][0] == 2
 
     @pytest.mark.asyncio
     async def test_cleanup_empty_mapping(self, tracker):
@@ -128,6 +190,7 @@ class TestDiscussionForwardTrackerTTL:
     @pytest.mark.asyncio
     async def test_custom_ttl(self):
         tracker = DiscussionForwardTracker(ttl_seconds=1)
+        await tracker.track_channel(123)
 
         await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=789)
         result_fresh = await tracker.get(channel_id=123, channel_msg_id=456, timeout=0.1)
@@ -139,6 +202,18 @@ class TestDiscussionForwardTrackerTTL:
         assert result_expired is None
 
 
+class TestDiscussionForwardTrackerStats:
+    """Tests for counters"""
+
+    @pytest.mark.asyncio
+    async def test_stats(self, tracker):
+        await tracker.store(channel_id=123, channel_msg_id=1, discussion_msg_id=10)
+        await tracker.get(channel_id=123, channel_msg_id=1, timeout=0.1)
+        await tracker.get(channel_id=123, channel_msg_id=2, timeout=0.01)
+
+        assert await tracker.stats() == {"hits": 1, "timeouts": 1, "orphans": 0, "size": 1, "waiters": 0}
+
+
 class TestDiscussionForwardTrackerConcurrency:
     """Tests for concurrent access"""
 
@@ -168,3 +243,12 @@ class TestDiscussionForwardTrackerConcurrency:
         results = await asyncio.gather(*[get_task(i) for i in range(10)])
 
         assert results == [i * 10 for i in range(10)]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_waiters_same_key(self, tracker):
+        waiters = [asyncio.create_task(tracker.get(123, 456, timeout=1.0)) for _ in range(3)]
+        await asyncio.sleep(0)
+
+        await tracker.store(channel_id=123, channel_msg_id=456, discussion_msg_id=789)
+
+        assert await asyncio.gather(*waiters) == [789, 789, 789]
@@ -0,0 +1,227 @@
+import asyncio
+
+import httpx
+import pytest
+
+from immich.host_guard import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AimdLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    HostGuard,
+    HostGuardRegistry,
+)
+from immich.http_pools import HostPoolRegistry
+from immich.immich_client import ImmichClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_rate=0.5, min_calls=4, open_seconds=10, max_open_seconds=30, clock=clock)
+
+
+class TestCircuitBreaker:
+    """Tests for per-host circuit breaker states"""
+
+    def test_opens_when_failure_rate_reached(self, breaker):
+        for failed in (False, True, False):
+            breaker.before_call()
+            breaker.record(failed, 0.1)
+        assert breaker.state == CLOSED
+
+        breaker.before_call()
+        breaker.record(True, 0.1)
+
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_slow_calls_count_as_failures(self, breaker):
+        for _ in range(4):
+            breaker.record(False, breaker.slow_call_seconds + 1)
+
+        assert breaker.state == OPEN
+
+    def test_half_open_lets_one_trial(self, breaker, clock):
+        for _ in range(4):
+            breaker.record(True, 0.1)
+        clock.now = 10
+
+        assert breaker.state == HALF_OPEN
+        breaker.before_call()
+        assert breaker.available() is False
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.record(False, 0.1)
+        assert breaker.state == CLOSED
+
+    def test_failed_trial_doubles_open_time(self, breaker, clock):
+        for _ in range(4):
+            breaker.record(True, 0.1)
+        clock.now = 10
+        breaker.before_call()
+        breaker.record(True, 0.1)
+
+        clock.now = 29
+        assert breaker.state == OPEN
+        clock.now = 30
+        assert breaker.state == HALF_OPEN
+
+    def test_cancelled_trial_released(self, breaker, clock):
+        for _ in range(4):
+            breaker.record(True, 0.1)
+        clock.now = 10
+        breaker.before_call()
+
+        breaker.cancel_call()
+
+        assert breaker.available() is True
+
+
+class TestAimdLimiter:
+    """Tests for additive increase / multiplicative decrease concurrency limit"""
+
+    @pytest.mark.asyncio
+    async def test_increase_and_decrease(self):
+        limiter = AimdLimiter(initial=4, max_limit=10)
+
+        for _ in range(4):
+            await limiter.acquire()
+            await limiter.release(False, 0.1)
+        assert limiter.limit == pytest.approx(5, abs=0.1)
+
+        await limiter.acquire()
+        await limiter.release(True, 0.1)
+        assert int(limiter.limit) == 2
+
+    @pytest.mark.asyncio
+    async def test_limit_bounds_concurrency(self):
+        limiter = AimdLimiter(initial=2)
+        await limiter.acquire()
+        await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await limiter.release(False, 0.1)
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_flight == 2
+
+
+class TestHostGuard:
+    """Tests for requests going through breaker and limiter"""
+
+    @staticmethod
+    def client(status_code, calls):
+        def handler(request):
+            calls.append(request.url.path)
+            return httpx.Response(status_code)
+
+        return httpx.AsyncClient(base_url="http://immich.local", transport=httpx.MockTransport(handler))
+
+    @pytest.mark.asyncio
+    async def test_server_errors_open_circuit(self, breaker):
+        calls = []
+        guard = HostGuard(breaker, AimdLimiter())
+        client = self.client(503, calls)
+
+        for _ in range(4):
+            await guard.request(lambda: client.get("/api/albums"))
+        with pytest.raises(CircuitOpenError):
+            await guard.request(lambda: client.get("/api/albums"))
+
+        assert len(calls) == 4
+        assert int(guard.limiter.limit) == 1
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_client_errors_keep_circuit_closed(self, breaker):
+        calls = []
+        guard = HostGuard(breaker, AimdLimiter())
+        client = self.client(404, calls)
+
+        for _ in range(6):
+            await guard.request(lambda: client.get("/api/albums/missing"))
+
+        assert guard.breaker.state == CLOSED
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_network_errors_open_circuit(self, breaker):
+        def handler(request):
+            raise httpx.ConnectError("connection refused")
+
+        guard = HostGuard(breaker, AimdLimiter())
+        client = httpx.AsyncClient(base_url="http://immich.local", transport=httpx.MockTransport(handler))
+
+        for _ in range(4):
+            with pytest.raises(httpx.ConnectError):
+                await guard.request(lambda: client.get("/api/albums"))
+
+        assert guard.breaker.state == OPEN
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_hung_host_opens_circuit(self, hanging_host):
+        registry = HostGuardRegistry(breaker_factory=lambda: CircuitBreaker(failure_rate=0.5, min_calls=2))
+        client = ImmichClient(hanging_host, "key", pools=HostPoolRegistry(), guards=registry)
+
+        for _ in range(2):
+            with pytest.raises(httpx.TimeoutException):
+                await client.request("GET", "/api/albums", timeout=0.2)
+
+        assert client.guard.breaker.state == OPEN
+        assert registry.available(client.base_url) is False
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_slow_cancelled_calls_count_as_failures(self, hanging_host):
+        guard = HostGuard(CircuitBreaker(failure_rate=0.5, min_calls=2, slow_call_seconds=0.1), AimdLimiter())
+        client = httpx.AsyncClient(base_url=hanging_host)
+
+        # Внешний asyncio.timeout отменяет зависший вызов уже после порога медленного вызова
+        for _ in range(2):
+            with pytest.raises(TimeoutError):
+                async with asyncio.timeout(0.2):
+                    await guard.request(lambda: client.get("/api/albums"))
+
+        assert guard.breaker.state == OPEN
+        assert guard.limiter.in_flight == 0
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_fast_cancelled_call_ignored(self, hanging_host):
+        guard = HostGuard(CircuitBreaker(failure_rate=0.5, min_calls=1, slow_call_seconds=10), AimdLimiter())
+        client = httpx.AsyncClient(base_url=hanging_host)
+
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.1):
+                await guard.request(lambda: client.get("/api/albums"))
+
+        assert guard.breaker.state == CLOSED
+        await client.aclose()
+
+    def test_registry_guard_per_host(self):
+        registry = HostGuardRegistry()
+
+        assert registry.get("http://a.local") is registry.get("http://a.local")
+        assert registry.get("http://a.local") is not registry.get("http://b.local")
+        assert registry.available("http://unknown.local") is True
+        assert registry.stats()["http://a.local"]["state"] == CLOSED
@@ -1,6 +1,5 @@
 import pytest
 from datetime import datetime, timedelta
-from collections import deque
 from immich.immich_client import ImmichClient, ImmichService
 
 
@@ -118,32 +117,52 @@ class TestImmichClientRefresh:
         await client.close()
 
 
+class FakeClient:
+    """ImmichClient stub for cache tests"""
+
+    def __init__(self, last_used=None):
+        self.last_used = last_used or datetime.now()
+        self.closed = False
+
+    async def is_valid(self, ttl):
+        return (datetime.now() - self.last_used) < ttl
+
+    async def close(self):
+        self.closed = True
+
+
+def service_with_clients(ids, **kwargs):
+    service = ImmichService(**kwargs)
+    for telegram_id in ids:
+        client = FakeClient()
+        service.active_clients[telegram_id] = client
+        service._schedule_expiry(telegram_id, client)
+    return service
+
+
 class TestImmichServiceLRU:
     """Tests for ImmichService LRU functionality"""
 
     def test_update_lru_moves_to_end(self):
-        service = ImmichService()
-        service._lru_queue = deque([1, 2, 3])
+        service = service_with_clients([1, 2, 3])
 
         service._update_lru(1)
 
-        assert list(service._lru_queue) == [2, 3, 1]
+        assert list(service.active_clients) == [2, 3, 1]
 
-    def test_update_lru_new_item(self):
-        service = ImmichService()
-        service._lru_queue = deque([1, 2, 3])
+    def test_update_lru_unknown_item(self):
+        service = service_with_clients([1, 2, 3])
 
         service._update_lru(4)
 
-        assert list(service._lru_queue) == [1, 2, 3, 4]
+        assert list(service.active_clients) == [1, 2, 3]
 
-    def test_update_lru_empty_queue(self):
+    def test_update_lru_empty_cache(self):
         service = ImmichService()
-        service._lru_queue = deque()
 
         service._update_lru(1)
 
-        assert list(service._lru_queue) == [1]
+        assert list(service.active_clients) == []
 
     @pytest.mark.parametrize(
         "initial_queue,update_id,expected_queue",
@@ -161,12 +180,94 @@ class TestImmichServiceLRU:
         ],
     )
     def test_update_lru_scenarios(self, initial_queue, update_id, expected_queue):
-        service = ImmichService()
-        service._lru_queue = deque(initial_queue)
+        service = service_with_clients(initial_queue)
 
         service._update_lru(update_id)
 
-        assert list(service._lru_queue) == expected_queue
+        assert list(service.active_clients) == expected_queue
+
+    @pytest.mark.asyncio
+    async def test_remove_oldest_closes_client(self):
+        service = service_with_clients([1, 2, 3])
+        oldest = service.active_clients[1]
+        service._update_lru(1)
+        second = service.active_clients[2]
+
+        await service._remove_oldest_client()
+
+        assert list(service.active_clients) == [3, 1]
+        assert second.closed is True
+        assert oldest.closed is False
+
+    @pytest.mark.asyncio
+    async def test_hit_updates_lru(self):
+        service = service_with_clients([1, 2, 3])
+
+        assert await service.ensure_client(1) is True
+
+        assert list(service.active_clients) == [2, 3, 1]
+
+
+class TestImmichServiceExpiry:
+    """Tests for TTL expiry from the deadline heap"""
+
+    @pytest.mark.asyncio
+    async def test_expired_clients_closed(self):
+        service = service_with_clients([1, 2], client_ttl=timedelta(minutes=10))
+        expired = service.active_clients[1]
+        expired.last_used = datetime.now() - timedelta(minutes=11)
+        service._expiry_heap.clear()
+        service._schedule_expiry(1, expired)
+        service._schedule_expiry(2, service.active_clients[2])
+
+        assert await service._expire_clients() == 1
+
+        assert expired.closed is True
+        assert list(service.active_clients) == [2]
+
+    @pytest.mark.asyncio
+    async def test_used_client_rescheduled(self):
+        service = service_with_clients([1], client_ttl=timedelta(minutes=10))
+        client = service.active_clients[1]
+
+        # Срок по куче наступил, но клиент использовали после постановки — переносим
+        client.last_used = datetime.now() + timedelta(minutes=5)
+        assert await service._expire_clients(now=datetime.now() + timedelta(minutes=10)) == 0
+
+        assert client.closed is False
+        assert len(service._expiry_heap) == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_heap_entries_skipped(self):
+        service = service_with_clients([1], client_ttl=timedelta(minutes=10))
+        old_client = service.active_clients[1]
+        await service._remove_client(1)
+        new_client = FakeClient()
+        service.active_clients[1] = new_client
+
+        await service._expire_clients(now=datetime.now() + timedelta(minutes=11))
+
+        assert old_client.closed is True
+        assert new_client.closed is False
+        assert 1 in service.active_clients
+
+    @pytest.mark.asyncio
+    async def test_close_all_closes_clients(self):
+        service = service_with_clients([1, 2])
+        clients = list(service.active_clients.values())
+        await service.start()
+
+        await service.close_all()
+
+        assert all(client.closed for client in clients)
+        assert len(service.active_clients) == 0
+        assert service._cleanup_task is None
+
+    def test_next_cleanup_delay(self):
+        service = service_with_clients([1], client_ttl=timedelta(seconds=30))
+
+        assert 1 <= service._next_cleanup_delay() <= 30
+        assert ImmichService()._next_cleanup_delay() == 300
 
 
 class TestImmichServiceConfig:
@@ -196,10 +297,81 @@ class TestImmichServiceConfig:
         assert service.client_ttl == timedelta(hours=ttl_hours)
         assert service.max_clients == max_clients
         assert len(service.active_clients) == 0
-        assert len(service._lru_queue) == 0
+        assert len(service._expiry_heap) == 0
 
     def test_default_initialization(self):
         service = ImmichService()
 
         assert service.client_ttl == timedelta(hours=2)
         assert service.max_clients == 1000
+
+
+class TestHostPoolRegistry:
+    """Tests for connection pools shared per Immich host"""
+
+    @staticmethod
+    def registry(seen_keys=None):
+        import httpx
+        from immich.http_pools import HostPoolRegistry
+
+        def handler(request):
+            if seen_keys is not None:
+                seen_keys.append(request.headers.get("x-api-key"))
+            return httpx.Response(200, json=[])
+
+        return HostPoolRegistry(transport=httpx.MockTransport(handler))
+
+    @pytest.mark.asyncio
+    async def test_clients_of_same_host_share_pool(self):
+        pools = self.registry()
+        first = ImmichClient("immich.local:2283", "key1", pools=pools)
+        second = ImmichClient("http://immich.local:2283/", "key2", pools=pools)
+        other = ImmichClient("https://other.local", "key3", pools=pools)
+
+        assert first.client is second.client
+        assert first.client is not other.client
+        assert pools.stats()["http://immich.local:2283"]["users"] == 2
+
+        for client in (first, second, other):
+            await client.close()
+
+    @pytest.mark.asyncio
+    async def test_api_key_sent_per_client(self):
+        seen_keys = []
+        pools = self.registry(seen_keys)
+        first = ImmichClient("http://immich.local", "key1", pools=pools)
+        second = ImmichClient("http://immich.local", "key2", pools=pools)
+
+        await first.get_albums()
+        await second.get_albums()
+
+        assert seen_keys == ["key1", "key2"]
+        assert pools.stats()["http://immich.local"]["requests"] == 2
+        await first.close()
+        await second.close()
+
+    @pytest.mark.asyncio
+    async def test_pool_closed_after_last_client(self):
+        pools = self.registry()
+        first = ImmichClient("http://immich.local", "key1", pools=pools)
+        second = ImmichClient("http://immich.local", "key2", pools=pools)
+        shared = first.client
+
+        await first.close()
+        await first.close()  # Повторное закрытие не отпускает пул второй раз
+        assert not shared.is_closed
+
+        await second.close()
+        assert shared.is_closed
+        assert pools.stats() == {}
+
+    def test_http2_falls_back_without_h2(self, monkeypatch):
+        from immich import http_pools
+
+        monkeypatch.setattr(http_pools, "http2_available", lambda: False)
+        pools = http_pools.HostPoolRegistry(http2=True)
+
+        client = pools.acquire("http://immich.local")
+
+        assert pools.stats()["http://immich.local"]["http2"] is False
+        assert client is not None
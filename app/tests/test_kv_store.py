@@ -0,0 +1,143 @@
+import pytest
+import asyncio
+
+from bot.handlers.discussion_forward_tracker_handler import RedisDiscussionForwardTracker
+from utils.kv_store import MemoryKeyValueStore, RedisKeyValueStore
+
+
+class TestMemoryKeyValueStore:
+    """Tests for in-process key-value store"""
+
+    @pytest.mark.asyncio
+    async def test_set_and_get(self):
+        store = MemoryKeyValueStore()
+
+        await store.set("key", {"a": 1}, ttl_seconds=60)
+
+        assert await store.get("key") == {"a": 1}
+
+    @pytest.mark.asyncio
+    async def test_get_missing(self):
+        assert await MemoryKeyValueStore().get("missing") is None
+
+    @pytest.mark.asyncio
+    async def test_expired_value_dropped(self):
+        store = MemoryKeyValueStore()
+
+        await store.set("key", 1, ttl_seconds=0)
+
+        assert await store.get("key") is None
+        assert store._data == {}
+
+    @pytest.mark.asyncio
+    async def test_unread_expired_keys_purged_on_set(self):
+        store = MemoryKeyValueStore(purge_interval_seconds=0)
+        await store.set("expired", 1, ttl_seconds=0)
+        await store.set("alive", 2, ttl_seconds=60)
+
+        await store.set("new", 3, ttl_seconds=60)
+
+        assert set(store._data) == {"alive", "new"}
+
+    @pytest.mark.asyncio
+    async def test_purge_not_more_often_than_interval(self):
+        store = MemoryKeyValueStore(purge_interval_seconds=3600)
+        await store.set("expired", 1, ttl_seconds=0)
+
+        await store.set("new", 2, ttl_seconds=60)
+
+        assert "expired" in store._data
+
+    @pytest.mark.asyncio
+    async def test_delete(self):
+        store = MemoryKeyValueStore()
+        await store.set("key", 1, ttl_seconds=60)
+
+        await store.delete("key")
+        await store.delete("key")
+
+        assert await store.get("key") is None
+
+
+class TestRedisKeyValueStore:
+    """Tests for Redis key-value store (need REDIS_TEST_URL)"""
+
+    @pytest.mark.asyncio
+    async def test_values_shared_between_instances(self, redis_client):
+        first = RedisKeyValueStore(redis_client, "test")
+        second = RedisKeyValueStore(redis_client, "test")
+
+        await first.set("key", {"linked_chat_id": -100500, "bot_is_admin": None}, ttl_seconds=60)
+
+        assert await second.get("key") == {"linked_chat_id": -100500, "bot_is_admin": None}
+
+    @pytest.mark.asyncio
+    async def test_namespaces_are_isolated(self, redis_client):
+        await RedisKeyValueStore(redis_client, "a").set("key", 1, ttl_seconds=60)
+
+        assert await RedisKeyValueStore(redis_client, "b").get("key") is None
+
+    @pytest.mark.asyncio
+    async def test_ttl_and_delete(self, redis_client):
+        store = RedisKeyValueStore(redis_client, "test")
+
+        await store.set("short", 1, ttl_seconds=0.05)
+        await store.set("key", 1, ttl_seconds=60)
+        await store.delete("key")
+        await asyncio.sleep(0.1)
+
+        assert await store.get("short") is None
+        assert await store.get("key") is None
+
+
+class TestRedisDiscussionForwardTracker:
+    """Forward seen by one replica is visible to another (need REDIS_TEST_URL)"""
+
+    @pytest.mark.asyncio
+    async def test_store_on_other_replica(self, redis_client):
+        poster = RedisDiscussionForwardTracker(redis_client, ttl_seconds=60)
+        receiver = RedisDiscussionForwardTracker(redis_client, ttl_seconds=60)
+        await poster.track_channel(123)
+
+        assert await receiver.store(123, 456, 789) is True
+        assert await poster.peek(123, 456) == 789
+
+    @pytest.mark.asyncio
+    async def test_waiter_woken_by_other_replica(self, redis_client):
+        poster = RedisDiscussionForwardTracker(redis_client, ttl_seconds=60)
+        receiver = RedisDiscussionForwardTracker(redis_client, ttl_seconds=60)
+        await poster.track_channel(123)
+
+        waiter = asyncio.create_task(poster.get(123, 456, timeout=2.0))
+        await asyncio.sleep(0.1)
+        await receiver.store(123, 456, 789)
+
+        assert await waiter == 789
+
+    @pytest.mark.asyncio
+    async def test_untracked_channel_ignored(self, redis_client):
+        tracker = RedisDiscussionForwardTracker(redis_client, ttl_seconds=60)
+
+        assert await tracker.store(999, 1, 2) is False
+        assert await tracker.peek(999, 1) is None
+
+    @pytest.mark.asyncio
+    async def test_get_timeout(self, redis_client):
+        tracker = RedisDiscussionForwardTracker(redis_client, ttl_seconds=60)
+
+        assert await tracker.get(123, 456, timeout=0.1) is None
+        assert tracker.timeouts == 1
+
+    @pytest.mark.asyncio
+    async def test_cleanup_counts_orphans(self, redis_client):
+        tracker = RedisDiscussionForwardTracker(redis_client, ttl_seconds=60)
+        await tracker.track_channel(123)
+        await tracker.store(123, 1, 10)
+        await tracker.store(123, 2, 20)
+        await tracker.peek(123, 2)
+        await redis_client.zadd("forward_tracker:unread", {"forward_tracker:msg:123:1": 0})
+
+        await tracker.cleanup_expired()
+
+        assert tracker.orphans == 1
+        assert (await tracker.stats())["size"] == 0
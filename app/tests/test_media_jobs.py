@@ -1,4 +1,8 @@
+import uuid
+
 import pytest
+from sqlalchemy.dialects import postgresql
+
 from cron_jobs.post_media_to_channel_job import MediaJobs
 
 
@@ -7,6 +11,13 @@ def media_jobs():
     return MediaJobs()
 
 
+def test_uses_shared_immich_service(media_jobs):
+    from immich.immich_client import immich_service
+
+    # Клиенты и пулы общие с post_to_channel и живут между запусками
+    assert media_jobs.immich_service is immich_service
+
+
 class TestDetermineMediaType:
     """Tests for _determine_media_type method"""
 
@@ -155,7 +166,13 @@ class TestGetLocationInfo:
         [
             # Full location
             (
-                {"city": "Moscow", "state": "Moscow Oblast", "country": "Russia", "latitude": 55.7558, "longitude": 37.6173},
+                {
+                    "city": "Moscow",
+                    "state": "Moscow Oblast",
+                    "country": "Russia",
+                    "latitude": 55.7558,
+                    "longitude": 37.6173,
+                },
                 "Moscow, Moscow Oblast, Russia",
                 55.7558,
                 37.6173,
@@ -206,7 +223,13 @@ class TestProcessAssets:
         "asset,expected_type,expected_format",
         [
             (
-                {"id": "1", "originalPath": "/p.jpg", "originalMimeType": "image/jpeg", "type": "IMAGE", "exifInfo": {}},
+                {
+                    "id": "1",
+                    "originalPath": "/p.jpg",
+                    "originalMimeType": "image/jpeg",
+                    "type": "IMAGE",
+                    "exifInfo": {},
+                },
                 "image",
                 "image/jpeg",
             ),
@@ -321,7 +344,13 @@ class TestProcessAssets:
 
     def test_process_multiple_assets(self, media_jobs):
         assets = [
-            {"id": f"uuid-{i}", "originalPath": f"/photo{i}.jpg", "originalMimeType": "image/jpeg", "type": "IMAGE", "exifInfo": {}}
+            {
+                "id": f"uuid-{i}",
+                "originalPath": f"/photo{i}.jpg",
+                "originalMimeType": "image/jpeg",
+                "type": "IMAGE",
+                "exifInfo": {},
+            }
             for i in range(3)
         ]
         result = media_jobs._process_assets(assets)
@@ -331,9 +360,21 @@ class TestProcessAssets:
     def test_process_asset_skips_invalid(self, media_jobs):
         """Assets that cause errors should be skipped"""
         assets = [
-            {"id": "good1", "originalPath": "/p1.jpg", "originalMimeType": "image/jpeg", "type": "IMAGE", "exifInfo": {}},
+            {
+                "id": "good1",
+                "originalPath": "/p1.jpg",
+                "originalMimeType": "image/jpeg",
+                "type": "IMAGE",
+                "exifInfo": {},
+            },
             {"id": "bad", "originalPath": "/file.unknown", "originalMimeType": ""},  # missing 'type'
-            {"id": "good2", "originalPath": "/p2.jpg", "originalMimeType": "image/jpeg", "type": "IMAGE", "exifInfo": {}},
+            {
+                "id": "good2",
+                "originalPath": "/p2.jpg",
+                "originalMimeType": "image/jpeg",
+                "type": "IMAGE",
+                "exifInfo": {},
+            },
         ]
         result = media_jobs._process_assets(assets)
         assert len(result) == 2
@@ -361,3 +402,447 @@ class TestProcessAssets:
         assert result["info"]["focal"] is None
         assert result["info"]["date"] is None
         assert result["info"]["location"]["location_name"] is None
+
+
+class TestGeocodedLocation:
+    """Tests for location name resolved by reverse geocoder"""
+
+    @pytest.fixture
+    def geocoder(self, monkeypatch):
+        from geo.reverse_geocoder import ReverseGeocoder
+        from cron_jobs import post_media_to_channel_job
+
+        geocoder = ReverseGeocoder(object(), grid_precision=2)
+        monkeypatch.setattr(post_media_to_channel_job, "reverse_geocoder", geocoder)
+        return geocoder
+
+    def test_coords_without_city_marked_pending(self, media_jobs, geocoder):
+        result = media_jobs._get_location_info({"latitude": 35.6762, "longitude": 139.6503})
+
+        assert result["geocode_pending"] is True
+
+    def test_exif_city_not_marked_pending(self, media_jobs, geocoder):
+        result = media_jobs._get_location_info({"city": "Shibuya", "latitude": 35.6762, "longitude": 139.6503})
+
+        assert result["location_name"] == "Shibuya"
+        assert "geocode_pending" not in result
+
+    @pytest.mark.asyncio
+    async def test_location_name_from_geocoder_cache(self, media_jobs, geocoder, monkeypatch):
+        async def fake_prefetch(coords):
+            geocoder._remember({geocoder.cell_key(lat, lon): "Tokyo, JP" for lat, lon in coords})
+
+        monkeypatch.setattr(geocoder, "prefetch", fake_prefetch)
+        location = media_jobs._get_location_info({"country": "Japan", "latitude": 35.6762, "longitude": 139.6503})
+
+        await media_jobs._resolve_locations([location])
+
+        assert location["location_name"] == "Tokyo, JP"
+        assert "geocode_pending" not in location
+
+    @pytest.mark.asyncio
+    async def test_deferred_cell_stays_pending(self, media_jobs, geocoder, monkeypatch):
+        from unittest.mock import AsyncMock
+
+        # Бюджет исчерпан — prefetch ничего не закэшировал
+        monkeypatch.setattr(geocoder, "prefetch", AsyncMock())
+        location = media_jobs._get_location_info({"country": "Japan", "latitude": 35.6762, "longitude": 139.6503})
+
+        await media_jobs._resolve_locations([location])
+
+        assert location["location_name"] == "Japan"
+        assert location["geocode_pending"] is True
+
+    @pytest.mark.asyncio
+    async def test_pending_location_backfilled_before_posting(self, media_jobs, geocoder, monkeypatch):
+        from types import SimpleNamespace
+
+        async def fake_prefetch(coords):
+            geocoder._remember({geocoder.cell_key(lat, lon): "Tokyo, JP" for lat, lon in coords})
+
+        monkeypatch.setattr(geocoder, "prefetch", fake_prefetch)
+        stored = {"latitude": 35.6762, "longitude": 139.6503, "location_name": None, "geocode_pending": True}
+        media = SimpleNamespace(info={"camera": "SONY", "location": stored})
+
+        await media_jobs._backfill_location(media)
+
+        assert media.info["location"]["location_name"] == "Tokyo, JP"
+        assert media.info["camera"] == "SONY"
+        assert stored["geocode_pending"] is True
+
+    @pytest.mark.asyncio
+    async def test_only_new_media_geocoded(self, media_jobs, geocoder, monkeypatch):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        from cron_jobs import post_media_to_channel_job
+
+        prefetched = []
+
+        async def fake_prefetch(coords):
+            prefetched.extend(coords)
+
+        class FakeSession:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                return False
+
+            async def scalar(self, query):
+                # Первый ассет уже загружен раньше
+                return "/photos/1.jpg" in query.compile().params.values()
+
+            def add(self, media_file):
+                pass
+
+            async def commit(self):
+                pass
+
+        assets = [
+            {"id": str(i), "originalPath": f"/photos/{i}.jpg", "exifInfo": {"latitude": i, "longitude": i}}
+            for i in (1, 2)
+        ]
+        monkeypatch.setattr(geocoder, "prefetch", fake_prefetch)
+        monkeypatch.setattr(post_media_to_channel_job, "AsyncSessionLocal", FakeSession)
+        monkeypatch.setattr(
+            media_jobs, "_fetch_media_from_immich", AsyncMock(return_value=media_jobs._process_assets(assets))
+        )
+        user = SimpleNamespace(user_id=1, albums=[SimpleNamespace(album_id=1, album_uuid="a", deleted_at=None)])
+
+        assert await media_jobs._fetch_new_media_for_user(user) == 1
+        assert list(prefetched) == [(2, 2)]
+
+
+class TestFetchNewMediaConcurrency:
+    """Tests for parallel processing of users in fetch_new_media"""
+
+    @pytest.mark.asyncio
+    async def test_users_processed_with_bounded_concurrency(self, media_jobs, monkeypatch):
+        import asyncio
+        from types import SimpleNamespace
+        from cron_jobs import post_media_to_channel_job
+
+        monkeypatch.setattr(post_media_to_channel_job, "MEDIA_JOB_CONCURRENCY", 2)
+        running = 0
+        max_running = 0
+        processed = []
+
+        async def fake_users():
+            for user_id in range(5):
+                yield SimpleNamespace(user_id=user_id, telegram_id=user_id)
+
+        async def fake_fetch_for_user(user):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            processed.append(user.user_id)
+            return 1
+
+        monkeypatch.setattr(media_jobs, "_get_active_users_batch", fake_users)
+        monkeypatch.setattr(media_jobs, "_fetch_new_media_for_user", fake_fetch_for_user)
+
+        await media_jobs._fetch_new_media()
+
+        assert sorted(processed) == [0, 1, 2, 3, 4]
+        assert max_running == 2
+
+
+class TestActiveUsersBatch:
+    """Tests for rotation of the users walk"""
+
+    @pytest.mark.asyncio
+    async def test_walk_wraps_around_after_cursor(self, media_jobs, monkeypatch):
+        from types import SimpleNamespace
+        from cron_jobs import post_media_to_channel_job
+
+        user_ids = [1, 2, 3, 4, 5]
+
+        class FakeSession:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                return False
+
+            async def scalars(self, query):
+                compiled = query.compile(dialect=postgresql.dialect())
+                params = compiled.params
+                cursor = next(v for k, v in params.items() if k.startswith("user_id"))
+                after = " > " in str(compiled).split("WHERE")[1]
+                page = [i for i in user_ids if (i > cursor if after else i <= cursor)]
+                limit, offset = params["param_1"], params["param_2"]
+                page = page[offset : offset + limit]
+                return SimpleNamespace(all=lambda: [SimpleNamespace(user_id=i, telegram_id=i) for i in page])
+
+        monkeypatch.setattr(post_media_to_channel_job, "AsyncSessionLocal", FakeSession)
+
+        walked = [user.user_id async for user in media_jobs._get_active_users_batch(2, start_after_user_id=3)]
+
+        assert walked == [4, 5, 1, 2, 3]
+
+
+class TestUnprocessedMedia:
+    """Tests for keyset pagination of the posting queue"""
+
+    @pytest.mark.asyncio
+    async def test_pages_follow_last_capture_date_and_id(self, media_jobs, monkeypatch):
+        from types import SimpleNamespace
+        from cron_jobs import post_media_to_channel_job
+
+        rows = [(SimpleNamespace(media_id=i), f"2026-01-0{i}") for i in range(1, 4)] + [
+            (SimpleNamespace(media_id=4), None)
+        ]
+        queries = []
+
+        class FakeSession:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                return False
+
+            async def execute(self, query):
+                queries.append(query)
+                page_start = 2 * (len(queries) - 1)
+                return SimpleNamespace(all=lambda: rows[page_start : page_start + 2])
+
+        monkeypatch.setattr(post_media_to_channel_job, "POST_STREAM_CHUNK", 2)
+        monkeypatch.setattr(post_media_to_channel_job, "AsyncSessionLocal", FakeSession)
+
+        media = [item.media_id async for item in media_jobs._unprocessed_media(1)]
+
+        assert media == [1, 2, 3, 4]
+        # Третья порция пустая: вторая была полной
+        assert len(queries) == 3
+        second = queries[1].compile(dialect=postgresql.dialect()).params
+        assert "2026-01-02" in second.values() and 2 in second.values()
+        # После медиа без даты — только медиа без даты с большим media_id
+        third = queries[2].compile(dialect=postgresql.dialect()).params
+        assert 4 in third.values() and not any(str(value).startswith("2026") for value in third.values())
+
+
+class TestPostUserBacklog:
+    """Tests for posting a streamed backlog within budgets"""
+
+    @staticmethod
+    async def stream(items):
+        for item in items:
+            yield item
+
+    @pytest.fixture
+    def posting(self, media_jobs, monkeypatch):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        from cron_jobs import post_media_to_channel_job
+
+        media_jobs.media_poster = SimpleNamespace(post_to_channel=AsyncMock(return_value=True))
+        recorded = []
+
+        async def fake_record(media_id, created_at, success):
+            recorded.append((media_id, success))
+
+        monkeypatch.setattr(post_media_to_channel_job.posting_results, "begin", AsyncMock())
+        monkeypatch.setattr(post_media_to_channel_job.posting_results, "release", AsyncMock())
+        monkeypatch.setattr(post_media_to_channel_job.posting_results, "record", fake_record)
+        monkeypatch.setattr(media_jobs, "_bot_can_post", AsyncMock(return_value=True))
+        monkeypatch.setattr(media_jobs, "_load_posting_cursor", AsyncMock(return_value=None))
+        monkeypatch.setattr(media_jobs, "_save_posting_cursor", AsyncMock())
+        return media_jobs, recorded
+
+    @staticmethod
+    def backlog(count, file_size=10):
+        from types import SimpleNamespace
+
+        return [
+            SimpleNamespace(
+                media_id=i,
+                media_uuid=str(uuid.uuid4()),
+                media_type="image",
+                created_at=None,
+                file_size=file_size,
+                info=None,
+            )
+            for i in range(count)
+        ]
+
+    @pytest.mark.asyncio
+    async def test_user_budget_leaves_rest_for_next_run(self, posting, monkeypatch):
+        from types import SimpleNamespace
+        from cron_jobs import post_media_to_channel_job
+        from cron_jobs.posting_budget import PostingBudget
+
+        media_jobs, recorded = posting
+        monkeypatch.setattr(post_media_to_channel_job, "POST_USER_MAX_ITEMS", 3)
+
+        await media_jobs._post_user_backlog(
+            SimpleNamespace(user_id=1), -1001, self.stream(self.backlog(10)), PostingBudget()
+        )
+
+        assert recorded == [(0, True), (1, True), (2, True)]
+
+    @pytest.mark.asyncio
+    async def test_run_budget_shared_between_users(self, posting, monkeypatch):
+        from types import SimpleNamespace
+        from cron_jobs import post_media_to_channel_job
+        from cron_jobs.posting_budget import PostingBudget
+
+        media_jobs, recorded = posting
+        monkeypatch.setattr(post_media_to_channel_job, "POST_USER_MAX_ITEMS", 0)
+        run_budget = PostingBudget(max_bytes=25)
+
+        await media_jobs._post_user_backlog(SimpleNamespace(user_id=1), -1001, self.stream(self.backlog(2)), run_budget)
+        await media_jobs._post_user_backlog(SimpleNamespace(user_id=2), -1002, self.stream(self.backlog(5)), run_budget)
+
+        assert len(recorded) == 3
+        assert run_budget.exhausted() is True
+
+    @pytest.mark.asyncio
+    async def test_failed_post_is_recorded(self, posting, monkeypatch):
+        from types import SimpleNamespace
+        from cron_jobs.posting_budget import PostingBudget
+
+        media_jobs, recorded = posting
+        media_jobs.media_poster.post_to_channel.return_value = False
+
+        await media_jobs._post_user_backlog(
+            SimpleNamespace(user_id=1), -1001, self.stream(self.backlog(1)), PostingBudget()
+        )
+
+        assert recorded == [(0, False)]
+
+    @pytest.mark.asyncio
+    async def test_backlog_left_when_host_goes_down(self, posting, monkeypatch):
+        from types import SimpleNamespace
+        from cron_jobs import post_media_to_channel_job
+        from cron_jobs.posting_budget import PostingBudget
+
+        media_jobs, recorded = posting
+        monkeypatch.setattr(post_media_to_channel_job, "POST_USER_MAX_ITEMS", 0)
+        monkeypatch.setattr(post_media_to_channel_job.host_guards, "available", lambda host: False)
+        media_jobs.media_poster.post_to_channel.side_effect = [True, False, True]
+
+        await media_jobs._post_user_backlog(
+            SimpleNamespace(user_id=1), -1001, self.stream(self.backlog(3)), PostingBudget(), host_url="http://a.local"
+        )
+
+        # Вторую медиа не скачали из-за упавшего хоста — она не отмечается обработанной
+        assert recorded == [(0, True)]
+        post_media_to_channel_job.posting_results.release.assert_awaited_once_with(1, None)
+
+    @pytest.mark.asyncio
+    async def test_backlog_left_when_bot_loses_admin(self, posting, monkeypatch):
+        from types import SimpleNamespace
+        from cron_jobs import post_media_to_channel_job
+        from cron_jobs.posting_budget import PostingBudget
+
+        media_jobs, recorded = posting
+        media_jobs.media_poster.post_to_channel.side_effect = [True, False, True]
+        media_jobs._bot_can_post.return_value = False
+
+        await media_jobs._post_user_backlog(
+            SimpleNamespace(user_id=1), -1001, self.stream(self.backlog(3)), PostingBudget()
+        )
+
+        assert recorded == [(0, True)]
+        post_media_to_channel_job.posting_results.release.assert_awaited_once_with(1, None)
+
+    @pytest.mark.asyncio
+    async def test_non_admin_channel_skipped_before_posting(self, posting, monkeypatch):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        from cron_jobs import post_media_to_channel_job
+        from cron_jobs.posting_budget import PostingBudget
+
+        media_jobs, recorded = posting
+        user = SimpleNamespace(
+            user_id=1, telegram_id=100, channels=[SimpleNamespace(telegram_channel_id=-1001, deleted_at=None)]
+        )
+
+        async def fake_users(**kwargs):
+            yield user
+
+        monkeypatch.setattr(media_jobs, "_get_active_users_batch", fake_users)
+        monkeypatch.setattr(post_media_to_channel_job.user_config_cache, "get", AsyncMock(return_value=None))
+        media_jobs._bot_can_post.return_value = False
+        post_user_backlog = AsyncMock()
+        monkeypatch.setattr(media_jobs, "_post_user_backlog", post_user_backlog)
+
+        await media_jobs._post_backlogs(PostingBudget())
+
+        media_jobs._bot_can_post.assert_awaited_once_with(-1001)
+        post_user_backlog.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_next_run_starts_after_user_who_exhausted_budget(self, posting, monkeypatch):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        from cron_jobs import post_media_to_channel_job
+        from cron_jobs.posting_budget import PostingBudget
+
+        media_jobs, recorded = posting
+        users = [
+            SimpleNamespace(
+                user_id=i, telegram_id=100 + i, channels=[SimpleNamespace(telegram_channel_id=-i, deleted_at=None)]
+            )
+            for i in (4, 5, 1)
+        ]
+        started_after = []
+
+        async def fake_users(start_after_user_id=None):
+            started_after.append(start_after_user_id)
+            for user in users:
+                yield user
+
+        async def fake_post_user_backlog(user, telegram_channel_id, media_stream, run_budget, host_url=None):
+            run_budget.consume(10)
+
+        media_jobs._load_posting_cursor.return_value = 3
+        monkeypatch.setattr(media_jobs, "_get_active_users_batch", fake_users)
+        monkeypatch.setattr(media_jobs, "_post_user_backlog", fake_post_user_backlog)
+        monkeypatch.setattr(post_media_to_channel_job.user_config_cache, "get", AsyncMock(return_value=None))
+
+        await media_jobs._post_backlogs(PostingBudget(max_items=2))
+
+        assert started_after == [3]
+        media_jobs._save_posting_cursor.assert_awaited_once_with(5)
+
+    @pytest.mark.asyncio
+    async def test_journal_error_aborts_posting(self, posting, monkeypatch):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        from cron_jobs import post_media_to_channel_job
+        from cron_jobs.posting_budget import PostingBudget
+        from cron_jobs.posting_results import PostingJournalError
+
+        media_jobs, recorded = posting
+        monkeypatch.setattr(
+            post_media_to_channel_job.posting_results, "begin", AsyncMock(side_effect=PostingJournalError("disk full"))
+        )
+
+        with pytest.raises(PostingJournalError):
+            await media_jobs._post_user_backlog(
+                SimpleNamespace(user_id=1), -1001, self.stream(self.backlog(3)), PostingBudget()
+            )
+        media_jobs.media_poster.post_to_channel.assert_not_awaited()
+
+
+class TestBotCanPost:
+    """Tests for the channel admin check before posting"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("bot_is_admin,expected", [(True, True), (None, True), (False, False)])
+    async def test_admin_status(self, media_jobs, monkeypatch, bot_is_admin, expected):
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock
+        from cron_jobs import post_media_to_channel_job
+
+        media_jobs.media_poster = SimpleNamespace(app=SimpleNamespace(bot=object()))
+        monkeypatch.setattr(
+            post_media_to_channel_job.channel_info_cache,
+            "get",
+            AsyncMock(return_value=SimpleNamespace(bot_is_admin=bot_is_admin)),
+        )
+
+        assert await media_jobs._bot_can_post(-1001) is expected
@@ -0,0 +1,139 @@
+import os
+from datetime import date
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from cron_jobs.media_partitions_job import MediaPartitionMaintenance, add_months, partition_month, partition_name
+from postgres.database import Base
+
+SCHEMA = "media_partitions_test"
+
+
+class TestPartitionNames:
+    """Tests for month helpers"""
+
+    @pytest.mark.parametrize(
+        "month,shift,expected",
+        [
+            (date(2026, 10, 1), 0, date(2026, 10, 1)),
+            (date(2026, 10, 1), 3, date(2027, 1, 1)),
+            (date(2026, 1, 1), -1, date(2025, 12, 1)),
+            (date(2026, 3, 1), -15, date(2024, 12, 1)),
+        ],
+        ids=["same_month", "next_year", "previous_year", "many_months_back"],
+    )
+    def test_add_months(self, month, shift, expected):
+        assert add_months(month, shift) == expected
+
+    def test_partition_name_roundtrip(self):
+        assert partition_name(date(2026, 2, 1)) == "media_files_p202602"
+        assert partition_month("media_files_p202602") == date(2026, 2, 1)
+
+    @pytest.mark.parametrize("name", ["media_files_default", "media_files_p2026", "other_p202602"])
+    def test_partition_month_ignores_other_tables(self, name):
+        assert partition_month(name) is None
+
+
+@pytest_asyncio.fixture
+async def pg_async_engine():
+    """Partitioned media_files in a separate schema (skipped if POSTGRES_TEST_URL is not set)"""
+    url = os.getenv("POSTGRES_TEST_URL")
+    if not url:
+        pytest.skip("POSTGRES_TEST_URL is not set")
+
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE media_files_default PARTITION OF media_files DEFAULT"))
+        conn.execute(text("INSERT INTO users (user_id, telegram_id) VALUES (1, 100)"))
+        conn.execute(text("INSERT INTO albums (album_id, user_id, album_uuid) VALUES (1, 1, 'album')"))
+
+    async_engine = create_async_engine(
+        url.replace("postgresql://", "postgresql+asyncpg://", 1),
+        connect_args={"server_settings": {"search_path": SCHEMA}},
+    )
+    yield engine, async_engine
+
+    await async_engine.dispose()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+def insert_media(conn, media_url: str, created_at: str, processed: bool) -> None:
+    conn.execute(
+        text(
+            "INSERT INTO media_files (media_uuid, user_id, album_id, media_url, media_type, processed, created_at) "
+            "VALUES (md5(:url)::uuid::text, 1, 1, :url, 'image', :processed, :created_at)"
+        ),
+        {"url": media_url, "processed": processed, "created_at": created_at},
+    )
+
+
+class TestMediaPartitionMaintenance:
+    """Compaction of old partitions into posted_assets (need POSTGRES_TEST_URL)"""
+
+    @pytest.mark.asyncio
+    async def test_creates_partitions_and_compacts_old(self, pg_async_engine):
+        engine, async_engine = pg_async_engine
+        maintenance = MediaPartitionMaintenance(async_engine, retention_months=3, months_ahead=1)
+        with engine.begin() as conn:
+            for month in ("2026-01-01", "2026-02-01"):
+                month_start = date.fromisoformat(month)
+                conn.execute(
+                    text(
+                        f"CREATE TABLE {partition_name(month_start)} PARTITION OF media_files "
+                        f"FOR VALUES FROM ('{month_start}') TO ('{add_months(month_start, 1)}')"
+                    )
+                )
+            insert_media(conn, "/old/posted.jpg", "2026-01-10", processed=True)
+            insert_media(conn, "/old/pending.jpg", "2026-02-10", processed=False)
+
+        compacted = await maintenance.run(today=date(2026, 10, 19))
+
+        assert compacted == ["media_files_p202601"]
+        with engine.connect() as conn:
+            partitions = set(
+                conn.execute(
+                    text(
+                        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                        "WHERE i.inhparent = 'media_files'::regclass"
+                    )
+                ).scalars()
+            )
+            posted = conn.execute(text("SELECT media_url FROM posted_assets")).scalars().all()
+
+        assert partitions == {
+            "media_files_default",
+            "media_files_p202602",
+            "media_files_p202610",
+            "media_files_p202611",
+        }
+        assert posted == ["/old/posted.jpg"]
+
+    @pytest.mark.asyncio
+    async def test_lock_timeout_leaves_partition_for_next_run(self, pg_async_engine):
+        engine, async_engine = pg_async_engine
+        maintenance = MediaPartitionMaintenance(async_engine, retention_months=3, months_ahead=0, lock_timeout_ms=100)
+        with engine.begin() as conn:
+            for month_start in (date(2026, 1, 1), date(2026, 10, 1)):
+                conn.execute(
+                    text(
+                        f"CREATE TABLE {partition_name(month_start)} PARTITION OF media_files "
+                        f"FOR VALUES FROM ('{month_start}') TO ('{add_months(month_start, 1)}')"
+                    )
+                )
+            insert_media(conn, "/old/posted.jpg", "2026-01-10", processed=True)
+
+        # Долгий запрос бота держит блокировку media_files
+        with engine.connect() as blocker:
+            blocker.execute(text("SELECT count(*) FROM media_files"))
+            assert await maintenance.run(today=date(2026, 10, 19)) == []
+
+        assert await maintenance.run(today=date(2026, 10, 19)) == ["media_files_p202601"]
@@ -0,0 +1,50 @@
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+
+from immich.host_guard import HostGuardRegistry
+from immich.http_pools import HostPoolRegistry
+from immich.immich_client import ImmichClient
+from utils.metrics import instrument_engine, registry
+
+
+def sample(name, labels=None):
+    return registry.get_sample_value(name, labels or {}) or 0
+
+
+class TestMetrics:
+    """Tests for metrics collected along the pipeline"""
+
+    def test_db_queries_timed(self):
+        engine = create_engine("sqlite://")
+        instrument_engine(engine)
+        before = sample("db_query_duration_seconds_count")
+
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing"))
+            conn.execute(text("SELECT 2"))
+            # Отметка начала упавшего запроса снята
+            assert conn.info["query_started"] == []
+
+        assert sample("db_query_duration_seconds_count") == before + 2
+
+    @pytest.mark.asyncio
+    async def test_immich_requests_by_outcome(self):
+        def handler(request):
+            return httpx.Response(200 if request.url.path == "/api/albums" else 503)
+
+        pools = HostPoolRegistry(transport=httpx.MockTransport(handler))
+        client = ImmichClient("http://metrics.local", "key", pools=pools, guards=HostGuardRegistry())
+        labels_ok = {"method": "GET", "outcome": "2xx"}
+        labels_failed = {"method": "GET", "outcome": "5xx"}
+        ok_before = sample("immich_request_duration_seconds_count", labels_ok)
+        failed_before = sample("immich_request_duration_seconds_count", labels_failed)
+
+        await client.request("GET", "/api/albums")
+        await client.request("GET", "/api/assets/1/original")
+
+        assert sample("immich_request_duration_seconds_count", labels_ok) == ok_before + 1
+        assert sample("immich_request_duration_seconds_count", labels_failed) == failed_before + 1
+        await client.close()
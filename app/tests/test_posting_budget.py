@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from cron_jobs.posting_budget import PostingBudget
+
+
+class TestPostingBudget:
+    """Tests for PostingBudget limits"""
+
+    def test_unlimited_by_default(self):
+        budget = PostingBudget()
+        for _ in range(1000):
+            budget.consume(10**9)
+
+        assert budget.exhausted() is False
+
+    @pytest.mark.parametrize(
+        "limits,sizes,expected",
+        [
+            ({"max_items": 2}, [1], False),
+            ({"max_items": 2}, [1, 1], True),
+            ({"max_bytes": 100}, [60], False),
+            ({"max_bytes": 100}, [60, 60], True),
+            ({"max_bytes": 100}, [None, None, None], False),
+        ],
+        ids=["items_left", "items_reached", "bytes_left", "bytes_reached", "unknown_size"],
+    )
+    def test_limits(self, limits, sizes, expected):
+        budget = PostingBudget(**limits)
+        for size in sizes:
+            budget.consume(size)
+
+        assert budget.exhausted() is expected
+
+    def test_seconds_limit(self):
+        budget = PostingBudget(max_seconds=10)
+        assert budget.exhausted() is False
+
+        budget.started_at = time.monotonic() - 11
+
+        assert budget.exhausted() is True
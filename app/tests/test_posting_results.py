@@ -0,0 +1,167 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from cron_jobs.posting_results import PostingJournalError, PostingResultRecorder
+
+
+class FakeSession:
+    def __init__(self, factory):
+        self._factory = factory
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement):
+        if self._factory.fail:
+            raise ConnectionError("db is down")
+        self._factory.statements.append(statement)
+
+    async def commit(self):
+        self._factory.commits += 1
+
+
+class FakeSessionFactory:
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+        self.fail = False
+
+    def __call__(self):
+        return FakeSession(self)
+
+
+CREATED_AT = datetime(2026, 10, 1, 12, 0)
+
+
+@pytest.fixture
+def session_factory():
+    return FakeSessionFactory()
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "posting_results.journal")
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as journal:
+        return journal.readlines()
+
+
+class TestPostingResultRecorder:
+    """Tests for batched posting results and the crash journal"""
+
+    @pytest.mark.asyncio
+    async def test_flush_every_n_items_in_one_update(self, session_factory, journal_path):
+        recorder = PostingResultRecorder(session_factory, journal_path, flush_items=3, flush_seconds=3600)
+
+        await recorder.record(1, CREATED_AT, True)
+        await recorder.record(2, CREATED_AT, False)
+        assert session_factory.commits == 0
+        assert len(read_lines(journal_path)) == 2
+
+        await recorder.record(3, CREATED_AT, True)
+
+        assert session_factory.commits == 1
+        assert read_lines(journal_path) == []
+        sql = str(session_factory.statements[0].compile(dialect=postgresql.dialect()))
+        assert sql.startswith("UPDATE media_files SET")
+        assert "FROM (VALUES" in sql
+
+    @pytest.mark.asyncio
+    async def test_flush_after_interval(self, session_factory, journal_path):
+        recorder = PostingResultRecorder(session_factory, journal_path, flush_items=100, flush_seconds=0)
+
+        await recorder.record(1, CREATED_AT, True)
+
+        assert session_factory.commits == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_journal_for_next_run(self, session_factory, journal_path):
+        recorder = PostingResultRecorder(session_factory, journal_path, flush_items=2, flush_seconds=3600)
+        session_factory.fail = True
+
+        await recorder.record(1, CREATED_AT, True)
+        await recorder.record(2, CREATED_AT, False)
+        assert len(read_lines(journal_path)) == 2
+
+        # Процесс упал — следующий запуск начинается с replay
+        session_factory.fail = False
+        restarted = PostingResultRecorder(session_factory, journal_path)
+        await restarted.replay()
+
+        assert session_factory.commits == 1
+        params = session_factory.statements[0].compile(dialect=postgresql.dialect()).params
+        assert [value for value in params.values() if type(value) in (int, str)] == [1, 2, "Posting failed"]
+        assert read_lines(journal_path) == []
+
+    @pytest.mark.asyncio
+    async def test_replay_skips_torn_last_line(self, session_factory, journal_path):
+        recorder = PostingResultRecorder(session_factory, journal_path, flush_items=100, flush_seconds=3600)
+        await recorder.record(1, CREATED_AT, True)
+        with open(journal_path, "a", encoding="utf-8") as journal:
+            journal.write('[2, "2026-10')
+
+        await PostingResultRecorder(session_factory, journal_path).replay()
+
+        assert session_factory.commits == 1
+        assert read_lines(journal_path) == []
+
+    @pytest.mark.asyncio
+    async def test_replay_error_aborts_run(self, session_factory, journal_path):
+        recorder = PostingResultRecorder(session_factory, journal_path, flush_items=100, flush_seconds=3600)
+        await recorder.record(1, CREATED_AT, True)
+        session_factory.fail = True
+
+        with pytest.raises(ConnectionError):
+            await PostingResultRecorder(session_factory, journal_path).replay()
+        assert len(read_lines(journal_path)) == 1
+
+    @pytest.mark.asyncio
+    async def test_replay_without_journal(self, session_factory, journal_path):
+        await PostingResultRecorder(session_factory, journal_path).replay()
+
+        assert session_factory.commits == 0
+
+    @pytest.mark.asyncio
+    async def test_replay_marks_interrupted_send_processed(self, session_factory, journal_path):
+        recorder = PostingResultRecorder(session_factory, journal_path, flush_items=100, flush_seconds=3600)
+        await recorder.begin(1, CREATED_AT)
+        await recorder.record(1, CREATED_AT, True)
+        await recorder.begin(2, CREATED_AT)
+        await recorder.release(2, CREATED_AT)
+        # Процесс упал во время отправки третьей медиа
+        await recorder.begin(3, CREATED_AT)
+
+        await PostingResultRecorder(session_factory, journal_path).replay()
+
+        params = session_factory.statements[0].compile(dialect=postgresql.dialect()).params
+        assert [value for value in params.values() if type(value) in (int, str)] == [
+            1,
+            3,
+            "Interrupted while posting",
+        ]
+        assert read_lines(journal_path) == []
+
+    @pytest.mark.asyncio
+    async def test_flush_keeps_marker_of_send_in_progress(self, session_factory, journal_path):
+        recorder = PostingResultRecorder(session_factory, journal_path, flush_items=100, flush_seconds=3600)
+        await recorder.record(1, CREATED_AT, True)
+        await recorder.begin(2, CREATED_AT)
+
+        await recorder.flush()
+
+        assert len(read_lines(journal_path)) == 1
+        assert '"sending"' in read_lines(journal_path)[0]
+
+    @pytest.mark.asyncio
+    async def test_journal_write_error_is_raised(self, session_factory, tmp_path):
+        recorder = PostingResultRecorder(session_factory, str(tmp_path / "missing" / "journal"))
+
+        with pytest.raises(PostingJournalError):
+            await recorder.begin(1, CREATED_AT)
@@ -0,0 +1,184 @@
+import json
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql
+
+from cron_jobs.media_partitions_job import add_months, partition_name
+from cron_jobs.post_media_to_channel_job import MediaJobs
+from postgres.database import Base
+from postgres.models import User, ApiKey, MediaFile
+
+SCHEMA = "query_plan_test"
+MEDIA_FILES = 1_000_000
+USERS = 10_000
+
+
+@pytest.fixture(scope="module")
+def pg_engine():
+    """
+    Postgres with 1M media_files rows in a separate schema (skipped if POSTGRES_TEST_URL is not set)
+
+    Indexes are created from model definitions, which mirror the migrations.
+    """
+    url = os.getenv("POSTGRES_TEST_URL")
+    if not url:
+        pytest.skip("POSTGRES_TEST_URL is not set")
+
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE media_files_default PARTITION OF media_files DEFAULT"))
+        for offset in range(-3, 2):
+            month = add_months(date.today().replace(day=1), offset)
+            conn.execute(
+                text(
+                    f"CREATE TABLE {partition_name(month)} PARTITION OF media_files "
+                    f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+                )
+            )
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO users (user_id, telegram_id, deleted_at) "
+                "SELECT i, 1000000 + i, CASE WHEN i % 10 = 0 THEN now() END FROM generate_series(1, :users) i"
+            ),
+            {"users": USERS},
+        )
+        conn.execute(
+            text(
+                "INSERT INTO api_keys (user_id, api_key, created_at, deleted_at) "
+                "SELECT i % :users + 1, md5(i::text), now() - i * interval '1 minute', "
+                "CASE WHEN i % 3 = 0 THEN now() END FROM generate_series(1, :users * 3) i"
+            ),
+            {"users": USERS},
+        )
+        conn.execute(
+            text(
+                "INSERT INTO albums (album_id, user_id, album_uuid) SELECT i, i, md5(i::text)::uuid::text "
+                "FROM generate_series(1, :users) i"
+            ),
+            {"users": USERS},
+        )
+        # 1% не отправлено, 5% удалено
+        conn.execute(
+            text(
+                "INSERT INTO media_files "
+                "(media_uuid, user_id, album_id, media_url, media_type, processed, created_at, deleted_at, info) "
+                "SELECT md5(i::text)::uuid::text, i % :users + 1, i % :users + 1, '/photos/' || i || '.jpg', 'image', "
+                "i % 100 <> 0, now() - (i % 90) * interval '1 day', CASE WHEN i % 20 = 0 THEN now() END, "
+                "jsonb_build_object("
+                "  'date', to_char(timestamp '2015-01-01' + i * interval '7 minutes', 'YYYY-MM-DD\"T\"HH24:MI:SS'),"
+                "  'camera', 'Camera ' || i % 500,"
+                "  'location', jsonb_build_object("
+                "    'latitude', CASE WHEN i % 50 = 0 THEN 55.75 END, 'longitude', CASE WHEN i % 50 = 0 THEN 37.62 END"
+                "  )"
+                ") FROM generate_series(1, :media) i"
+            ),
+            {"users": USERS, "media": MEDIA_FILES},
+        )
+        conn.execute(text("ANALYZE"))
+
+    yield engine
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+def explain(engine, stmt) -> dict:
+    sql = stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        result = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    # psycopg2 уже декодирует json
+    return (json.loads(result) if isinstance(result, str) else result)[0]["Plan"]
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def index_names(engine, index_name: str) -> set:
+    """Index name plus names of its per-partition indexes"""
+    with engine.connect() as conn:
+        children = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:name)"
+            ),
+            {"name": index_name},
+        ).scalars()
+        return {index_name, *children}
+
+
+def assert_uses_index(engine, plan: dict, index_name: str, table: str) -> None:
+    nodes = list(plan_nodes(plan))
+    names = index_names(engine, index_name)
+    assert any(node.get("Index Name") in names for node in nodes), json.dumps(plan, indent=2)
+    assert not any(
+        node["Node Type"] == "Seq Scan" and node.get("Relation Name", "").startswith(table) for node in nodes
+    ), json.dumps(plan, indent=2)
+
+
+class TestHotPathQueryPlans:
+    """Queries from MediaJobs, ImmichService and setup handlers must use indexes (need POSTGRES_TEST_URL)"""
+
+    def test_media_dedup_lookup(self, pg_engine):
+        stmt = (
+            select(MediaFile.media_id)
+            .where(MediaFile.media_url == "/photos/500001.jpg", MediaFile.deleted_at.is_(None))
+            .limit(1)
+        )
+
+        assert_uses_index(pg_engine, explain(pg_engine, stmt), "ix_media_files_media_url_active", "media_files")
+
+    def test_unprocessed_media_for_user_by_capture_date(self, pg_engine):
+        plan = explain(pg_engine, MediaJobs._unprocessed_media_query(42))
+
+        assert_uses_index(pg_engine, plan, "ix_media_files_unprocessed_by_date", "media_files")
+        # Порядок по дате съемки берется из индексов партиций (Merge Append)
+        assert not any(node["Node Type"] == "Sort" for node in plan_nodes(plan))
+
+    def test_unprocessed_media_next_page(self, pg_engine):
+        stmt = MediaJobs._unprocessed_media_query(42, after=("2026-01-01T00:00:00", 500000)).limit(100)
+
+        assert_uses_index(pg_engine, explain(pg_engine, stmt), "ix_media_files_unprocessed_by_date", "media_files")
+
+    def test_filter_by_camera(self, pg_engine):
+        # Аналог MediaFile.info.contains({"camera": ...}); JSONB-параметр не рендерится литералом для EXPLAIN
+        stmt = select(MediaFile.media_id).where(text("""info @> '{"camera": "Camera 42"}'"""))
+
+        assert_uses_index(pg_engine, explain(pg_engine, stmt), "ix_media_files_info_gin", "media_files")
+
+    def test_filter_with_location(self, pg_engine):
+        stmt = select(MediaFile.media_id).where(
+            MediaFile.user_id == 42,
+            text("(info -> 'location' ->> 'latitude') IS NOT NULL"),
+            MediaFile.deleted_at.is_(None),
+        )
+
+        assert_uses_index(pg_engine, explain(pg_engine, stmt), "ix_media_files_user_id_with_location", "media_files")
+
+    def test_user_by_telegram_id(self, pg_engine):
+        stmt = select(User).where(User.telegram_id == 1004242, User.deleted_at.is_(None)).limit(1)
+
+        assert_uses_index(pg_engine, explain(pg_engine, stmt), "ix_users_telegram_id_active", "users")
+
+    def test_latest_api_key(self, pg_engine):
+        stmt = (
+            select(ApiKey)
+            .where(ApiKey.user_id == 42, ApiKey.deleted_at.is_(None))
+            .order_by(ApiKey.created_at.desc())
+            .limit(1)
+        )
+
+        assert_uses_index(pg_engine, explain(pg_engine, stmt), "ix_api_keys_user_id_active", "api_keys")
@@ -0,0 +1,171 @@
+import pytest
+from unittest.mock import AsyncMock
+
+from geo.reverse_geocoder import ReverseGeocoder, OfflineBackend
+
+
+class FakeBackend:
+    name = "fake"
+    rate_limited = False
+
+    def __init__(self, names=None):
+        self.names = names or {}
+        self.calls = []
+
+    async def reverse(self, lat, lon):
+        self.calls.append((lat, lon))
+        return self.names.get((lat, lon))
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend({(55.76, 37.62): "Москва, Россия"})
+
+
+@pytest.fixture
+def geocoder(backend, monkeypatch):
+    geocoder = ReverseGeocoder(backend, grid_precision=2, min_delay_seconds=0)
+    saved = {}
+    monkeypatch.setattr(geocoder, "_load_from_db", AsyncMock(return_value={}))
+    monkeypatch.setattr(geocoder, "_save_to_db", AsyncMock(side_effect=saved.update))
+    geocoder.saved = saved
+    return geocoder
+
+
+class TestCellKey:
+    """Tests for ReverseGeocoder.cell_key"""
+
+    @pytest.mark.parametrize(
+        "lat,lon,precision,expected",
+        [
+            (55.7558, 37.6173, 2, "55.76,37.62"),
+            (55.7512, 37.6249, 2, "55.75,37.62"),
+            (-33.8688, 151.2093, 1, "-33.9,151.2"),
+            ("35.6762", "139.6503", 2, "35.68,139.65"),
+        ],
+        ids=["moscow", "moscow_neighbour_cell", "negative_precision_1", "string_coords"],
+    )
+    def test_cell_key(self, lat, lon, precision, expected):
+        assert ReverseGeocoder(grid_precision=precision).cell_key(lat, lon) == expected
+
+
+class TestPrefetch:
+    """Tests for ReverseGeocoder.prefetch"""
+
+    @pytest.mark.asyncio
+    async def test_prefetch_resolves_cell_center(self, geocoder, backend):
+        await geocoder.prefetch([(55.7558, 37.6173)])
+
+        assert backend.calls == [(55.76, 37.62)]
+        assert geocoder.lookup_cached(55.7558, 37.6173) == "Москва, Россия"
+        assert geocoder.saved == {"55.76,37.62": "Москва, Россия"}
+
+    @pytest.mark.asyncio
+    async def test_prefetch_same_cell_resolved_once(self, geocoder, backend):
+        await geocoder.prefetch([(55.7558, 37.6173), (55.7561, 37.6168)])
+        await geocoder.prefetch([(55.7558, 37.6173)])
+
+        assert len(backend.calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_prefetch_caches_not_found(self, geocoder, backend):
+        await geocoder.prefetch([(0.0, 0.0)])
+        await geocoder.prefetch([(0.0, 0.0)])
+
+        assert len(backend.calls) == 1
+        assert geocoder.lookup_cached(0.0, 0.0) is None
+        assert geocoder.saved == {"0.00,0.00": None}
+
+    @pytest.mark.asyncio
+    async def test_prefetch_uses_persistent_cache(self, geocoder, backend, monkeypatch):
+        monkeypatch.setattr(geocoder, "_load_from_db", AsyncMock(return_value={"55.76,37.62": "Из БД"}))
+
+        await geocoder.prefetch([(55.7558, 37.6173)])
+
+        assert backend.calls == []
+        assert geocoder.lookup_cached(55.7558, 37.6173) == "Из БД"
+
+    @pytest.mark.asyncio
+    async def test_prefetch_does_not_cache_errors(self, geocoder, backend):
+        async def failing_reverse(lat, lon):
+            raise OSError("network is down")
+
+        backend.reverse = failing_reverse
+
+        await geocoder.prefetch([(55.7558, 37.6173)])
+
+        assert "55.76,37.62" not in geocoder._names
+        assert geocoder.saved == {}
+
+    @pytest.mark.asyncio
+    async def test_prefetch_defers_cells_over_run_budget(self, geocoder, backend):
+        geocoder._max_cells_per_run = 2
+        coords = [(10.0, 10.0), (20.0, 20.0), (30.0, 30.0)]
+
+        await geocoder.prefetch(coords[:1])
+        await geocoder.prefetch(coords)
+
+        assert len(backend.calls) == 2
+        assert "30.0,30.0" not in geocoder._names
+
+        geocoder.start_run()
+        await geocoder.prefetch(coords)
+
+        assert backend.calls[-1] == (30.0, 30.0)
+        assert len(backend.calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_prefetch_disabled_without_backend(self):
+        geocoder = ReverseGeocoder(None)
+
+        await geocoder.prefetch([(55.7558, 37.6173)])
+
+        assert geocoder.lookup_cached(55.7558, 37.6173) is None
+
+
+class TestOfflineBackend:
+    """Tests for OfflineBackend with GeoNames dataset"""
+
+    @pytest.fixture
+    def dataset(self, tmp_path):
+        rows = [
+            ["524901", "Moscow", "Moscow", "", "55.75222", "37.61556", "P", "PPLC", "RU"],
+            ["498817", "Saint Petersburg", "Saint Petersburg", "", "59.93863", "30.31413", "P", "PPLA", "RU"],
+            ["1850147", "Tokyo", "Tokyo", "", "35.6895", "139.69171", "P", "PPLC", "JP"],
+        ]
+        path = tmp_path / "cities.txt"
+        path.write_text("\n".join("\t".join(row) for row in rows), encoding="utf-8")
+        return str(path)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "lat,lon,expected",
+        [
+            (55.76, 37.62, "Moscow, RU"),
+            (59.9, 30.3, "Saint Petersburg, RU"),
+            (35.68, 139.65, "Tokyo, JP"),
+            (0.0, 0.0, None),
+        ],
+        ids=["moscow", "saint_petersburg", "tokyo", "too_far"],
+    )
+    async def test_reverse(self, dataset, lat, lon, expected):
+        backend = OfflineBackend(dataset)
+        assert await backend.reverse(lat, lon) == expected
+
+
+class TestMemoryCache:
+    """Tests for LRU bound of ReverseGeocoder memory cache"""
+
+    @pytest.mark.asyncio
+    async def test_least_recently_used_cell_evicted(self, backend, monkeypatch):
+        geocoder = ReverseGeocoder(backend, grid_precision=0, min_delay_seconds=0, max_memory_cells=2)
+        monkeypatch.setattr(geocoder, "_load_from_db", AsyncMock(return_value={}))
+        monkeypatch.setattr(geocoder, "_save_to_db", AsyncMock())
+
+        await geocoder.prefetch([(1.0, 1.0), (2.0, 2.0)])
+        geocoder.lookup_cached(1.0, 1.0)
+        await geocoder.prefetch([(3.0, 3.0)])
+
+        assert geocoder.is_cached(1.0, 1.0) is True
+        assert geocoder.is_cached(2.0, 2.0) is False
+        assert geocoder.is_cached(3.0, 3.0) is True
@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+import pytest
+from telegram.error import TimedOut
+
+from bot.telegram_requests import MeteredHTTPXRequest, TelegramRequests
+
+
+def metered(name="media", size=1, pool_timeout=1.0, delay=0.0):
+    async def handler(request):
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json={"ok": True, "result": True})
+
+    return MeteredHTTPXRequest(
+        name,
+        connection_pool_size=size,
+        pool_timeout=pool_timeout,
+        httpx_kwargs={"transport": httpx.MockTransport(handler)},
+    )
+
+
+class TestMeteredHTTPXRequest:
+    """Tests for pool wait accounting of Bot API requests"""
+
+    @pytest.mark.asyncio
+    async def test_wait_for_busy_pool_counted(self):
+        request = metered(size=1, delay=0.05)
+
+        await asyncio.gather(*(request.do_request("https://api.telegram.org/bot/sendVideo", "POST") for _ in range(3)))
+
+        stats = request.get_stats()
+        assert stats["requests"] == 3
+        assert stats["waited"] == 2
+        assert stats["max_wait_seconds"] >= 0.05
+        assert stats["in_flight"] == 0
+        await request.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_pool_timeout_raises_timed_out(self):
+        request = metered(size=1, pool_timeout=0.01, delay=0.2)
+
+        slow = asyncio.create_task(request.do_request("https://api.telegram.org/bot/sendVideo", "POST"))
+        await asyncio.sleep(0)
+        with pytest.raises(TimedOut):
+            await request.do_request("https://api.telegram.org/bot/getChat", "POST")
+
+        await slow
+        assert request.get_stats()["timeouts"] == 1
+        await request.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_media_pool_does_not_block_control(self):
+        pools = TelegramRequests(control=metered("control", size=1), media=metered("media", size=1, delay=0.2))
+
+        upload = asyncio.create_task(pools.media.do_request("https://api.telegram.org/bot/sendVideo", "POST"))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(pools.control.do_request("https://api.telegram.org/bot/getChat", "POST"), 0.1)
+
+        assert pools.stats()["control"]["waited"] == 0
+        await upload
+        for request in (pools.control, pools.media):
+            await request.shutdown()
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from bot.handlers.trace_handler import trace_handler
+from utils.tracing import (
+    JsonlSpanExporter,
+    OtlpHttpSpanExporter,
+    TraceContextFilter,
+    Tracer,
+    format_trace,
+    trace_id_for,
+)
+
+MEDIA_UUID = "5f0c2a4e-8d7b-4c1a-9e3f-2b6d8a1c4e70"
+
+
+class TestTracer:
+    """Tests for media item spans"""
+
+    def test_trace_id_is_media_uuid(self):
+        assert trace_id_for(MEDIA_UUID) == uuid.UUID(MEDIA_UUID).hex
+        # Не UUID — стабильный id из ключа
+        assert trace_id_for("not-a-uuid") == trace_id_for("not-a-uuid")
+        assert len(trace_id_for("not-a-uuid")) == 32
+
+    @pytest.mark.asyncio
+    async def test_span_tree_across_await(self):
+        tracer = Tracer()
+
+        async def download():
+            with tracer.span("download", bytes=10):
+                await asyncio.sleep(0)
+
+        with tracer.span("post_media", trace_key=MEDIA_UUID) as root:
+            await download()
+            with tracer.span("send_photo"):
+                pass
+
+        spans = await tracer.get_trace(MEDIA_UUID)
+        assert [s.name for s in spans] == ["post_media", "download", "send_photo"]
+        assert all(s.trace_id == root.trace_id for s in spans)
+        assert spans[1].parent_id == root.span_id and spans[2].parent_id == root.span_id
+        assert spans[1].attributes == {"bytes": 10}
+        assert all(s.duration is not None for s in spans)
+
+    @pytest.mark.asyncio
+    async def test_no_span_outside_trace(self):
+        tracer = Tracer()
+        with tracer.span("download") as span:
+            assert span is None
+        assert await tracer.get_trace(MEDIA_UUID) == []
+
+    @pytest.mark.asyncio
+    async def test_error_recorded(self):
+        tracer = Tracer()
+        with pytest.raises(RuntimeError):
+            with tracer.span("post_media", trace_key=MEDIA_UUID):
+                with tracer.span("ffmpeg"):
+                    raise RuntimeError("boom")
+
+        spans = await tracer.get_trace(MEDIA_UUID)
+        assert all(s.error == "RuntimeError: boom" for s in spans)
+        assert "ERROR RuntimeError: boom" in format_trace(spans)
+
+    @pytest.mark.asyncio
+    async def test_memory_keeps_latest_traces(self):
+        tracer = Tracer(max_traces=2)
+        keys = [str(uuid.uuid4()) for _ in range(3)]
+        for key in keys:
+            with tracer.span("post_media", trace_key=key):
+                pass
+
+        assert await tracer.get_trace(keys[0]) == []
+        assert len(await tracer.get_trace(keys[2])) == 1
+
+    @pytest.mark.asyncio
+    async def test_phases_of_one_media_share_trace(self):
+        tracer = Tracer()
+        with tracer.span("discover", trace_key=MEDIA_UUID):
+            pass
+        with tracer.span("post_media", trace_key=MEDIA_UUID):
+            with tracer.span("download"):
+                pass
+        with tracer.span("discussion_upload", trace_key=MEDIA_UUID):
+            pass
+
+        text = format_trace(await tracer.get_trace(MEDIA_UUID))
+        lines = text.splitlines()
+        assert [line.split()[0] for line in lines] == ["discover", "post_media", "download", "discussion_upload"]
+        assert lines[2].startswith("  download")
+
+    def test_log_records_carry_trace_ids(self):
+        tracer = Tracer()
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "msg", None, None)
+        with tracer.span("post_media", trace_key=MEDIA_UUID) as span:
+            TraceContextFilter().filter(record)
+
+        assert record.trace_id == span.trace_id
+        assert record.span_id == span.span_id
+
+
+class TestExporters:
+    """Tests for span exporters"""
+
+    @pytest.mark.asyncio
+    async def test_jsonl_export_and_load(self, tmp_path):
+        path = tmp_path / "traces" / "traces.jsonl"
+        exporter = JsonlSpanExporter(str(path), max_bytes=300)
+        tracer = Tracer(exporter)
+        for _ in range(3):
+            with tracer.span("post_media", trace_key=MEDIA_UUID):
+                pass
+        assert not path.exists()  # До flush спаны только в буфере
+        await tracer.flush()
+
+        # Файл переименован при превышении размера, трасса читается из обеих частей
+        assert (tmp_path / "traces" / "traces.jsonl.1").exists()
+        spans = await Tracer(exporter).get_trace(MEDIA_UUID)
+        assert len(spans) == 3
+        assert json.loads(path.read_text().splitlines()[-1])["name"] == "post_media"
+
+    @pytest.mark.asyncio
+    async def test_otlp_flush(self, monkeypatch):
+        requests = []
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return httpx.Response(200)
+
+        transport = httpx.MockTransport(handler)
+        original = httpx.AsyncClient
+        monkeypatch.setattr(httpx, "AsyncClient", lambda **kwargs: original(transport=transport, **kwargs))
+
+        exporter = OtlpHttpSpanExporter("http://collector:4318/")
+        tracer = Tracer(exporter)
+        with tracer.span("post_media", trace_key=MEDIA_UUID, media_id=7):
+            pass
+        await tracer.flush()
+
+        span = requests[0]["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert span["traceId"] == uuid.UUID(MEDIA_UUID).hex
+        assert span["attributes"] == [{"key": "media_id", "value": {"intValue": "7"}}]
+        # Буфер очищен
+        await tracer.flush()
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_otlp_keeps_spans_when_collector_down(self, monkeypatch):
+        transport = httpx.MockTransport(lambda request: httpx.Response(503))
+        original = httpx.AsyncClient
+        monkeypatch.setattr(httpx, "AsyncClient", lambda **kwargs: original(transport=transport, **kwargs))
+
+        exporter = OtlpHttpSpanExporter("http://collector:4318")
+        with Tracer(exporter).span("post_media", trace_key=MEDIA_UUID):
+            pass
+        await exporter.flush()
+
+        assert len(exporter._buffer) == 1
+
+
+class TestTraceHandler:
+    """Tests for /trace command"""
+
+    @staticmethod
+    def make_update(user_id):
+        return SimpleNamespace(
+            effective_user=SimpleNamespace(id=user_id, username="user"),
+            message=SimpleNamespace(reply_text=AsyncMock()),
+        )
+
+    @pytest.mark.asyncio
+    async def test_breakdown_for_admin(self, monkeypatch):
+        tracer = Tracer()
+        monkeypatch.setattr("bot.handlers.trace_handler.tracer", tracer)
+        monkeypatch.setattr("bot.handlers.trace_handler.is_user_allowed", lambda user: True)
+        with tracer.span("post_media", trace_key=MEDIA_UUID):
+            with tracer.span("download"):
+                pass
+
+        update = self.make_update(1)
+        await trace_handler(update, SimpleNamespace(args=[MEDIA_UUID]))
+
+        text = update.message.reply_text.call_args.args[0]
+        assert text.startswith("post_media") and "\n  download" in text
+
+    @pytest.mark.asyncio
+    async def test_denied_for_non_admin(self, monkeypatch):
+        monkeypatch.setattr("bot.handlers.trace_handler.is_user_allowed", lambda user: False)
+        update = self.make_update(2)
+        await trace_handler(update, SimpleNamespace(args=[MEDIA_UUID]))
+
+        assert "нет прав" in update.message.reply_text.call_args.args[0]
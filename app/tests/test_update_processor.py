@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import pytest
+from telegram import Update
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
+from telegram.request import BaseRequest
+
+from bot.handlers import discussion_forward_tracker_handler as tracker_module
+from bot.handlers.discussion_forward_tracker_handler import DiscussionForwardTracker, discussion_forward_handler
+from bot.update_processor import PerUserUpdateProcessor
+
+BOT_USER = {"id": 123, "is_bot": True, "first_name": "bot", "username": "test_bot"}
+
+
+class FakeRequest(BaseRequest):
+    """Bot API stand-in: answers getMe, nothing else is called in these tests"""
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        return 200, json.dumps({"ok": True, "result": BOT_USER}).encode()
+
+
+def command(update_id, user_id, text="/start"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+def automatic_forward(update_id, channel_id, channel_msg_id, group_id=-100):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": group_id, "type": "supergroup", "title": "discussion"},
+            "from": {"id": 777000, "is_bot": False, "first_name": "Telegram"},
+            "is_automatic_forward": True,
+            "forward_origin": {
+                "type": "channel",
+                "date": 0,
+                "chat": {"id": channel_id, "type": "channel", "title": "channel"},
+                "message_id": channel_msg_id,
+            },
+            "text": "post",
+        },
+    }
+
+
+@pytest.fixture
+def application():
+    return (
+        ApplicationBuilder()
+        .token("123:abc")
+        .request(FakeRequest())
+        .updater(None)
+        .concurrent_updates(PerUserUpdateProcessor(4))
+        .build()
+    )
+
+
+class TestPerUserUpdateProcessor:
+    """Tests for bounded concurrent update processing"""
+
+    @pytest.mark.asyncio
+    async def test_forward_handled_while_slow_handler_runs(self, application, monkeypatch):
+        tracker = DiscussionForwardTracker()
+        await tracker.track_channel(-1001)
+        monkeypatch.setattr(tracker_module, "forward_tracker", tracker)
+
+        async def no_attachments(*args):
+            pass
+
+        monkeypatch.setattr(tracker_module.discussion_attachments, "on_forward", no_attachments)
+
+        release = asyncio.Event()
+        started = asyncio.Event()
+
+        async def slow_start(update, context):
+            started.set()
+            await release.wait()  # Как get_user_album_info, ожидающий Immich
+
+        application.add_handler(CommandHandler("start", slow_start))
+        application.add_handler(MessageHandler(filters.IS_AUTOMATIC_FORWARD, discussion_forward_handler))
+
+        async with application:
+            await application.start()
+            await application.update_queue.put(Update.de_json(command(1, 10), application.bot))
+            await asyncio.wait_for(started.wait(), 1)
+            await application.update_queue.put(Update.de_json(automatic_forward(2, -1001, 55), application.bot))
+
+            assert await tracker.get(-1001, 55, timeout=1) == 2
+            assert not release.is_set()
+
+            release.set()
+            await application.stop()
+
+    @pytest.mark.asyncio
+    async def test_same_user_serialized_other_users_not(self):
+        processor = PerUserUpdateProcessor(4)
+        order = []
+        first_release = asyncio.Event()
+
+        async def handle(name, wait=None):
+            order.append(f"{name}:start")
+            if wait:
+                await wait.wait()
+            order.append(f"{name}:end")
+
+        updates = [Update.de_json(command(i, user), None) for i, user in ((1, 10), (2, 10), (3, 20))]
+        first = asyncio.create_task(processor.process_update(updates[0], handle("a1", first_release)))
+        second = asyncio.create_task(processor.process_update(updates[1], handle("a2")))
+        other = asyncio.create_task(processor.process_update(updates[2], handle("b")))
+        await asyncio.wait_for(other, 1)
+
+        assert order == ["a1:start", "b:start", "b:end"]
+        assert processor.current_concurrent_updates == 1  # Ожидающее обновление не занимает слот
+
+        first_release.set()
+        await asyncio.wait_for(asyncio.gather(first, second), 1)
+        assert order[3:] == ["a1:end", "a2:start", "a2:end"]
+        assert processor._locks == {}
+
+    def test_key_is_chat_and_user(self):
+        assert PerUserUpdateProcessor.update_key(Update.de_json(command(1, 10), None)) == (10, 10)
+        assert PerUserUpdateProcessor.update_key(object()) is None
@@ -0,0 +1,159 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from postgres.user_config import AlbumConfig, UserConfigCache, user_config_query
+from utils.kv_store import MemoryKeyValueStore
+
+
+def row(user_id=1, channel=-1001, host="http://immich:2283", api_key="key", album_id=None, album_uuid=None):
+    return SimpleNamespace(
+        user_id=user_id,
+        telegram_id=100,
+        telegram_channel_id=channel,
+        host_url=host,
+        api_key=api_key,
+        album_id=album_id,
+        album_uuid=album_uuid,
+    )
+
+
+class FakeSessionFactory:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+        self.release = None  # asyncio.Event — задержать запрос
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement):
+        self.queries += 1
+        if self.release is not None:
+            await self.release.wait()
+        return SimpleNamespace(all=lambda: list(self.rows))
+
+
+class TestUserConfigQuery:
+    def test_single_query_joins_only_albums(self):
+        sql = str(user_config_query(100).compile(dialect=postgresql.dialect()))
+
+        # Канал, хост и ключ — подзапросы с LIMIT 1: строк столько, сколько альбомов
+        assert sql.count("LEFT OUTER JOIN") == 1
+        assert sql.count("LIMIT") == 3
+        assert "api_keys.created_at DESC NULLS LAST" in sql
+
+
+class TestUserConfigCache:
+    """Tests for the user settings snapshot cache"""
+
+    @pytest.mark.asyncio
+    async def test_snapshot_collects_albums(self):
+        factory = FakeSessionFactory(
+            [row(album_id=1, album_uuid="a"), row(album_id=2, album_uuid="b"), row(api_key="old", album_id=1)]
+        )
+
+        config = await UserConfigCache(factory).get(100)
+
+        assert config.api_key == "key"
+        assert config.telegram_channel_id == -1001
+        assert config.albums == (AlbumConfig(1, "a"), AlbumConfig(2, "b"))
+
+    @pytest.mark.asyncio
+    async def test_not_configured_user(self):
+        factory = FakeSessionFactory([row(channel=None, host=None, api_key=None)])
+
+        config = await UserConfigCache(factory).get(100)
+
+        assert config.host_url is None
+        assert config.albums == ()
+
+    @pytest.mark.asyncio
+    async def test_cached_until_invalidated(self):
+        factory = FakeSessionFactory([row()])
+        cache = UserConfigCache(factory, ttl_seconds=300)
+
+        await cache.get(100)
+        await cache.get(100)
+        assert factory.queries == 1
+
+        factory.rows = [row(api_key="new")]
+        await cache.invalidate(100)
+
+        assert (await cache.get(100)).api_key == "new"
+        assert factory.queries == 2
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_reloaded(self):
+        factory = FakeSessionFactory([row()])
+        cache = UserConfigCache(factory, ttl_seconds=0)
+
+        await cache.get(100)
+        await cache.get(100)
+
+        assert factory.queries == 2
+
+    @pytest.mark.asyncio
+    async def test_unknown_user_not_cached(self):
+        factory = FakeSessionFactory([])
+        cache = UserConfigCache(factory)
+
+        assert await cache.get(100) is None
+        factory.rows = [row()]
+
+        assert (await cache.get(100)).user_id == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_query(self):
+        factory = FakeSessionFactory([row()])
+        factory.release = asyncio.Event()
+        cache = UserConfigCache(factory)
+
+        tasks = [asyncio.create_task(cache.get(100)) for _ in range(5)]
+        await asyncio.sleep(0)
+        factory.release.set()
+        configs = await asyncio.gather(*tasks)
+
+        assert factory.queries == 1
+        assert all(config is configs[0] for config in configs)
+
+    @pytest.mark.asyncio
+    async def test_invalidate_during_load_discards_snapshot(self):
+        factory = FakeSessionFactory([row()])
+        factory.release = asyncio.Event()
+        cache = UserConfigCache(factory)
+
+        task = asyncio.create_task(cache.get(100))
+        await asyncio.sleep(0)
+        await cache.invalidate(100)
+        factory.release.set()
+        await task
+
+        await cache.get(100)
+        assert factory.queries == 2
+
+    @pytest.mark.asyncio
+    async def test_invalidate_on_other_replica_reloads(self):
+        shared = MemoryKeyValueStore()
+        factory = FakeSessionFactory([row()])
+        replica = UserConfigCache(factory, version_store=shared)
+        other_replica = UserConfigCache(factory, version_store=shared)
+
+        await replica.get(100)
+        await replica.get(100)
+        assert factory.queries == 1
+
+        factory.rows = [row(api_key="new")]
+        await other_replica.invalidate(100)
+
+        assert (await replica.get(100)).api_key == "new"
+        await replica.get(100)
+        assert factory.queries == 2
@@ -0,0 +1,115 @@
+import pytest
+from starlette.testclient import TestClient
+from telegram.ext import ApplicationBuilder
+
+from bot.web_server import SECRET_HEADER, create_web_app
+from utils.config import WEBHOOK_PATH
+
+UPDATE = {
+    "update_id": 1,
+    "message": {"message_id": 2, "date": 0, "chat": {"id": 3, "type": "private"}, "text": "/start"},
+}
+
+
+@pytest.fixture
+def application():
+    return ApplicationBuilder().token("123:abc").updater(None).build()
+
+
+class TestWebServer:
+    """Tests for webhook, health and metrics endpoints"""
+
+    def test_webhook_queues_update(self, application):
+        client = TestClient(create_web_app(application, "secret"))
+
+        response = client.post(WEBHOOK_PATH, json=UPDATE, headers={SECRET_HEADER: "secret"})
+
+        assert response.status_code == 200
+        assert application.update_queue.get_nowait().update_id == 1
+
+    @pytest.mark.parametrize("headers", [{SECRET_HEADER: "wrong"}, {}], ids=["wrong_secret", "no_secret"])
+    def test_webhook_rejects_bad_secret(self, application, headers):
+        client = TestClient(create_web_app(application, "secret"))
+
+        response = client.post(WEBHOOK_PATH, json=UPDATE, headers=headers)
+
+        assert response.status_code == 403
+        assert application.update_queue.empty()
+
+    def test_webhook_rejects_malformed_body(self, application):
+        client = TestClient(create_web_app(application, "secret"))
+
+        response = client.post(WEBHOOK_PATH, content=b"not json", headers={SECRET_HEADER: "secret"})
+
+        assert response.status_code == 400
+
+    def test_no_webhook_route_in_polling_mode(self, application):
+        client = TestClient(create_web_app(application))
+
+        assert client.post(WEBHOOK_PATH, json=UPDATE).status_code == 404
+
+    def test_webhook_rejects_non_ascii_secret(self, application):
+        client = TestClient(create_web_app(application, "secret"))
+
+        response = client.post(WEBHOOK_PATH, json=UPDATE, headers={SECRET_HEADER: "секрет".encode()})
+
+        assert response.status_code == 403
+
+    def test_health_and_stats(self, application):
+        client = TestClient(create_web_app(application, stats_token="token"))
+
+        assert client.get("/health").status_code == 503  # Приложение еще не запущено
+        stats = client.get("/stats", headers={"Authorization": "Bearer token"}).json()
+        assert stats["immich_clients"] == 0
+        assert stats["update_queue"] == 0
+
+    @pytest.mark.parametrize("headers", [{"Authorization": "Bearer wrong"}, {}], ids=["wrong_token", "no_token"])
+    def test_stats_requires_token(self, application, headers):
+        client = TestClient(create_web_app(application, stats_token="token"))
+
+        assert client.get("/stats", headers=headers).status_code == 403
+
+    @pytest.mark.parametrize("client_host,status", [("127.0.0.1", 200), ("203.0.113.7", 403)])
+    def test_stats_without_token_only_from_loopback(self, application, client_host, status):
+        client = TestClient(create_web_app(application), client=(client_host, 50000))
+
+        assert client.get("/stats").status_code == status
+
+    def test_stats_hides_immich_hosts(self, application, monkeypatch):
+        from bot import web_server
+        from immich.host_guard import HostGuardRegistry
+        from utils.metrics import host_id
+
+        guards = HostGuardRegistry()
+        guards.get("https://photos.example.org")
+        monkeypatch.setattr(web_server, "host_guards", guards)
+        client = TestClient(create_web_app(application), client=("127.0.0.1", 50000))
+
+        stats = client.get("/stats").json()
+
+        assert list(stats["immich_hosts"]) == [host_id("https://photos.example.org")]
+
+    def test_metrics_in_prometheus_format(self, application):
+        client = TestClient(create_web_app(application))
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "immich_cached_clients 0.0" in response.text
+        assert "media_stage_duration_seconds" in response.text
+
+    def test_metrics_label_hosts_by_hash(self, application, monkeypatch):
+        from bot import web_server
+        from immich.host_guard import HostGuardRegistry
+        from utils.metrics import host_id
+
+        guards = HostGuardRegistry()
+        guards.get("https://photos.example.org")
+        monkeypatch.setattr(web_server, "host_guards", guards)
+        client = TestClient(create_web_app(application))
+
+        response = client.get("/metrics")
+
+        assert "photos.example.org" not in response.text
+        assert f'immich_host_circuit_open{{host_id="{host_id("https://photos.example.org")}"}} 0.0' in response.text
@@ -17,10 +17,105 @@ else:
     BASE_URL = None
 
 POST_MEDIA_INTERVAL = int(os.getenv("POST_MEDIA_INTERVAL", 3600))
+# Сколько пользователей задача медиа обрабатывает параллельно (размер пула БД см. postgres/database.py)
+MEDIA_JOB_CONCURRENCY = int(os.getenv("MEDIA_JOB_CONCURRENCY", 4))
+# Бюджеты постинга за один запуск задачи и на одного пользователя (0 — без ограничения).
+# Остаток очереди отправляется следующими запусками, чтобы не заваливать канал
+POST_RUN_MAX_ITEMS = int(os.getenv("POST_RUN_MAX_ITEMS", 0))
+POST_RUN_MAX_BYTES = int(os.getenv("POST_RUN_MAX_BYTES", 0))
+POST_RUN_MAX_SECONDS = float(os.getenv("POST_RUN_MAX_SECONDS", 0))
+POST_USER_MAX_ITEMS = int(os.getenv("POST_USER_MAX_ITEMS", 0))
+POST_USER_MAX_BYTES = int(os.getenv("POST_USER_MAX_BYTES", 0))
+POST_USER_MAX_SECONDS = float(os.getenv("POST_USER_MAX_SECONDS", 0))
+# Размер порции при чтении очереди на постинг (каждая порция — отдельный короткий запрос)
+POST_STREAM_CHUNK = int(os.getenv("POST_STREAM_CHUNK", 100))
+# Результаты постинга пишутся в БД пачками раз в N штук или T секунд, до записи хранятся в журнале на диске.
+# При CACHE_BACKEND=redis (несколько реплик) каждый результат пишется сразу — другие реплики видят только БД
+POST_RESULTS_JOURNAL = os.getenv("POST_RESULTS_JOURNAL", "data/posting_results.journal")
+POST_RESULTS_FLUSH_ITEMS = int(os.getenv("POST_RESULTS_FLUSH_ITEMS", 50))
+POST_RESULTS_FLUSH_SECONDS = float(os.getenv("POST_RESULTS_FLUSH_SECONDS", 10))
+# Через сколько месяцев обработанные партиции media_files сжимаются в posted_assets
+MEDIA_PARTITION_RETENTION_MONTHS = int(os.getenv("MEDIA_PARTITION_RETENTION_MONTHS", 3))
+# Сколько обслуживание партиций ждет блокировку media_files (мс), по истечении — повтор в следующий запуск
+MEDIA_PARTITION_LOCK_TIMEOUT_MS = int(os.getenv("MEDIA_PARTITION_LOCK_TIMEOUT_MS", 5000))
+# Хранилище трекера пересылок и кэшей: memory (одна реплика) / redis (несколько реплик)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Время жизни кэша метаданных канала (обсуждение, название, права бота) в секундах
+CHANNEL_INFO_CACHE_TTL = int(os.getenv("CHANNEL_INFO_CACHE_TTL", 3600))
+# Время жизни кэша настроек пользователя (хост, API ключ, канал, альбомы) в секундах
+USER_CONFIG_CACHE_TTL = int(os.getenv("USER_CONFIG_CACHE_TTL", 300))
+# Пул соединений на один хост Immich (общий для всех его пользователей)
+IMMICH_POOL_MAX_CONNECTIONS = int(os.getenv("IMMICH_POOL_MAX_CONNECTIONS", 20))
+IMMICH_POOL_MAX_KEEPALIVE = int(os.getenv("IMMICH_POOL_MAX_KEEPALIVE", 10))
+# HTTP/2 к Immich: нужен пакет h2 (uv sync --extra http2)
+IMMICH_HTTP2 = os.getenv("IMMICH_HTTP2", "false").lower() in ("1", "true", "yes")
+# Circuit breaker хоста Immich: открывается, когда доля ошибок/медленных запросов достигает порога,
+# время открытия удваивается при неудачной пробе до максимума
+IMMICH_BREAKER_FAILURE_RATE = float(os.getenv("IMMICH_BREAKER_FAILURE_RATE", 0.5))
+IMMICH_BREAKER_MIN_CALLS = int(os.getenv("IMMICH_BREAKER_MIN_CALLS", 5))
+IMMICH_BREAKER_OPEN_SECONDS = float(os.getenv("IMMICH_BREAKER_OPEN_SECONDS", 30))
+IMMICH_BREAKER_MAX_OPEN_SECONDS = float(os.getenv("IMMICH_BREAKER_MAX_OPEN_SECONDS", 600))
+# Запрос дольше — сигнал перегрузки хоста (breaker и AIMD лимит параллельных запросов)
+IMMICH_SLOW_CALL_SECONDS = float(os.getenv("IMMICH_SLOW_CALL_SECONDS", 30))
+IMMICH_HOST_MAX_CONCURRENCY = int(os.getenv("IMMICH_HOST_MAX_CONCURRENCY", 10))
+# Кэш проверки соединения с Immich по (хост, ключ): сколько доверять успеху и пауза после неудачи
+# (удваивается при каждой неудаче подряд до максимума), в секундах
+IMMICH_PROBE_OK_TTL = float(os.getenv("IMMICH_PROBE_OK_TTL", 600))
+IMMICH_PROBE_FAIL_BACKOFF = float(os.getenv("IMMICH_PROBE_FAIL_BACKOFF", 30))
+IMMICH_PROBE_MAX_FAIL_BACKOFF = float(os.getenv("IMMICH_PROBE_MAX_FAIL_BACKOFF", 900))
+# Сколько обновлений Telegram обрабатывается одновременно (обновления одного пользователя в чате — по очереди)
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", 16))
+# Интервал повторной синхронизации команд бота (в секундах), без изменений набора команд — без запросов
+COMMAND_SYNC_INTERVAL = int(os.getenv("COMMAND_SYNC_INTERVAL", 3600))
+# Пулы соединений к Bot API: управляющие вызовы (get_chat, ответы, команды) и загрузка медиа отдельно,
+# чтобы долгие загрузки не занимали все соединения. Таймауты в секундах
+TELEGRAM_CONTROL_POOL_SIZE = int(os.getenv("TELEGRAM_CONTROL_POOL_SIZE", 8))
+TELEGRAM_CONTROL_TIMEOUT = float(os.getenv("TELEGRAM_CONTROL_TIMEOUT", 10))
+TELEGRAM_MEDIA_POOL_SIZE = int(os.getenv("TELEGRAM_MEDIA_POOL_SIZE", 8))
+TELEGRAM_MEDIA_TIMEOUT = float(os.getenv("TELEGRAM_MEDIA_TIMEOUT", 300))
+# Кэш исходных байтов медиа до загрузки в обсуждение: общий размер и максимум одного файла (крупные скачиваются заново)
+DISCUSSION_PAYLOAD_CACHE_BYTES = int(os.getenv("DISCUSSION_PAYLOAD_CACHE_BYTES", 8 * 1024 * 1024))
+DISCUSSION_PAYLOAD_MAX_BYTES = int(os.getenv("DISCUSSION_PAYLOAD_MAX_BYTES", 2 * 1024 * 1024))
+# Получение обновлений Telegram: polling / webhook (на BASE_URL + WEBHOOK_PATH, BASE_URL должен быть https)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+# Встроенный HTTP сервер: webhook, /health и /metrics
+WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT", 8000))
+# Токен для /stats (Authorization: Bearer <токен>), не задан — /stats отвечает только на запросы с localhost
+STATS_TOKEN = os.getenv("STATS_TOKEN")
+# Трассировка медиа по этапам публикации: jsonl (локальный файл) / otlp (коллектор OTLP/HTTP) / none
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "jsonl").lower()
+TRACING_JSONL_PATH = os.getenv("TRACING_JSONL_PATH", "data/traces.jsonl")
+# Размер файла трасс, после которого он переименовывается в <путь>.1 (в байтах)
+TRACING_JSONL_MAX_BYTES = int(os.getenv("TRACING_JSONL_MAX_BYTES", 50 * 1024 * 1024))
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "http://localhost:4318")
+# Сколько последних трасс хранится в памяти для команды /trace
+TRACING_MEMORY_TRACES = int(os.getenv("TRACING_MEMORY_TRACES", 1000))
 
 # Проверяем, что переменные загружены
 if not all([TELEGRAM_TOKEN, BASE_URL, LOG_LEVEL]):
     raise ValueError("Не удалось загрузить переменные из .env файла")
 
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET_TOKEN:
+    raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_SECRET_TOKEN")
+
 ADMIN_IDS: list[int] = [int(i) for i in os.getenv("ADMIN_IDS", "").split(",")]
 ADMIN_USERNAMES: list[str] = os.getenv("ADMIN_USERNAMES", "").split(",")
+
+# Обратное геокодирование координат в название места: nominatim / offline / none
+GEOCODER_BACKEND = os.getenv("GEOCODER_BACKEND", "none").lower()
+# Путь к дампу GeoNames (cities500.txt и т.п.) для GEOCODER_BACKEND=offline
+GEOCODER_DATASET_PATH = os.getenv("GEOCODER_DATASET_PATH")
+# Количество знаков после запятой при округлении координат до ячейки кэша (2 знака ~ 1 км)
+GEOCODER_GRID_PRECISION = int(os.getenv("GEOCODER_GRID_PRECISION", 2))
+# Минимальный интервал между сетевыми запросами геокодера (в секундах)
+GEOCODER_MIN_DELAY = float(os.getenv("GEOCODER_MIN_DELAY", 1.0))
+# Максимум новых ячеек, геокодируемых за один запуск задачи (0 — без ограничения), остальные — в следующий запуск
+GEOCODER_MAX_CELLS_PER_RUN = int(os.getenv("GEOCODER_MAX_CELLS_PER_RUN", 300))
+# Максимум ячеек в памяти геокодера (вытесняются давно не использованные, они остаются в geo_cache)
+GEOCODER_MEMORY_CELLS = int(os.getenv("GEOCODER_MEMORY_CELLS", 10000))
+GEOCODER_USER_AGENT = os.getenv("GEOCODER_USER_AGENT", "immich_to_tg")
@@ -0,0 +1,119 @@
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from redis import asyncio as aioredis
+
+from utils.config import CACHE_BACKEND
+from utils.redis_client import get_redis
+
+
+class MemoryKeyValueStore:
+    """
+    In-process key-value store with per-key TTL (default backend, single replica)
+
+    Expired keys are dropped when read and swept by `set` at most once per `purge_interval_seconds`,
+    so keys which are never read again do not stay in memory.
+    """
+
+    def __init__(self, purge_interval_seconds: float = 60):
+        self._data: Dict[str, Tuple[Any, float]] = {}
+        self._purge_interval = purge_interval_seconds
+        self._next_purge = time.monotonic() + purge_interval_seconds
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Get value by key
+
+        :param key: key
+        :return: value or None if missing or expired
+        """
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        """
+        Set value with TTL
+
+        :param key: key
+        :param value: JSON-serializable value
+        :param ttl_seconds: time to live in seconds
+        :return: None
+        """
+        now = time.monotonic()
+        if now >= self._next_purge:
+            self._purge_expired(now)
+        self._data[key] = (value, now + ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        """
+        Delete key
+
+        :param key: key
+        :return: None
+        """
+        self._data.pop(key, None)
+
+    def _purge_expired(self, now: float) -> None:
+        # Полный проход раз в интервал — амортизированно O(1) на запись
+        self._data = {key: item for key, item in self._data.items() if item[1] > now}
+        self._next_purge = now + self._purge_interval
+
+
+class RedisKeyValueStore:
+    """Key-value store in Redis shared between replicas, values are stored as JSON"""
+
+    def __init__(self, redis: aioredis.Redis, namespace: str):
+        self._redis = redis
+        self._namespace = namespace
+
+    def _key(self, key: str) -> str:
+        return f"{self._namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Get value by key
+
+        :param key: key
+        :return: value or None if missing or expired
+        """
+        raw = await self._redis.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        """
+        Set value with TTL
+
+        :param key: key
+        :param value: JSON-serializable value
+        :param ttl_seconds: time to live in seconds
+        :return: None
+        """
+        await self._redis.set(self._key(key), json.dumps(value), px=max(int(ttl_seconds * 1000), 1))
+
+    async def delete(self, key: str) -> None:
+        """
+        Delete key
+
+        :param key: key
+        :return: None
+        """
+        await self._redis.delete(self._key(key))
+
+
+def create_kv_store(namespace: str) -> MemoryKeyValueStore | RedisKeyValueStore:
+    """
+    Build key-value store for configured CACHE_BACKEND (memory / redis)
+
+    :param namespace: key prefix for shared backends
+    :return: key-value store
+    """
+    if CACHE_BACKEND == "redis":
+        return RedisKeyValueStore(get_redis(), namespace)
+    return MemoryKeyValueStore()
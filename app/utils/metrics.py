@@ -0,0 +1,114 @@
+import hashlib
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, ProcessCollector, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Свой реестр, а не глобальный REGISTRY prometheus_client: в тестах модули импортируются многократно
+registry = CollectorRegistry()
+ProcessCollector(registry=registry)
+
+# Секунды: от быстрых запросов до загрузок видео на 300 секунд
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+MEDIA_JOB_RUNS = Counter("media_job_runs_total", "Media job runs", ["result"], registry=registry)
+MEDIA_JOB_DURATION = Histogram(
+    "media_job_duration_seconds",
+    "Duration of a media job run",
+    buckets=(1, 10, 30, 60, 300, 600, 1800, 3600, 7200),
+    registry=registry,
+)
+MEDIA_ITEMS_FETCHED = Counter("media_items_fetched_total", "New media found in Immich albums", registry=registry)
+MEDIA_ITEMS_POSTED = Counter("media_items_posted_total", "Media posting attempts", ["result"], registry=registry)
+MEDIA_BACKLOG = Gauge("media_backlog_items", "Unposted media after the last run", registry=registry)
+MEDIA_STAGE_DURATION = Histogram(
+    "media_stage_duration_seconds",
+    "Duration of a media pipeline stage (immich_fetch, download, heic_convert, ffmpeg, upload)",
+    ["stage"],
+    buckets=DURATION_BUCKETS,
+    registry=registry,
+)
+MEDIA_BYTES = Counter("media_bytes_total", "Media bytes transferred", ["direction"], registry=registry)
+
+IMMICH_REQUEST_DURATION = Histogram(
+    "immich_request_duration_seconds",
+    "Immich API requests by method and outcome (2xx/4xx/5xx/error/circuit_open)",
+    ["method", "outcome"],
+    buckets=DURATION_BUCKETS,
+    registry=registry,
+)
+IMMICH_CLIENTS = Gauge("immich_cached_clients", "Immich clients in ImmichService cache", registry=registry)
+# Адреса Immich — данные пользователей, в метках только их хэш (см. host_id)
+IMMICH_HOST_OPEN = Gauge(
+    "immich_host_circuit_open", "1 if host circuit breaker is not closed", ["host_id"], registry=registry
+)
+IMMICH_HOST_LIMIT = Gauge(
+    "immich_host_concurrency_limit", "AIMD concurrency limit of host", ["host_id"], registry=registry
+)
+
+TELEGRAM_POOL_WAIT = Histogram(
+    "telegram_pool_wait_seconds",
+    "Wait for a free Bot API connection",
+    ["pool"],
+    buckets=DURATION_BUCKETS,
+    registry=registry,
+)
+TELEGRAM_POOL_TIMEOUTS = Counter(
+    "telegram_pool_timeouts_total", "Bot API requests not sent: pool stayed busy", ["pool"], registry=registry
+)
+
+FORWARD_TRACKER_LOOKUPS = Counter(
+    "forward_tracker_lookups_total", "Discussion forward lookups by result (hit/timeout)", ["result"], registry=registry
+)
+FORWARD_TRACKER_ENTRIES = Gauge("forward_tracker_entries", "Unread forward mappings", registry=registry)
+FORWARD_TRACKER_WAITERS = Gauge("forward_tracker_waiters", "Lookups waiting for a forward", registry=registry)
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Postgres statement duration", buckets=DURATION_BUCKETS, registry=registry
+)
+UPDATE_QUEUE_SIZE = Gauge("telegram_update_queue_size", "Updates waiting for processing", registry=registry)
+
+
+def host_id(host: str) -> str:
+    """
+    Stable id of Immich host for metric labels and /stats (host URL itself is not exposed)
+
+    :param host: host URL
+    :return: first 12 hex digits of SHA-256 of the URL
+    """
+    return hashlib.sha256(host.encode()).hexdigest()[:12]
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Measure duration of every statement of engine (for async engine pass `async_engine.sync_engine`)
+
+    :param engine: sqlalchemy engine
+    :return: None
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_DURATION.observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # after_cursor_execute не вызывается при ошибке — снимаем отметку, чтобы стек не рос
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def render() -> bytes:
+    """
+    Metrics in Prometheus text format
+
+    :return: response body
+    """
+    return generate_latest(registry)
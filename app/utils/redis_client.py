@@ -0,0 +1,19 @@
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+from utils.config import REDIS_URL
+
+_redis: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Returns a shared Redis client (connection pool is created lazily on first command)
+
+    :return: Redis client
+    """
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _redis
@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from utils.config import (
+    OTLP_ENDPOINT,
+    TRACING_EXPORTER,
+    TRACING_JSONL_MAX_BYTES,
+    TRACING_JSONL_PATH,
+    TRACING_MEMORY_TRACES,
+)
+from utils.logger import logger
+
+
+@dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    start: float  # Unix time, секунды
+    duration: Optional[float] = None
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def trace_id_for(key: str) -> str:
+    """
+    Trace id of media item: its Immich UUID (32 hex, valid OTLP trace id), so all phases and runs of one asset
+    end up in one trace
+
+    :param key: media uuid or other stable key
+    :return: 32 hex chars
+    """
+    try:
+        return uuid.UUID(key).hex
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_URL, key).hex
+
+
+def current_span() -> Optional[Span]:
+    """
+    Span of the current task
+
+    :return: span or None
+    """
+    return _current_span.get()
+
+
+class TraceContextFilter(logging.Filter):
+    """Adds trace_id and span_id of the current span to log records (JSON formatter prints them as fields)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = _current_span.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+class JsonlSpanExporter:
+    """
+    Finished spans as JSON lines in a local file (rotated to `<path>.1` at `max_bytes`)
+
+    Spans are buffered and written by `flush` in a worker thread, so the event loop never touches the file.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, max_buffer: int = 10000):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._max_buffer = max_buffer
+        self._buffer: List[Span] = []
+        self._write_lock = asyncio.Lock()
+
+    def export(self, span: Span) -> None:
+        if len(self._buffer) >= self._max_buffer:
+            self._buffer.pop(0)  # Запись не успевает — теряем самые старые
+        self._buffer.append(span)
+
+    def load(self, trace_id: str) -> List[Span]:
+        """
+        Spans of trace from the file and its rotated copy
+
+        :param trace_id: trace id
+        :return: spans
+        """
+        spans = []
+        for path in (f"{self._path}.1", self._path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if trace_id not in line:
+                        continue
+                    try:
+                        spans.append(Span(**json.loads(line)))
+                    except (ValueError, TypeError):
+                        continue  # Недописанная строка
+        return spans
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        # Блокировка сохраняет порядок строк при одновременном flush из задачи и при остановке
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self._write, spans)
+            except OSError as e:
+                logger.warning(f"Failed to export {len(spans)} spans to {self._path}: {str(e)}")
+
+    def _write(self, spans: List[Span]) -> None:
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        f = open(self._path, "a", encoding="utf-8")
+        try:
+            for span in spans:
+                if f.tell() >= self._max_bytes:
+                    f.close()
+                    os.replace(self._path, f"{self._path}.1")
+                    f = open(self._path, "a", encoding="utf-8")
+                f.write(json.dumps(asdict(span), ensure_ascii=False, default=str) + "\n")
+        finally:
+            f.close()
+
+
+class OtlpHttpSpanExporter:
+    """
+    Batches finished spans and sends them to an OTLP/HTTP collector (`POST {endpoint}/v1/traces`, JSON encoding)
+    """
+
+    def __init__(self, endpoint: str, service_name: str = "immich_to_tg", max_buffer: int = 10000):
+        self._url = f"{endpoint.rstrip('/')}/v1/traces"
+        self._service_name = service_name
+        self._max_buffer = max_buffer
+        self._buffer: List[Span] = []
+
+    def export(self, span: Span) -> None:
+        if len(self._buffer) >= self._max_buffer:
+            self._buffer.pop(0)  # Коллектор недоступен — теряем самые старые
+        self._buffer.append(span)
+
+    def load(self, trace_id: str) -> List[Span]:
+        return []
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                response = await client.post(self._url, json=self.payload(spans))
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to export {len(spans)} spans to {self._url}: {str(e)}")
+            self._buffer = spans[-self._max_buffer :] + self._buffer
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        """
+        OTLP/JSON ExportTraceServiceRequest
+
+        :param spans: finished spans
+        :return: request body
+        """
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_otlp_attribute("service.name", self._service_name)]},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "immich_to_tg"},
+                            "spans": [
+                                {
+                                    "traceId": span.trace_id,
+                                    "spanId": span.span_id,
+                                    "parentSpanId": span.parent_id or "",
+                                    "name": span.name,
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(int(span.start * 1e9)),
+                                    "endTimeUnixNano": str(int((span.start + (span.duration or 0)) * 1e9)),
+                                    "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+                                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                                }
+                                for span in spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """
+    Lightweight span trees per media item
+
+    `span(name, trace_key=media_uuid)` starts a root span of the item's trace, nested `span(name)` calls become
+    its children through a context variable (also across `await`). Outside of a trace `span` does nothing, so
+    shared helpers can be instrumented freely. The latest `max_traces` traces are kept in memory for `/trace`.
+    """
+
+    def __init__(self, exporter=None, max_traces: int = 1000):
+        self._exporter = exporter
+        self._max_traces = max_traces
+        self._traces: OrderedDict[str, List[Span]] = OrderedDict()
+
+    @contextmanager
+    def span(self, name: str, trace_key: Optional[str] = None, **attributes) -> Iterator[Optional[Span]]:
+        """
+        Measure a block as a span
+
+        :param name: span name
+        :param trace_key: start a new root span in the trace of this key (media uuid)
+        :param attributes: span attributes
+        :return: context manager yielding the span (None outside of a trace)
+        """
+        parent = _current_span.get()
+        if trace_key is not None:
+            trace_id, parent_id = trace_id_for(trace_key), None
+        elif parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            yield None
+            return
+
+        span = Span(trace_id, secrets.token_hex(8), parent_id, name, time.time(), attributes=attributes)
+        started = time.perf_counter()
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self._finish(span)
+
+    async def get_trace(self, key: str) -> List[Span]:
+        """
+        Spans of media item trace (memory first, then exporter storage read in a worker thread)
+
+        :param key: media uuid
+        :return: spans ordered by start
+        """
+        trace_id = trace_id_for(key)
+        spans = self._traces.get(trace_id)
+        if not spans and self._exporter is not None:
+            spans = await asyncio.to_thread(self._exporter.load, trace_id)
+        return sorted(spans or [], key=lambda s: s.start)
+
+    async def flush(self) -> None:
+        """
+        Write or send buffered spans (called periodically by a bot job and on shutdown)
+
+        :return: None
+        """
+        if self._exporter is not None:
+            await self._exporter.flush()
+
+    def _finish(self, span: Span) -> None:
+        spans = self._traces.get(span.trace_id)
+        if spans is None:
+            spans = self._traces[span.trace_id] = []
+            while len(self._traces) > self._max_traces:
+                self._traces.popitem(last=False)
+        else:
+            self._traces.move_to_end(span.trace_id)
+        spans.append(span)
+        if self._exporter is not None:
+            self._exporter.export(span)
+
+
+def format_trace(spans: List[Span]) -> str:
+    """
+    Text breakdown of trace: span tree with durations and offsets from the start of each root
+
+    :param spans: spans ordered by start
+    :return: text
+    """
+    children: Dict[Optional[str], List[Span]] = {}
+    ids = {span.span_id for span in spans}
+    for span in spans:
+        # Родитель мог не попасть в выборку — показываем такой span как корень
+        children.setdefault(span.parent_id if span.parent_id in ids else None, []).append(span)
+
+    lines = []
+
+    def walk(span: Span, depth: int, root_start: float) -> None:
+        duration = f"{span.duration * 1000:.0f}ms" if span.duration is not None else "?"
+        offset = (
+            f"+{(span.start - root_start) * 1000:.0f}ms"
+            if depth
+            else time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(span.start))
+        )
+        attributes = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+        error = f" ERROR {span.error}" if span.error else ""
+        lines.append(f"{'  ' * depth}{span.name} {duration} ({offset}) {attributes}{error}".rstrip())
+        for child in children.get(span.span_id, []):
+            walk(child, depth + 1, root_start)
+
+    for root in children.get(None, []):
+        walk(root, 0, root.start)
+    return "\n".join(lines)
+
+
+def create_tracer() -> Tracer:
+    """
+    Tracer with exporter chosen by TRACING_EXPORTER: jsonl / otlp / none
+
+    :return: tracer
+    """
+    exporter = None
+    if TRACING_EXPORTER == "jsonl":
+        exporter = JsonlSpanExporter(TRACING_JSONL_PATH, TRACING_JSONL_MAX_BYTES)
+    elif TRACING_EXPORTER == "otlp":
+        exporter = OtlpHttpSpanExporter(OTLP_ENDPOINT)
+    return Tracer(exporter, max_traces=TRACING_MEMORY_TRACES)
+
+
+# trace_id/span_id в каждой записи лога, сделанной внутри span
+logger.addFilter(TraceContextFilter())
+
+# Глобальный экземпляр
+tracer = create_tracer()